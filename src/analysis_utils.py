@@ -2,15 +2,20 @@
 This file contains functions used for the analysis of the alignments performed for the benchmark.
 """
 
+import itertools
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import scipy.stats as stats
-import statsmodels.api as sm
-from statsmodels.formula.api import ols
 from pathlib import Path
 
+# matplotlib, seaborn, scipy and statsmodels are imported in the functions, which use them,
+# so the module is imported fast, e.g. in worker processes and in the unix terminal
+
+# quality measures compared by the agreement of the methods, lower values are better
+AGREEMENT_METRICS = ["rmsd", "SI", "MI", "SAS"]
+
+# metrics of the results, for which higher values are better
+HIGHER_IS_BETTER = ["coverage"]
+
 
 def general_checks(all_methods_df):
     """
@@ -75,12 +80,15 @@ def create_scatter_plot(all_methods_df, path=None):
         When a path is provided the figure will be saved in this path, otherwise the figure is not saved.
     """
 
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots()
     colors = {
         "mmligner": "orange",
         "theseus": "blue",
         "mda": "green",
         "pymol": "red",
+        "pymol_refined": "brown",
         "matchmaker": "purple",
     }
     grouped = all_methods_df.groupby("method")
@@ -124,10 +132,13 @@ def create_violine_plot(all_methods_df, path=None):
         When a path is provided the figure will be saved in this path, otherwise the figure is not saved.
     """
 
-    rmsds = all_methods_df.groupby("method")["rmsd"].apply(list).values
-    data_to_plot = [rmsds[0], rmsds[1], rmsds[2], rmsds[3], rmsds[4]]
-    positions = (1, 2, 3, 4, 5)
-    values = ["matchmaker", "mda", "mmligner", "pymol", "theseus"]
+    import matplotlib.pyplot as plt
+
+    # the methods are sorted alphabetically by groupby
+    rmsds = all_methods_df.groupby("method")["rmsd"].apply(list)
+    data_to_plot = list(rmsds.values)
+    positions = range(1, len(rmsds) + 1)
+    values = list(rmsds.index)
     plt.violinplot(data_to_plot)
     plt.ylabel("RMSD")
     plt.xlabel("Methods")
@@ -162,7 +173,10 @@ def compute_correlation(all_methods_df, coeff="pearson", path=None):
         When a path is provided the figure will be saved in this path, otherwise the figure is not saved.
     """
 
-    df = all_methods_df.corr(method=coeff)
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    df = all_methods_df.corr(method=coeff, numeric_only=True)
     f, ax = plt.subplots(figsize=(9, 9))
     sns.heatmap(df, annot=True, linewidths=0.5, fmt=".3f", ax=ax)
     plt.xticks(rotation=90)
@@ -176,6 +190,163 @@ def compute_correlation(all_methods_df, coeff="pearson", path=None):
     return df
 
 
+def pivot_pairs(all_methods_df, metrics=AGREEMENT_METRICS):
+    """
+    Pivots the results to one row for every pair and one column for every metric and method.
+
+    Parameters
+    ----------
+    all_methods_df : Pandas.DataFrame
+
+    metrics: list, Optional
+        The metrics. Default are the columns in ``AGREEMENT_METRICS``.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        The values with the index (reference_id, mobile_id) and the columns (metric, method),
+        NaN if a method has no result for a pair. Repeated alignments are replaced by the last alignment.
+    """
+
+    # the rows are placed by integer codes of the pairs and the methods instead of pandas.DataFrame.unstack
+    reference_codes, reference_ids = pd.factorize(all_methods_df["reference_id"])
+    mobile_codes, mobile_ids = pd.factorize(all_methods_df["mobile_id"])
+    pair_codes, pairs = pd.factorize(reference_codes.astype(np.int64) * max(len(mobile_ids), 1) + mobile_codes)
+    method_codes, methods = pd.factorize(all_methods_df["method"], sort=True)
+    cells = pair_codes.astype(np.int64) * len(methods) + method_codes
+    # the last alignment of every cell, found as the first one in the reversed order
+    _, last = np.unique(cells[::-1], return_index=True)
+    rows = len(cells) - 1 - last
+    values = np.full((len(pairs) * len(methods), len(metrics)), np.nan)
+    values[cells[rows]] = all_methods_df[list(metrics)].to_numpy(dtype=float)[rows]
+    index = pd.MultiIndex.from_arrays(
+        [reference_ids[pairs // max(len(mobile_ids), 1)], mobile_ids[pairs % max(len(mobile_ids), 1)]],
+        names=["reference_id", "mobile_id"],
+    )
+    columns = pd.MultiIndex.from_product([list(metrics), methods], names=[None, "method"])
+    values = values.reshape(len(pairs), len(methods), len(metrics)).transpose(0, 2, 1).reshape(len(pairs), -1)
+    return pd.DataFrame(values, index=index, columns=columns)
+
+
+def compute_method_agreement(all_methods_df, metric="SI", threshold=1.0):
+    """
+    Computes the agreement of every two methods over all pairs, which both methods aligned.
+    In contrast to ``compute_correlation``, the values of the methods are compared pair by pair.
+
+    Parameters
+    ----------
+    all_methods_df : Pandas.DataFrame
+
+    metric: str, Optional
+        The metric. Default is "SI".
+
+    threshold: float, Optional
+        The methods disagree on a pair, if the absolute difference of their values is above the threshold. Default is 1.0.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        Contains one row for every two methods with the number of common pairs ("pairs"), the rank correlations
+        ("spearman", "kendall") and the fraction of the pairs, where the methods disagree ("disagreement").
+    """
+
+    import scipy.stats as stats
+
+    table = pivot_pairs(all_methods_df, [metric])[metric]
+    values = table.to_numpy()
+    finite = ~np.isnan(values)
+    # every column is sorted once, the ranks of the pairs aligned by two methods are derived from the sorted columns
+    orders = np.argsort(values, axis=0)
+    complete = finite.all(axis=1)
+    # the Spearman correlations of the pairs aligned by all methods, as one correlation matrix of the ranks
+    ranks = np.stack([_subset_ranks(values[:, i], orders[:, i], complete) for i in range(values.shape[1])], axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        spearman_complete = np.corrcoef(ranks, rowvar=False) if complete.sum() > 1 else None
+    rows = []
+    for i, j in itertools.combinations(range(len(table.columns)), 2):
+        common = finite[:, i] & finite[:, j]
+        first, second = values[common, i], values[common, j]
+        if len(first) > 1:
+            if spearman_complete is not None and len(first) == complete.sum():
+                spearman = spearman_complete[i, j]
+            else:
+                spearman = np.corrcoef(
+                    _subset_ranks(values[:, i], orders[:, i], common), _subset_ranks(values[:, j], orders[:, j], common)
+                )[0, 1]
+            kendall = stats.kendalltau(first, second)[0]
+        else:
+            spearman, kendall = np.nan, np.nan
+        disagreement = np.mean(np.abs(first - second) > threshold) if len(first) else np.nan
+        rows.append([table.columns[i], table.columns[j], len(first), spearman, kendall, disagreement])
+    return pd.DataFrame(rows, columns=["method1", "method2", "pairs", "spearman", "kendall", "disagreement"])
+
+
+def _subset_ranks(column, order, selected):
+    # average ranks of the selected values of a column (like scipy.stats.rankdata), in the order of the selected rows,
+    # computed from the order of the sorted column without sorting again
+    positions = order[selected[order]]
+    values = column[positions]
+    # the first position of every run of equal values and the length of the run
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    counts = np.diff(np.r_[starts, len(values)])
+    ranks = np.empty(len(column))
+    ranks[positions] = np.repeat(starts + (counts + 1) / 2, counts)
+    return ranks[selected]
+
+
+def compute_pair_concordance(all_methods_df, metrics=AGREEMENT_METRICS, metric="SI", threshold=1.0):
+    """
+    Computes for every pair, how well the rankings of the methods by the different metrics agree, and whether the methods disagree.
+
+    Parameters
+    ----------
+    all_methods_df : Pandas.DataFrame
+
+    metrics: list, Optional
+        The metrics ranking the methods. Default are the columns in ``AGREEMENT_METRICS``.
+
+    metric: str, Optional
+        The metric of the spread of the methods. Default is "SI".
+
+    threshold: float, Optional
+        The methods disagree on a pair, if the spread of their values is above the threshold. Default is 1.0.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        Contains for every pair the number of methods ("methods"), Kendall's coefficient of concordance of the rankings
+        of the methods by the metrics ("kendall_w", 1 for the same ranking by all metrics, NaN if a method has no result),
+        the difference between the largest and the smallest value of the methods ("spread")
+        and whether it is above the threshold ("disagree"). The mean of "disagree" is the fraction of the pairs,
+        where the methods disagree.
+    """
+
+    pivot = pivot_pairs(all_methods_df, list(dict.fromkeys(list(metrics) + [metric])))
+    # shape (pairs, methods, metrics), the methods are in the same order for all metrics
+    values = np.stack([pivot[column].to_numpy() for column in metrics], axis=2)
+    n_methods, n_metrics = values.shape[1], values.shape[2]
+    complete = ~np.isnan(values).any(axis=(1, 2))
+    # the average ranks of the few methods of every pair, by comparing the methods instead of sorting every pair
+    rank_sums = np.zeros(values.shape[:2])
+    for k in range(n_methods):
+        method = values[:, k : k + 1, :]
+        rank_sums[:, k] = ((values < method).sum(axis=1) + ((values == method).sum(axis=1) + 1) / 2).sum(axis=1)
+    deviations = ((rank_sums - rank_sums.mean(axis=1, keepdims=True)) ** 2).sum(axis=1)
+    kendall_w = np.full(len(pivot), np.nan)
+    if n_methods > 1:
+        kendall_w[complete] = 12 * deviations[complete] / (n_metrics**2 * (n_methods**3 - n_methods))
+    spread = pivot[metric].max(axis=1) - pivot[metric].min(axis=1)
+    return pd.DataFrame(
+        {
+            "methods": pivot[metric].notna().sum(axis=1),
+            "kendall_w": kendall_w,
+            "spread": spread,
+            "disagree": spread > threshold,
+        },
+        index=pivot.index,
+    )
+
+
 def check_distribution(all_methods_df, path=None, test="kstest"):
     """
     Tests wether the data is distributed normally or not and creates different distribution plots.
@@ -200,6 +371,9 @@ def check_distribution(all_methods_df, path=None, test="kstest"):
         When a path is provided the figure will be saved in this path, otherwise the figure is not saved.
     """
 
+    import seaborn as sns
+    import scipy.stats as stats
+
     rmsd = all_methods_df["rmsd"].tolist()
     si = all_methods_df["SI"].tolist()
     mi = all_methods_df["MI"].tolist()
@@ -258,8 +432,16 @@ def compute_anova(all_methods_df):
     -------
         list
             contains the results of the ANOVA for the RMSD, SI, MI adn SAS values.
+
+    .. note::
+
+        For result sets larger than the memory, the same ANOVA tables are returned by
+        ``result_statistics.ResultStatistics.anova``, which reads the results in chunks.
     """
 
+    import statsmodels.api as sm
+    from statsmodels.formula.api import ols
+
     rmsd_model = ols("rmsd ~ C(method)", data=all_methods_df).fit()
     rmsd_anova = sm.stats.anova_lm(rmsd_model, typ=2)
     si_model = ols("SI ~ C(method)", data=all_methods_df).fit()
@@ -279,7 +461,7 @@ def compute_anova(all_methods_df):
     print("\n")
     print("ANOVA results for Structural Alignment Score (SAS):")
     print(sas_anova)
-    return [rmsd_anova, si_anova, mi_model, sas_anova]
+    return [rmsd_anova, si_anova, mi_anova, sas_anova]
 
 
 def compute_kruskal(all_methods_df):
@@ -295,6 +477,8 @@ def compute_kruskal(all_methods_df):
         list
             contains the results of the Kruskal–Wallis test for the RMSD, SI, MI adn SAS values.
     """
+
+    import scipy.stats as stats
     rmsd_diff = stats.kruskal(
         *[group["rmsd"].values for name, group in all_methods_df.groupby("method")]
     )
@@ -336,6 +520,8 @@ def compute_mannwhitneyu(all_methods_df):
             - non_significant: list containing all non significant results of the tests.
     """
 
+    import scipy.stats as stats
+
     theseus_df = all_methods_df[all_methods_df["method"] == "theseus"]
     pymol_df = all_methods_df[all_methods_df["method"] == "pymol"]
     matchmaker_df = all_methods_df[all_methods_df["method"] == "matchmaker"]
@@ -395,7 +581,7 @@ def count_best_results(all_methods_df):
             - SAS_wo_mmligner_df: Pandas.DataFrame containing counts of each method excluding MMLigner for SAS.
     """
 
-    strucs = all_methods_df["reference_id"].append(all_methods_df["mobile_id"]).unique().tolist()
+    strucs = pd.concat([all_methods_df["reference_id"], all_methods_df["mobile_id"]]).unique().tolist()
     names = [
         "reference_id",
         "mobile_id",
@@ -434,27 +620,36 @@ def count_best_results(all_methods_df):
                 & (all_methods_df["mobile_id"] == mobile)
             ]
             # select the row (method) containing the best quality measure
-            SI_df = SI_df.append(temp_df.loc[temp_df["SI"] == temp_df["SI"].min()])
-            MI_df = MI_df.append(temp_df.loc[temp_df["MI"] == temp_df["MI"].min()])
-            SAS_df = SAS_df.append(temp_df.loc[temp_df["SAS"] == temp_df["SAS"].min()])
+            SI_df = pd.concat([SI_df, temp_df.loc[temp_df["SI"] == temp_df["SI"].min()]])
+            MI_df = pd.concat([MI_df, temp_df.loc[temp_df["MI"] == temp_df["MI"].min()]])
+            SAS_df = pd.concat([SAS_df, temp_df.loc[temp_df["SAS"] == temp_df["SAS"].min()]])
 
             temp_wo_mmligner_df = wo_mmligner_df[
                 (wo_mmligner_df["reference_id"] == structure)
                 & (wo_mmligner_df["mobile_id"] == mobile)
             ]
-            SI_wo_mmligner_df = SI_wo_mmligner_df.append(
-                temp_wo_mmligner_df.loc[
-                    temp_wo_mmligner_df["SI"] == temp_wo_mmligner_df["SI"].min()
+            SI_wo_mmligner_df = pd.concat(
+                [
+                    SI_wo_mmligner_df,
+                    temp_wo_mmligner_df.loc[
+                        temp_wo_mmligner_df["SI"] == temp_wo_mmligner_df["SI"].min()
+                    ],
                 ]
             )
-            MI_wo_mmligner_df = MI_wo_mmligner_df.append(
-                temp_wo_mmligner_df.loc[
-                    temp_wo_mmligner_df["MI"] == temp_wo_mmligner_df["MI"].min()
+            MI_wo_mmligner_df = pd.concat(
+                [
+                    MI_wo_mmligner_df,
+                    temp_wo_mmligner_df.loc[
+                        temp_wo_mmligner_df["MI"] == temp_wo_mmligner_df["MI"].min()
+                    ],
                 ]
             )
-            SAS_wo_mmligner_df = SAS_wo_mmligner_df.append(
-                temp_wo_mmligner_df.loc[
-                    temp_wo_mmligner_df["SAS"] == temp_wo_mmligner_df["SAS"].min()
+            SAS_wo_mmligner_df = pd.concat(
+                [
+                    SAS_wo_mmligner_df,
+                    temp_wo_mmligner_df.loc[
+                        temp_wo_mmligner_df["SAS"] == temp_wo_mmligner_df["SAS"].min()
+                    ],
                 ]
             )
     # print results
@@ -495,6 +690,310 @@ def compute_mean_median(all_methods_df):
     """
 
     grouped = all_methods_df.groupby("method")
-    means = round(grouped.mean(), 4)
-    medians = round(grouped.median(), 4)
+    means = round(grouped.mean(numeric_only=True), 4)
+    medians = round(grouped.median(numeric_only=True), 4)
     return [means, medians]
+
+
+def compute_scaling(all_methods_df):
+    """
+    Computes the time-versus-size curve of each method, e.g. for the synthetic structures of different lengths.
+    The size of an alignment is the size of the smaller structure.
+
+    Parameters
+    ----------
+    all_methods_df : Pandas.DataFrame
+
+    Returns
+    -------
+    Pandas.DataFrame
+        Contains the median time and the number of alignments for each method and size.
+    """
+
+    sizes = all_methods_df[["reference_size", "mobile_size"]].min(axis=1).rename("size")
+    grouped = all_methods_df.groupby(["method", sizes])["time"]
+    return pd.DataFrame({"time": grouped.median(), "count": grouped.count()}).reset_index()
+
+
+def create_scaling_plot(all_methods_df, path=None):
+    """
+    Creates a log-log plot of the median time in relationship to the size of the structures for each method.
+
+    Parameters
+    ----------
+    all_methods_df : Pandas.DataFrame
+
+    path: str, Optional
+        Path where the figure should be saved.
+
+    Returns
+    -------
+    None
+
+    .. note::
+
+        When a path is provided the figure will be saved in this path, otherwise the figure is not saved.
+    """
+
+    import matplotlib.pyplot as plt
+
+    scaling = compute_scaling(all_methods_df)
+    fig, ax = plt.subplots(figsize=(10, 6))
+    for method, group in scaling.groupby("method"):
+        ax.plot(group["size"], group["time"], marker="o", label=method)
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    plt.ylabel("Median time in seconds")
+    plt.xlabel("Size of the smaller structure")
+    plt.legend(loc="upper left")
+    if path:
+        Path(path).mkdir(parents=True, exist_ok=True)
+        plt.savefig(f"{path}/scaling_plot.png")
+    plt.show()
+
+
+def read_pair_value(matrices, metric, reference_id, mobile_id, method):
+    """
+    Reads the value of one alignment from the pairwise matrices.
+
+    Parameters
+    ----------
+    matrices: dict
+        The matrices returned by ``pair_matrices.load_pair_matrices``.
+
+    metric: str
+        The metric, e.g. "SI".
+
+    reference_id: str
+        PDB-ID of the reference structure.
+
+    mobile_id: str
+        PDB-ID of the mobile structure.
+
+    method: str
+        The method.
+
+    Returns
+    -------
+    float
+        The value, NaN if the alignment is missing or failed.
+
+    .. note::
+
+        For within-group matrices, the order of the structures does not matter.
+    """
+
+    matrix = matrices["matrices"][metric]
+    k = matrices["method_positions"][method]
+    i = matrices["row_positions"].get(reference_id)
+    j = matrices["column_positions"].get(mobile_id)
+    value = matrix[i, j, k] if i is not None and j is not None else np.nan
+    if np.isnan(value) and matrices["in_group"]:
+        i = matrices["row_positions"].get(mobile_id)
+        j = matrices["column_positions"].get(reference_id)
+        value = matrix[i, j, k] if i is not None and j is not None else np.nan
+    return float(value)
+
+
+def read_pair_block(matrices, metric, reference_ids=None, mobile_ids=None, methods=None):
+    """
+    Reads a block of the pairwise matrices, e.g. for a heatmap of the structures of two kinase families.
+
+    Parameters
+    ----------
+    matrices: dict
+        The matrices returned by ``pair_matrices.load_pair_matrices``.
+
+    metric: str
+        The metric, e.g. "SI".
+
+    reference_ids: list, Optional
+        PDB-IDs of the rows. Default are all rows.
+
+    mobile_ids: list, Optional
+        PDB-IDs of the columns. Default are all columns.
+
+    methods: list, Optional
+        The methods. Default are all methods.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape (len(reference_ids), len(mobile_ids), len(methods)).
+        For within-group matrices, both triangles are filled.
+    """
+
+    matrix = matrices["matrices"][metric]
+    # the identifiers may be arrays or indexes, which have no truth value
+    reference_ids = matrices["rows"] if reference_ids is None else reference_ids
+    mobile_ids = matrices["columns"] if mobile_ids is None else mobile_ids
+    methods = matrices["methods"] if methods is None else methods
+    rows = [matrices["row_positions"][pdb_id] for pdb_id in reference_ids]
+    columns = [matrices["column_positions"][pdb_id] for pdb_id in mobile_ids]
+    methods = [matrices["method_positions"][method] for method in methods]
+    block = np.array(matrix[np.ix_(rows, columns, methods)])
+    if matrices["in_group"]:
+        mirrored = np.array(matrix[np.ix_(columns, rows, methods)]).transpose(1, 0, 2)
+        block = np.where(np.isnan(block), mirrored, block)
+    return block
+
+
+def count_best_methods(matrices, metric, higher_is_better=None):
+    """
+    Counts for each method how often it gives the best value of the metric of all methods,
+    computed on the pairwise matrices instead of comparing the rows of every pair like ``count_best_results``.
+
+    Parameters
+    ----------
+    matrices: dict
+        The matrices returned by ``pair_matrices.load_pair_matrices``.
+
+    metric: str
+        The metric, e.g. "SI".
+
+    higher_is_better: bool, Optional
+        If True, the highest value is the best, otherwise the lowest value.
+        Default is True for the metrics in ``HIGHER_IS_BETTER`` (the coverage), False for the others.
+
+    Returns
+    -------
+    Pandas.Series
+        Counts of the best values of each method. For ties, the first method of the index is counted.
+    """
+
+    if higher_is_better is None:
+        higher_is_better = metric in HIGHER_IS_BETTER
+    matrix = matrices["matrices"][metric]
+    counts = np.zeros(len(matrices["methods"]), dtype=int)
+    # the matrix is processed in blocks of rows, so only a part of the memory-mapped array is read at once
+    for start in range(0, matrix.shape[0], 256):
+        block = np.array(matrix[start : start + 256])
+        aligned = ~np.all(np.isnan(block), axis=2)
+        if higher_is_better:
+            best = np.argmax(np.where(np.isnan(block), -np.inf, block), axis=2)[aligned]
+        else:
+            best = np.argmin(np.where(np.isnan(block), np.inf, block), axis=2)[aligned]
+        counts += np.bincount(best, minlength=len(counts))
+    return pd.Series(counts, index=matrices["methods"], name="count").sort_values(ascending=False)
+
+
+def read_residue_deviations(store, reference_id, mobile_id, method):
+    """
+    Reads the per-residue deviations of one alignment from the residue store.
+
+    Parameters
+    ----------
+    store: dict
+        The store returned by ``residue_store.load_residue_store``.
+
+    reference_id: str
+        PDB-ID of the reference structure.
+
+    mobile_id: str
+        PDB-ID of the mobile structure.
+
+    method: str
+        The method.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        Contains the residue numbers of the matched residues ("reference_residue", "mobile_residue")
+        and their distances after the superposition ("distance"). Empty, if the alignment is not in the store.
+
+    .. note::
+
+        Only the values of this alignment are read from the memory-mapped files.
+    """
+
+    offset, length = store["positions"].get((reference_id, mobile_id, method), (0, 0))
+    return pd.DataFrame(
+        {
+            "reference_residue": np.asarray(store["reference_residues"][offset : offset + length], dtype=int),
+            "mobile_residue": np.asarray(store["mobile_residues"][offset : offset + length], dtype=int),
+            "distance": np.asarray(store["distances"][offset : offset + length], dtype=float),
+        }
+    )
+
+
+def compare_residue_deviations(store, reference_id, mobile_id, methods):
+    """
+    Compares the per-residue deviations of the methods for one pair, e.g. to find the residues
+    which cause the difference of the RMSD between two methods.
+
+    Parameters
+    ----------
+    store: dict
+        The store returned by ``residue_store.load_residue_store``.
+
+    reference_id: str
+        PDB-ID of the reference structure.
+
+    mobile_id: str
+        PDB-ID of the mobile structure.
+
+    methods: list
+        The methods.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        Contains the distance of every reference residue for every method (columns),
+        NaN if the residue is not matched by a method.
+    """
+
+    return pd.DataFrame(
+        {
+            method: read_residue_deviations(store, reference_id, mobile_id, method).set_index("reference_residue")[
+                "distance"
+            ]
+            for method in methods
+        }
+    ).sort_index()
+
+
+def compare_warm_start(cold_df, warm_df):
+    """
+    Compares the alignments with warm start with the same alignments started from the original coordinates (cold start),
+    e.g. two runs of the same sample set with and without ``warm_start`` in ``benchmark_utils.run_alignments``.
+
+    Parameters
+    ----------
+    cold_df : Pandas.DataFrame
+        The results of the run without warm start.
+
+    warm_df : Pandas.DataFrame
+        The results of the run with warm start.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        Contains for every method the number of alignments of both runs ("alignments") and of the warm-started alignments
+        ("warm_started"), the total time of the warm-started alignments in both runs ("time_cold", "time_warm")
+        and the saved fraction of this time ("saving"), the median ratio of the times of a pair ("median_ratio")
+        and the maximal absolute differences of the RMSD and the coverage ("max_rmsd_diff", "max_coverage_diff").
+    """
+
+    keys = ["reference_id", "mobile_id", "method"]
+    merged = pd.merge(
+        cold_df[keys + ["rmsd", "coverage", "time"]],
+        warm_df[keys + ["rmsd", "coverage", "time", "warm_start"]],
+        on=keys,
+        suffixes=("_cold", "_warm"),
+    )
+    merged["warm_start"] = merged["warm_start"].astype(bool)
+    warm = merged[merged["warm_start"]]
+    comparison = pd.DataFrame(
+        {
+            "alignments": merged.groupby("method").size(),
+            "warm_started": warm.groupby("method").size(),
+            "time_cold": warm.groupby("method")["time_cold"].sum(),
+            "time_warm": warm.groupby("method")["time_warm"].sum(),
+            "median_ratio": (warm["time_warm"] / warm["time_cold"]).groupby(warm["method"]).median(),
+            "max_rmsd_diff": (warm["rmsd_warm"] - warm["rmsd_cold"]).abs().groupby(warm["method"]).max(),
+            "max_coverage_diff": (warm["coverage_warm"] - warm["coverage_cold"]).abs().groupby(warm["method"]).max(),
+        }
+    )
+    comparison["warm_started"] = comparison["warm_started"].fillna(0).astype(int)
+    comparison["saving"] = round(1 - comparison["time_warm"] / comparison["time_cold"], 4)
+    return comparison
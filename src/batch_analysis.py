@@ -0,0 +1,269 @@
+"""
+Provides the analysis of all results at once, instead of one notebook for every group and group pair.
+
+All result files of the "*_results" folders are loaded once and stratified by the groups of the reference
+and the mobile structures (ref_group, mob_group), e.g. (TK, TK) for the alignments within TK and (TK, CAMK)
+for the alignments between TK and CAMK. The counts, means, medians and best results of every stratum and method
+are computed in one grouped pass, the statistical tests of the strata optionally in parallel processes.
+The results are written to one summary table, one table of the tests and heatmaps over all strata.
+"""
+
+import argparse
+import concurrent.futures
+import glob
+import os
+from pathlib import Path
+
+import matplotlib.pyplot as plt
+import pandas as pd
+import scipy.stats as stats
+import seaborn as sns
+
+from results_utils import read_results
+
+STRATUM = ["ref_group", "mob_group"]
+
+# quality measures of the tests and the best results, lower values are better
+METRICS = ["rmsd", "SI", "MI", "SAS"]
+
+# columns of the means and medians
+SUMMARY_COLUMNS = ["rmsd", "coverage", "rel_cov", "time", "SI", "MI", "SAS"]
+
+
+def load_all_results(data_dir, exclude=("refinement",)):
+    """
+    Loads all result files of the "*_results" folders.
+
+    Parameters
+    ----------
+    data_dir: str
+        The data folder containing the "*_results" folders, e.g. "../data".
+        Only the files directly in these folders are loaded, not the files in subfolders.
+
+    exclude: tuple, Optional
+        Files whose names contain one of these strings are not loaded.
+        Default excludes the PyMol runs with refinement, which repeat the alignments of other files.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        The results of all files with the relative coverage ("rel_cov") and the name of the file ("source").
+    """
+
+    paths = sorted(glob.glob(os.path.join(str(data_dir), "*_results", "*.csv")))
+    paths = [path for path in paths if not any(pattern in os.path.basename(path) for pattern in exclude)]
+    all_methods_df = pd.concat(
+        [read_results(path).assign(source=os.path.basename(path)) for path in paths], ignore_index=True
+    )
+    all_methods_df["rel_cov"] = round(
+        all_methods_df["coverage"] / all_methods_df[["reference_size", "mobile_size"]].min(axis=1), 4
+    )
+    return all_methods_df
+
+
+def count_best_by_stratum(all_methods_df, metrics=METRICS, exclude_method="mmligner"):
+    """
+    Counts for every stratum how often each method has the best (lowest) value of a pair, like ``count_best_results``
+    in ``analysis_utils``, but for all strata in one grouped pass. Ties are counted for all tied methods.
+
+    Parameters
+    ----------
+    all_methods_df : Pandas.DataFrame
+
+    metrics: list, Optional
+        The metrics. Default are the columns in ``METRICS``.
+
+    exclude_method: str, Optional
+        The counts are computed a second time without this method (columns "best_<metric>_wo_<method>").
+        Default is "mmligner", with None the second counts are not computed.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        Contains the counts ("best_<metric>") with the index (ref_group, mob_group, method).
+    """
+
+    pair = STRATUM + ["reference_id", "mobile_id"]
+    variants = [("", all_methods_df)]
+    if exclude_method:
+        variants.append((f"_wo_{exclude_method}", all_methods_df[all_methods_df["method"] != exclude_method]))
+    counts = {}
+    for suffix, df in variants:
+        for metric in metrics:
+            is_best = df[metric] == df.groupby(pair)[metric].transform("min")
+            counts[f"best_{metric}{suffix}"] = is_best.groupby([df[key] for key in STRATUM + ["method"]]).sum()
+    return pd.DataFrame(counts).fillna(0).astype(int)
+
+
+def _stratum_tests(args):
+    # the tests of one stratum, called in a worker process
+    stratum, df, metrics = args
+    rows = []
+    methods = sorted(df["method"].unique())
+    for metric in metrics:
+        values = {method: group[metric].dropna().to_numpy() for method, group in df.groupby("method")}
+        if len(methods) > 1:
+            result = stats.kruskal(*[values[method] for method in methods])
+            rows.append(list(stratum) + [metric, "kruskal", "all", "all", result[0], result[1]])
+        for i, method1 in enumerate(methods):
+            for method2 in methods[i + 1 :]:
+                result = stats.mannwhitneyu(values[method1], values[method2])
+                rows.append(list(stratum) + [metric, "mannwhitneyu", method1, method2, result[0], result[1]])
+    return rows
+
+
+def compute_tests_by_stratum(all_methods_df, metrics=METRICS, workers=1):
+    """
+    Performs the Kruskal–Wallis test and the pairwise Mann–Whitney U tests of the methods for every stratum and metric.
+
+    Parameters
+    ----------
+    all_methods_df : Pandas.DataFrame
+
+    metrics: list, Optional
+        The metrics. Default are the columns in ``METRICS``.
+
+    workers: int, Optional
+        Number of processes, the strata are tested in parallel. Default is 1.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        Contains one row for every test with the columns "ref_group", "mob_group", "metric", "test",
+        "method1", "method2", "statistic", "pvalue" and "significant" (p-value below 0.05).
+    """
+
+    tasks = [(stratum, df, metrics) for stratum, df in all_methods_df.groupby(STRATUM)]
+    if workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_stratum_tests, tasks))
+    else:
+        results = [_stratum_tests(task) for task in tasks]
+    tests = pd.DataFrame(
+        [row for rows in results for row in rows],
+        columns=STRATUM + ["metric", "test", "method1", "method2", "statistic", "pvalue"],
+    )
+    tests["significant"] = tests["pvalue"] < 0.05
+    return tests
+
+
+def summarize_strata(all_methods_df, metrics=METRICS):
+    """
+    Computes the checks, means, medians and best results of every stratum and method in one grouped pass.
+
+    Parameters
+    ----------
+    all_methods_df : Pandas.DataFrame
+        The results returned by ``load_all_results``.
+
+    metrics: list, Optional
+        The metrics of the best results. Default are the columns in ``METRICS``.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        Contains one row for every (ref_group, mob_group, method) with the number of alignments, the number of failed
+        alignments (no SI), the total time in minutes, the means ("mean_<column>") and medians ("median_<column>")
+        of the successful alignments and the counts of the best results (see ``count_best_by_stratum``).
+    """
+
+    keys = STRATUM + ["method"]
+    grouped = all_methods_df.groupby(keys)
+    summary = pd.DataFrame(
+        {
+            "alignments": grouped.size(),
+            "failed": grouped["SI"].apply(lambda values: int(values.isna().sum())),
+            "total_time_min": round(grouped["time"].sum() / 60, 2),
+        }
+    )
+    # the means and medians of the successful alignments like in the notebooks after dropna
+    successful = all_methods_df.dropna(subset=["SI"]).groupby(keys)[SUMMARY_COLUMNS]
+    summary = summary.join(round(successful.mean(), 4).add_prefix("mean_"))
+    summary = summary.join(round(successful.median(), 4).add_prefix("median_"))
+    summary = summary.join(count_best_by_stratum(all_methods_df.dropna(subset=["SI"]), metrics))
+    best_columns = [column for column in summary.columns if column.startswith("best_")]
+    summary[best_columns] = summary[best_columns].fillna(0).astype(int)
+    return summary.reset_index()
+
+
+def create_strata_heatmaps(summary, path=None, columns=("median_rmsd", "median_SI", "best_SI")):
+    """
+    Creates a heatmap of the strata and methods for each column of the summary.
+
+    Parameters
+    ----------
+    summary: Pandas.DataFrame
+        The summary returned by ``summarize_strata``.
+
+    path: str, Optional
+        Path where the figures should be saved, named "strata_<column>.png".
+
+    columns: tuple, Optional
+        The columns of the summary. Default are the median RMSD, the median SI and the counts of the best SI.
+
+    Returns
+    -------
+    None
+
+    .. note::
+
+        When a path is provided the figures will be saved in this path, otherwise the figures are not saved.
+    """
+
+    strata = summary["ref_group"] + "_" + summary["mob_group"].where(summary["ref_group"] != summary["mob_group"], "")
+    strata = strata.str.rstrip("_")
+    for column in columns:
+        table = summary.assign(stratum=strata).pivot(index="stratum", columns="method", values=column)
+        fig, ax = plt.subplots(figsize=(10, 0.5 * len(table) + 2))
+        sns.heatmap(table, annot=True, fmt=".0f" if column.startswith("best_") else ".2f", cmap="viridis", ax=ax)
+        ax.set_title(column)
+        if path:
+            Path(path).mkdir(parents=True, exist_ok=True)
+            plt.savefig(f"{path}/strata_{column}.png", bbox_inches="tight")
+        plt.show()
+
+
+def run_batch_analysis(data_dir, output_dir, workers=1, exclude=("refinement",)):
+    """
+    Loads all results once, analyses all strata and writes the summary, the tests and the heatmaps.
+
+    Parameters
+    ----------
+    data_dir: str
+        The data folder containing the "*_results" folders.
+
+    output_dir: str
+        Folder of the results, "strata_summary.csv", "strata_tests.csv" and the heatmaps.
+
+    workers: int, Optional
+        Number of processes for the tests. Default is 1.
+
+    exclude: tuple, Optional
+        See ``load_all_results``.
+
+    Returns
+    -------
+    tuple
+        The summary and the tests.
+    """
+
+    all_methods_df = load_all_results(data_dir, exclude=exclude)
+    summary = summarize_strata(all_methods_df)
+    tests = compute_tests_by_stratum(all_methods_df.dropna(subset=["SI"]), workers=workers)
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    summary.to_csv(os.path.join(str(output_dir), "strata_summary.csv"), index=False)
+    tests.to_csv(os.path.join(str(output_dir), "strata_tests.csv"), index=False)
+    create_strata_heatmaps(summary, path=output_dir)
+    return summary, tests
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyses the results of all groups and group pairs at once.")
+    parser.add_argument("data_dir", help="data folder containing the *_results folders")
+    parser.add_argument("output_dir", help="folder of the summary, the tests and the figures")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    # the figures are only saved, not shown
+    plt.switch_backend("Agg")
+    summary, tests = run_batch_analysis(args.data_dir, args.output_dir, workers=args.workers)
+    print(f"{len(summary)} strata and methods, {len(tests)} tests")
@@ -1,18 +1,90 @@
 """
 Provides functions used to perform the alignments by the methods in OpenCADD for the benchmark.
 The functions are called in the benchmark notebooks.
+OpenCADD is imported on the first alignment (``superposition_api``), so the module is imported fast,
+e.g. in the main process of a parallel run, in the queue tools and in the unix terminal.
 """
 
+import collections
+import importlib
+import json
+import time
+
 import pandas as pd
 import numpy as np
-from opencadd.structure.core import Structure
-from opencadd.structure.superposition import api
-import time
+from failure_cache import (
+    DETERMINISTIC,
+    AlignmentFailure,
+    KnownFailure,
+    classify_failure,
+    known_failure,
+    record_failure,
+    retry_transient,
+)
+from prefetch import prefetch
+from resource_governor import ResourceGovernor, activate, active_governor, governed
+from residue_store import CapturedDeviations, ResidueStore, match_residues
+from results_utils import MODES, RESULT_COLUMNS, compute_quality_measures, read_results
+from scheduling import create_jobs, estimate_job_costs, format_report, run_jobs
+from sequential_stats import is_settled, pair_order, sequential_bounds, write_sampled_pairs
+from structure_utils import local_pdb_file, read_chain_index, read_pocket_index, read_samples
+from telemetry import Telemetry
+from timing_utils import time_call
+from transform_store import CapturedTransforms, TransformStore, alignment_transform, load_transform_graph
+from work_queue import (
+    LEASE,
+    MAX_ATTEMPTS,
+    claim_jobs,
+    complete_job,
+    default_worker,
+    fail_job,
+    queue_status,
+    release_jobs,
+    renew_leases,
+)
+
+# the methods of OpenCADD in the order of the runs, the names of the methods in ``api.METHODS``
+METHODS = ["theseus", "mmligner", "mda"]
+
+# methods which iterate from the starting superposition, these are warm-started from composed transformation matrices
+WARM_START_METHODS = ["theseus", "mmligner"]
 
-pd.set_option("display.max_columns", None)
+# rough memory of a parsed structure per atom (coordinates and topology attributes), used for the prefetch memory limit
+STRUCTURE_BYTES_PER_ATOM = 500
 
+# number of loaded structures kept by every worker process of a parallel run
+WORKER_STRUCTURES = 32
 
-def run_alignments(sample1_path=None, sample2_path=None, output_path=None, w0=1.5):
+# the options of the jobs and the loaded structures of a worker process of a parallel run, set by ``_init_worker``
+_worker_options = None
+_worker_structures = collections.OrderedDict()
+
+
+def run_alignments(
+    sample1_path=None,
+    sample2_path=None,
+    output_path=None,
+    w0=1.5,
+    warmup=0,
+    repeats=1,
+    chain_index_path=None,
+    mode="chain",
+    pocket_index_path=None,
+    cache_dir=None,
+    workers=1,
+    cost_results=None,
+    metrics_path=None,
+    metrics_format="json",
+    prefetch_depth=4,
+    prefetch_memory=None,
+    residue_store_path=None,
+    transform_store_path=None,
+    warm_start=False,
+    threads=None,
+    subprocess_limits=None,
+    affinity=False,
+    failure_cache_path=None,
+):
     """
     Parsing of the sample sets and iterating over the structures and the methods to perform all alignments and compute the quality measures.
 
@@ -30,6 +102,76 @@ def run_alignments(sample1_path=None, sample2_path=None, output_path=None, w0=1.
     w0: float, Optional
         The value for the normalization factor for MI. Default is set to 1.5.
 
+    warmup: int, Optional
+        Number of alignments performed for every pair before the time is measured. Default is 0.
+
+    repeats: int, Optional
+        Number of measured alignments for every pair. Default is 1.
+
+    chain_index_path: str, Optional
+        Path of the chain index created by ``structure_utils.build_chain_index``.
+        If provided, the sizes of the structures are taken from the index, so all methods use the same sizes.
+
+    mode: str, Optional
+        "chain" to align the CA atoms of the complete chains or "pocket" to align only the CA atoms of the KLIFS pocket.
+        Default is "chain".
+
+    pocket_index_path: str, Optional
+        Path of the pocket index created by ``structure_utils.build_pocket_index``. Required for the pocket mode.
+
+    cache_dir: str, Optional
+        Folder containing the cached PDB files. Cached structures are loaded from this folder instead of downloading them,
+        e.g. the synthetic structures created by ``synthetic_structures.generate_dataset``.
+
+    workers: int, Optional
+        Number of worker processes. With more than one worker, the jobs are dispatched longest-first
+        by ``scheduling.run_jobs`` and the predicted and actual makespan are printed. Default is 1.
+
+    cost_results: list, Optional
+        Paths of previous result files used to fit the runtime models for the cost of the jobs.
+        Without these files, the cost is estimated by the product of the sizes in the chain index.
+
+    metrics_path: str, Optional
+        Path of the metrics file written periodically by ``telemetry.Telemetry``.
+        Independent of this file, a compact progress line is written to stderr.
+
+    metrics_format: str, Optional
+        Format of the metrics file, "json" or "prometheus". Default is "json".
+
+    prefetch_depth: int, Optional
+        Number of structures loaded ahead in a background thread, while the current pair is aligned.
+        With 0, every structure is loaded right before its alignment. Default is 4.
+
+    prefetch_memory: int, Optional
+        Maximal estimated memory of the structures loaded ahead in bytes, see ``structure_memory``. Default is no limit.
+
+    residue_store_path: str, Optional
+        Folder of the store of the per-residue deviations (see ``residue_store.py``).
+        If provided, the matched residues and their distances after the superposition are captured for every alignment.
+
+    transform_store_path: str, Optional
+        Folder of the store of the transformation matrices (see ``transform_store.py``).
+        If provided, the 4x4 matrix of the superposition is captured for every alignment.
+
+    warm_start: bool, Optional
+        If True, the alignments of the methods in ``WARM_START_METHODS`` start from the superposition composed of
+        the matrices of already aligned pairs (see ``transform_store.TransformGraph``), if it is good enough.
+        The matrices of the transform store of earlier runs are used as well. Only used with one worker. Default is False.
+
+    threads: int, Optional
+        Number of BLAS and OpenMP threads of every worker, see ``resource_governor.ResourceGovernor``.
+        Default is 1 with more than one worker, otherwise the thread pools are not changed.
+
+    subprocess_limits: dict, Optional
+        Maximal number of alignments of a method running at the same time, e.g. {"theseus": 2}. Default is no limit.
+
+    affinity: bool, Optional
+        If True, every worker is bound to its own cores. Default is False.
+
+    failure_cache_path: str, Optional
+        Path of the SQLite database of the failures (see ``failure_cache.py``). If provided, the failures are classified
+        and recorded, and the alignments of structures and pairs known to fail deterministically are skipped.
+
     Returns
     -------
     None
@@ -38,101 +180,156 @@ def run_alignments(sample1_path=None, sample2_path=None, output_path=None, w0=1.
 
         When only one sample path is provided, the alignments are performed between the strucutres of this sample set.
         When two sample paths are provided, the alignments are performed between the structures of the different sample sets.
+        The settings of the run and of the resource governor are written to "<output_path>.run.json".
+        With several workers, the thread pools in effect in every worker are added after the run.
     """
 
     # parsing of the sample sets
-    sample_strucs1 = []
-    with open(str(sample1_path)) as f:
-        # split line, so no newline characters are left
-        # then split lines into lists to get the same structure as in the benchmark for OpenCADD
-        temp = f.read().splitlines()
-        for line in temp:
-            struc = line.split(",")
-            sample_strucs1.append(struc)
-
+    sample_strucs1 = read_samples(sample1_path)
     if sample2_path:
-        sample_strucs2 = []
-        with open(str(sample2_path)) as f:
-            # split line, so no newline characters are left
-            # then split lines into lists to get the same structure as in the benchmark for OpenCADD
-            temp = f.read().splitlines()
-            for line in temp:
-                struc = line.split(",")
-                sample_strucs2.append(struc)
+        sample_strucs2 = read_samples(sample2_path)
+    chain_index = read_chain_index(chain_index_path) if chain_index_path else None
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode}, use one of {MODES}.")
+    if mode == "pocket" and not pocket_index_path:
+        raise ValueError("The pocket mode requires the pocket index.")
+    pocket_index = read_pocket_index(pocket_index_path) if mode == "pocket" else None
+    n_pairs = len(sample_strucs1) * (
+        len(sample_strucs2) if sample2_path else (len(sample_strucs1) - 1) / 2
+    )
+    telemetry = Telemetry(
+        int(n_pairs) * len(METHODS), metrics_path=metrics_path, metrics_format=metrics_format
+    )
+    residue_store = ResidueStore(residue_store_path) if residue_store_path else None
+    # the matrices of earlier runs are read, before the store is continued
+    warm_starts = load_transform_graph(transform_store_path) if warm_start else None
+    transform_store = TransformStore(transform_store_path) if transform_store_path else None
+    # several workers use one thread each by default, so they do not oversubscribe the cores
+    governor = ResourceGovernor(
+        threads=threads or (1 if workers > 1 else None), subprocess_limits=subprocess_limits, affinity=affinity
+    )
+    run_settings = dict(workers=workers, warmup=warmup, repeats=repeats, mode=mode, warm_start=warm_start)
+    if workers == 1:
+        # the thread pools in effect are recorded, so the governor is applied before
+        activate(governor, worker=0)
+    write_run_metadata(f"{output_path}.run.json", governor, **run_settings)
+
+    if workers > 1:
+        models = None
+        if cost_results:
+            from cost_model import fit_cost_models
+
+            models = fit_cost_models(pd.concat([read_results(path) for path in cost_results]))
+        jobs = create_jobs(list(METHODS), sample_strucs1, sample_strucs2 if sample2_path else None)
+        costs = estimate_job_costs(jobs, chain_index=chain_index, models=models)
+        options = (
+            w0,
+            warmup,
+            repeats,
+            chain_index,
+            pocket_index,
+            cache_dir,
+            residue_store is not None,
+            transform_store is not None,
+            failure_cache_path,
+        )
+
+        # the thread pools in effect in every worker, reported with the results of its jobs
+        worker_thread_pools = {}
+
+        def finished(job, result):
+            telemetry.record(job[0], result[2], failed=result[1])
+            worker_thread_pools.setdefault(result[5][0], result[5][1])
+            # the deviations and matrices are collected in the workers and written in this process
+            if residue_store is not None:
+                result[3].write_to(residue_store)
+            if transform_store is not None:
+                result[4].write_to(transform_store)
+
+        # the options and the indexes are passed once to every worker, not with every job
+        rows, report = run_jobs(
+            _run_job,
+            jobs,
+            costs,
+            workers,
+            callback=finished,
+            initializer=_init_worker,
+            initargs=(governor, options),
+            costs_in_seconds=models is not None and not models.empty and chain_index is not None,
+        )
+        telemetry.update()
+        if residue_store is not None:
+            residue_store.close()
+        if transform_store is not None:
+            transform_store.close()
+        df = pd.DataFrame([row[0] for row in rows], columns=RESULT_COLUMNS)
+        print(len(rows))
+        print(sum(row[1] for row in rows))
+        print(format_report(report))
+        write_run_metadata(
+            f"{output_path}.run.json",
+            governor,
+            worker_thread_pools={str(worker): pools for worker, pools in sorted(worker_thread_pools.items())},
+            **run_settings,
+        )
+        df.to_csv(str(output_path), mode="w", header=False, index=False)
+        return
 
     # create empty DataFrame
-    df = pd.DataFrame(
-        columns=[
-            "reference_id",
-            "mobile_id",
-            "method",
-            "rmsd",
-            "coverage",
-            "reference_size",
-            "mobile_size",
-            "time",
-            "SI",
-            "MI",
-            "SAS",
-            "ref_name",
-            "ref_group",
-            "ref_species",
-            "ref_chain",
-            "mob_name",
-            "mob_group",
-            "mob_species",
-            "mob_chain",
-        ]
-    )
+    df = pd.DataFrame(columns=RESULT_COLUMNS)
     counter = 0
     except_counter = 0
 
-    # perfrom alignments between two sample sets
-    if sample2_path:
-        for method in api.METHODS:
-
-            # structures in the sample dataset
-            for structure in sample_strucs1:
-                # only need to download once for every method, because the variable is put into a list.
-                # the compute function operates on the entry of the list, which does not change the original strucutre here
-                reference_structure = Structure.from_pdbid(structure[0])
-
-                for mobile in sample_strucs2:
-                    mobile_structure = Structure.from_pdbid(mobile[0])
-                    benchmarking_structures = [reference_structure, mobile_structure]
-                    df, counter, except_counter = compute_alignment(
-                        method,
-                        benchmarking_structures,
-                        structure,
-                        mobile,
-                        w0,
-                        counter,
-                        except_counter,
-                        df,
-                    )
-    # perform alignments between structures of one sample set
-    else:
-        for method in api.METHODS:
-
-            # structures in the sample dataset
-            for structure in sample_strucs1:
-                # only need to download once for every method, because the variable is put into a list.
-                # the compute function operates on the entry of the list, which does not change the original strucutre here
-                reference_structure = Structure.from_pdbid(structure[0])
-
-                for mobile in sample_strucs1[sample_strucs1.index(structure) + 1 :]:
-                    mobile_structure = Structure.from_pdbid(mobile[0])
-                    benchmarking_structures = [reference_structure, mobile_structure]
-                    df, counter, except_counter = compute_alignment(
-                        method,
-                        benchmarking_structures,
-                        structure,
-                        mobile,
-                        w0,
-                        counter,
-                        except_counter,
-                        df,
-                    )
+    # the reference structure of every block is aligned with all mobile structures of the block
+    # between two sample sets the mobile structures are the structures of the second sample set,
+    # within one sample set the structures after the reference structure
+    blocks = [
+        (method, structure, mobiles)
+        for method in METHODS
+        for i, structure in enumerate(sample_strucs1)
+        for mobiles in [sample_strucs2 if sample2_path else sample_strucs1[i + 1 :]]
+        if mobiles
+    ]
+    # the structures are loaded in the background in the order in which they are aligned
+    loaded_structures = prefetch(
+        [pdb[0] for _, structure, mobiles in blocks for pdb in [structure] + list(mobiles)],
+        lambda pdb_id: load_structure(pdb_id, cache_dir),
+        depth=prefetch_depth,
+        memory_limit=prefetch_memory,
+        size=structure_memory,
+    )
+    for method, structure, mobiles in blocks:
+        # only need to load once for every method, because the variable is put into a list.
+        # the compute function operates on the entry of the list, which does not change the original strucutre here
+        reference_structure = next(loaded_structures)
+
+        for mobile in mobiles:
+            mobile_structure = next(loaded_structures)
+            benchmarking_structures = [reference_structure, mobile_structure]
+            df, counter, except_counter = compute_alignment(
+                method,
+                benchmarking_structures,
+                structure,
+                mobile,
+                w0,
+                counter,
+                except_counter,
+                df,
+                warmup=warmup,
+                repeats=repeats,
+                chain_index=chain_index,
+                pocket_index=pocket_index,
+                telemetry=telemetry,
+                residue_store=residue_store,
+                transform_store=transform_store,
+                warm_starts=warm_starts,
+                failure_cache=failure_cache_path,
+            )
+    telemetry.update()
+    if residue_store is not None:
+        residue_store.close()
+    if transform_store is not None:
+        transform_store.close()
     print(counter)
     print(except_counter)
 
@@ -140,8 +337,608 @@ def run_alignments(sample1_path=None, sample2_path=None, output_path=None, w0=1.
     df.to_csv(str(output_path), mode="w", header=False, index=False)
 
 
+def run_adaptive_alignments(
+    sample1_path=None,
+    sample2_path=None,
+    output_path=None,
+    w0=1.5,
+    metric="SI",
+    precision=0.05,
+    alpha=0.05,
+    batch_size=20,
+    min_pairs=40,
+    seed=2021,
+    chain_index_path=None,
+    cache_dir=None,
+    warmup=0,
+    repeats=1,
+    metrics_path=None,
+    metrics_format="json",
+    prefetch_depth=4,
+    prefetch_memory=None,
+    residue_store_path=None,
+    transform_store_path=None,
+    warm_start=False,
+    failure_cache_path=None,
+):
+    """
+    Performs the alignments of all methods pair by pair in a random but reproducible order
+    and stops, once the mean of the metric and the win rate of every method are known with the requested precision.
+    This is used for exploratory group comparisons, where the ranking of the methods is settled long before all pairs are aligned.
+
+    Parameters
+    ----------
+    sample1_path: str, Optional
+        Path for the file containing the first sample set.
+
+    sample2_path: str, Optional
+        Path for the file containing the second sample set.
+
+    output_path: str, Optional
+        Path for the file containing the output of the alignments in csv format.
+        The processed pairs are written to "<output_path>.pairs" by ``sequential_stats.write_sampled_pairs``.
+
+    w0: float, Optional
+        The value for the normalization factor for MI. Default is set to 1.5.
+
+    metric: str, Optional
+        The metric used for the statistics, see ``sequential_stats.sequential_bounds``. Default is "SI".
+
+    precision: float, Optional
+        The requested precision, see ``sequential_stats.is_settled``. Default is 0.05.
+
+    alpha: float, Optional
+        Error probability of the confidence bounds of all looks together. Default is 0.05.
+
+    batch_size: int, Optional
+        Number of pairs between two looks at the statistics. Default is 20.
+
+    min_pairs: int, Optional
+        Minimal number of pairs before the run can stop. Default is 40.
+
+    seed: int, Optional
+        Seed of the order of the pairs. Default is 2021.
+
+    chain_index_path: str, Optional
+        Path of the chain index created by ``structure_utils.build_chain_index``.
+
+    cache_dir: str, Optional
+        Folder containing the cached PDB files.
+
+    warmup: int, Optional
+        Number of alignments performed for every pair before the time is measured. Default is 0.
+
+    repeats: int, Optional
+        Number of measured alignments for every pair. Default is 1.
+
+    metrics_path: str, Optional
+        Path of the metrics file written periodically by ``telemetry.Telemetry``.
+
+    metrics_format: str, Optional
+        Format of the metrics file, "json" or "prometheus". Default is "json".
+
+    prefetch_depth: int, Optional
+        See ``run_alignments``. Default is 4.
+
+    prefetch_memory: int, Optional
+        See ``run_alignments``. Default is no limit.
+
+    residue_store_path: str, Optional
+        See ``run_alignments``.
+
+    transform_store_path: str, Optional
+        See ``run_alignments``.
+
+    warm_start: bool, Optional
+        See ``run_alignments``. Default is False.
+
+    failure_cache_path: str, Optional
+        See ``run_alignments``.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        The bounds of the last look returned by ``sequential_stats.sequential_bounds``.
+    """
+
+    sample_strucs1 = read_samples(sample1_path)
+    sample_strucs2 = read_samples(sample2_path) if sample2_path else None
+    chain_index = read_chain_index(chain_index_path) if chain_index_path else None
+    pairs = pair_order(sample_strucs1, sample_strucs2, seed=seed)
+    # the total assumes that all pairs are aligned, so the estimated remaining time is an upper bound
+    telemetry = Telemetry(len(pairs) * len(METHODS), metrics_path=metrics_path, metrics_format=metrics_format)
+    residue_store = ResidueStore(residue_store_path) if residue_store_path else None
+    # the matrices of earlier runs are read, before the store is continued
+    warm_starts = load_transform_graph(transform_store_path) if warm_start else None
+    transform_store = TransformStore(transform_store_path) if transform_store_path else None
+
+    df = pd.DataFrame(columns=RESULT_COLUMNS)
+    counter = 0
+    except_counter = 0
+    look = 0
+    bounds = None
+    # number of aligned pairs, stays 0 without pairs
+    position = 0
+    # both structures of every pair are loaded in the background, the prefetch stops, when the run stops early
+    loaded_structures = prefetch(
+        [pdb[0] for pair in pairs for pdb in pair],
+        lambda pdb_id: load_structure(pdb_id, cache_dir),
+        depth=prefetch_depth,
+        memory_limit=prefetch_memory,
+        size=structure_memory,
+    )
+    for position, (structure, mobile) in enumerate(pairs, start=1):
+        loaded_pair = [next(loaded_structures), next(loaded_structures)]
+        for method in METHODS:
+            # every method starts from the structures in the frame of the PDB files, the methods may move them in place
+            benchmarking_structures = [loaded.copy() for loaded in loaded_pair]
+            df, counter, except_counter = compute_alignment(
+                method,
+                benchmarking_structures,
+                structure,
+                mobile,
+                w0,
+                counter,
+                except_counter,
+                df,
+                warmup=warmup,
+                repeats=repeats,
+                chain_index=chain_index,
+                telemetry=telemetry,
+                residue_store=residue_store,
+                transform_store=transform_store,
+                warm_starts=warm_starts,
+                failure_cache=failure_cache_path,
+            )
+        if position % batch_size == 0 or position == len(pairs):
+            look += 1
+            bounds = sequential_bounds(df, metric=metric, look=look, alpha=alpha)
+            print(f"look {look} after {position} of {len(pairs)} pairs:")
+            print(bounds)
+            if position >= min_pairs and is_settled(bounds, precision):
+                break
+    loaded_structures.close()
+    telemetry.update()
+    if residue_store is not None:
+        residue_store.close()
+    if transform_store is not None:
+        transform_store.close()
+    print(counter)
+    print(except_counter)
+
+    # write DataFrame and the processed pairs
+    df.to_csv(str(output_path), mode="w", header=False, index=False)
+    write_sampled_pairs(pairs[:position], f"{output_path}.pairs", seed)
+    return bounds
+
+
+def run_queue_worker(
+    queue_path,
+    w0=1.5,
+    chain_index_path=None,
+    pocket_index_path=None,
+    cache_dir=None,
+    warmup=0,
+    repeats=1,
+    worker=None,
+    batch_size=10,
+    lease=LEASE,
+    max_attempts=MAX_ATTEMPTS,
+    metrics_path=None,
+    metrics_format="json",
+    prefetch_depth=4,
+    residue_store_path=None,
+    transform_store_path=None,
+    warm_start=False,
+    failure_cache_path=None,
+):
+    """
+    Claims the jobs of the OpenCADD methods from the work queue and records their results,
+    until no job is left. Any number of workers can run at the same time on different machines.
+
+    Parameters
+    ----------
+    queue_path: str
+        Path of the SQLite database created by ``work_queue.create_queue``.
+
+    w0: float, Optional
+        See ``run_alignments``. Default is 1.5.
+
+    chain_index_path: str, Optional
+        Path of the chain index created by ``structure_utils.build_chain_index``.
+
+    pocket_index_path: str, Optional
+        Path of the pocket index created by ``structure_utils.build_pocket_index``.
+        If provided, only the CA atoms of the KLIFS pocket are aligned.
+
+    cache_dir: str, Optional
+        Folder containing the cached PDB files.
+
+    warmup: int, Optional
+        Number of alignments before the measurement. Default is 0.
+
+    repeats: int, Optional
+        Number of measured alignments for every pair. Default is 1.
+
+    worker: str, Optional
+        Name of the worker. Default is ``work_queue.default_worker()``.
+
+    batch_size: int, Optional
+        Number of jobs claimed at once. Default is 10.
+
+    lease: float, Optional
+        Number of seconds the claimed jobs are reserved for the worker, the leases are renewed after every job.
+        Default is ``work_queue.LEASE``.
+
+    max_attempts: int, Optional
+        Number of attempts, after which a job is marked as failed. Default is ``work_queue.MAX_ATTEMPTS``.
+
+    metrics_path: str, Optional
+        Path of the metrics file written periodically by ``telemetry.Telemetry``.
+
+    metrics_format: str, Optional
+        Format of the metrics file, "json" or "prometheus". Default is "json".
+
+    prefetch_depth: int, Optional
+        Number of structures of the claimed jobs loaded ahead in a background thread. Default is 4.
+
+    residue_store_path: str, Optional
+        Folder of the store of the per-residue deviations, see ``run_alignments``. Every worker needs its own store.
+
+    transform_store_path: str, Optional
+        Folder of the store of the transformation matrices, see ``run_alignments``. Every worker needs its own store.
+
+    warm_start: bool, Optional
+        See ``run_alignments``. Default is False.
+
+    failure_cache_path: str, Optional
+        See ``run_alignments``.
+
+    Returns
+    -------
+    tuple
+        Number of finished and failed jobs of this worker.
+
+    .. note::
+
+        The results are written to the csv file by ``work_queue.export_results``, when all jobs are finished.
+        If a worker is stopped, its jobs are claimed again by the other workers after the lease expired.
+        Failures are classified by ``failure_cache.classify_failure``, jobs with deterministic failures are marked
+        as failed right away, only the other jobs are returned to the queue for another attempt.
+    """
+
+    worker = worker or default_worker()
+    methods = list(METHODS)
+    chain_index = read_chain_index(chain_index_path) if chain_index_path else None
+    pocket_index = read_pocket_index(pocket_index_path) if pocket_index_path else None
+    # the total is the number of open jobs at the start, other workers share these jobs
+    total = sum(
+        counts["pending"] + counts["running"] for method, counts in queue_status(queue_path).items() if method in methods
+    )
+    telemetry = Telemetry(total, metrics_path=metrics_path, metrics_format=metrics_format)
+    residue_store = ResidueStore(residue_store_path) if residue_store_path else None
+    # the matrices of earlier runs are read, before the store is continued
+    warm_starts = load_transform_graph(transform_store_path) if warm_start else None
+    transform_store = TransformStore(transform_store_path) if transform_store_path else None
+    finished = 0
+    failed = 0
+    try:
+        while True:
+            jobs = claim_jobs(
+                queue_path, worker, methods=methods, count=batch_size, lease=lease, max_attempts=max_attempts
+            )
+            if not jobs:
+                break
+            loaded_structures = prefetch(
+                [pdb[0] for job in jobs for pdb in (job["structure"], job["mobile"])],
+                lambda pdb_id: load_structure(pdb_id, cache_dir),
+                depth=prefetch_depth,
+            )
+            for position, job in enumerate(jobs):
+                try:
+                    benchmarking_structures = [next(loaded_structures), next(loaded_structures)]
+                except Exception as e:
+                    # e.g. the download failed, the job is returned to the queue for another attempt
+                    fail_job(
+                        queue_path,
+                        job["id"],
+                        f"{classify_failure(e)}: {e!r}",
+                        worker,
+                        max_attempts=max_attempts,
+                        deterministic=classify_failure(e) in DETERMINISTIC,
+                    )
+                    failed += 1
+                    loaded_structures.close()
+                    release_jobs(queue_path, worker)
+                    break
+                failures = []
+                df, _, except_counter = compute_alignment(
+                    job["method"],
+                    benchmarking_structures,
+                    job["structure"],
+                    job["mobile"],
+                    w0,
+                    0,
+                    0,
+                    pd.DataFrame(columns=RESULT_COLUMNS),
+                    warmup=warmup,
+                    repeats=repeats,
+                    chain_index=chain_index,
+                    pocket_index=pocket_index,
+                    telemetry=telemetry,
+                    residue_store=residue_store,
+                    transform_store=transform_store,
+                    warm_starts=warm_starts,
+                    failure_cache=failure_cache_path,
+                    failures=failures,
+                )
+                if except_counter:
+                    # deterministic failures, e.g. an empty selection, fail again in every attempt
+                    category = classify_failure(failures[0])
+                    fail_job(
+                        queue_path,
+                        job["id"],
+                        f"{category}: {failures[0]!r}",
+                        worker,
+                        result=df.iloc[0].tolist(),
+                        max_attempts=max_attempts,
+                        deterministic=category in DETERMINISTIC,
+                    )
+                    failed += 1
+                else:
+                    complete_job(queue_path, job["id"], worker, result=df.iloc[0].tolist())
+                    finished += 1
+                renew_leases(queue_path, [job["id"] for job in jobs[position + 1 :]], worker, lease=lease)
+    finally:
+        # the claimed jobs of a stopped worker are returned to the queue right away
+        release_jobs(queue_path, worker)
+        telemetry.update()
+        if residue_store is not None:
+            residue_store.close()
+        if transform_store is not None:
+            transform_store.close()
+    print(finished)
+    print(failed)
+    return finished, failed
+
+
+def _init_worker(governor, options):
+    # initializer of the worker processes of a parallel run, applies the governor and keeps the options of the jobs
+    global _worker_options
+    activate(governor)
+    _worker_options = options
+
+
+def _load_worker_structure(pdb_id, cache_dir):
+    # loads a structure in a worker process, the last loaded structures are kept for the other jobs of the structure
+    # (its other pairs and the other methods of the pair), so they are not loaded or downloaded again
+    # every job gets its own copy, because the methods may move the structures in place, the kept structures stay
+    # in the frame of the PDB file, so the transformation matrices and the times do not depend on the order of the jobs
+    if pdb_id in _worker_structures:
+        _worker_structures.move_to_end(pdb_id)
+    else:
+        _worker_structures[pdb_id] = load_structure(pdb_id, cache_dir)
+        if len(_worker_structures) > WORKER_STRUCTURES:
+            _worker_structures.popitem(last=False)
+    return _worker_structures[pdb_id].copy()
+
+
+def _run_job(job):
+    # one alignment in a worker process, the structures are loaded in the worker
+    method, structure, mobile = job
+    w0, warmup, repeats, chain_index, pocket_index, cache_dir, capture, capture_transform, failure_cache = (
+        _worker_options
+    )
+    benchmarking_structures = [
+        _load_worker_structure(structure[0], cache_dir),
+        _load_worker_structure(mobile[0], cache_dir),
+    ]
+    captured = CapturedDeviations() if capture else None
+    captured_transforms = CapturedTransforms() if capture_transform else None
+    start = time.perf_counter()
+    df, _, except_counter = compute_alignment(
+        method,
+        benchmarking_structures,
+        structure,
+        mobile,
+        w0,
+        0,
+        0,
+        pd.DataFrame(columns=RESULT_COLUMNS),
+        warmup=warmup,
+        repeats=repeats,
+        chain_index=chain_index,
+        pocket_index=pocket_index,
+        residue_store=captured,
+        transform_store=captured_transforms,
+        failure_cache=failure_cache,
+    )
+    governor = active_governor()
+    return (
+        df.iloc[0].tolist(),
+        except_counter,
+        time.perf_counter() - start,
+        captured,
+        captured_transforms,
+        (governor.worker, governor.thread_pools),
+    )
+
+
+def write_run_metadata(path, governor, **settings):
+    """
+    Writes the settings of a run and of the resource governor, so the times can be reproduced.
+
+    Parameters
+    ----------
+    path: str
+        Path of the JSON file.
+
+    governor: resource_governor.ResourceGovernor
+        The governor of the run.
+
+    settings:
+        Further settings of the run, e.g. the number of workers.
+
+    Returns
+    -------
+    None
+    """
+
+    metadata = dict(settings, methods=METHODS, resources=governor.settings())
+    with open(str(path), "w") as f:
+        json.dump(metadata, f, indent=2)
+
+
+def superposition_api():
+    """
+    Imports the superposition API of OpenCADD with its engines on the first call.
+
+    Returns
+    -------
+    module
+        The module ``opencadd.structure.superposition.api``.
+    """
+
+    return importlib.import_module("opencadd.structure.superposition.api")
+
+
+def load_structure(pdb_id, cache_dir=None):
+    """
+    Loads a structure from the cache folder or downloads it, if it is not cached.
+
+    Parameters
+    ----------
+    pdb_id: str
+        PDB-ID of the structure.
+
+    cache_dir: str, Optional
+        Folder containing the cached PDB files named "<pdb_id>.pdb".
+
+    Returns
+    -------
+    opencadd.structure.core.Structure
+        The structure.
+    """
+
+    from opencadd.structure.core import Structure
+
+    path = local_pdb_file(pdb_id, cache_dir) if cache_dir else None
+    if path:
+        return Structure(path)
+    return Structure.from_pdbid(pdb_id)
+
+
+def structure_memory(structure):
+    """
+    Estimates the memory of a loaded structure for the memory limit of the prefetch.
+
+    Parameters
+    ----------
+    structure: opencadd.structure.core.Structure
+        The structure.
+
+    Returns
+    -------
+    int
+        The estimated memory in bytes.
+    """
+
+    return structure.atoms.n_atoms * STRUCTURE_BYTES_PER_ATOM
+
+
+def capture_deviations(residue_store, result, benchmarking_structures, user_select, structure, mobile, method):
+    """
+    Appends the matched residues and their distances after the superposition to the store.
+
+    Parameters
+    ----------
+    residue_store: residue_store.ResidueStore
+        The store.
+
+    result: dict
+        The result of the alignment returned by ``api.align``.
+
+    benchmarking_structures: list
+        The aligned structures, used if the result does not contain the superposed structures.
+
+    user_select: list
+        The selections of the CA atoms of both structures.
+
+    structure: list
+        The reference structure.
+
+    mobile: list
+        The mobile structure.
+
+    method: str
+        The method.
+
+    Returns
+    -------
+    None
+    """
+
+    superposed = result.get("superposed") or benchmarking_structures
+    atoms = [superposed[i].select_atoms(user_select[i]) for i in range(2)]
+    reference_positions, mobile_positions, distances = match_residues(atoms[0].positions, atoms[1].positions)
+    residue_store.append(
+        structure[0],
+        mobile[0],
+        method,
+        atoms[0].resids[reference_positions],
+        atoms[1].resids[mobile_positions],
+        distances,
+    )
+
+
+def superposition_transform(result, aligned_structures, user_select, before):
+    """
+    Computes the transformation matrix of the superposition, which moves the original mobile structure onto the original reference structure.
+
+    Parameters
+    ----------
+    result: dict
+        The result of the alignment returned by ``api.align``.
+
+    aligned_structures: list
+        The aligned structures, used if the result does not contain the superposed structures.
+
+    user_select: list
+        The selections of the CA atoms of both structures.
+
+    before: list
+        The coordinates of the selected atoms of both original structures before the alignment.
+
+    Returns
+    -------
+    numpy.ndarray
+        The 4x4 transformation matrix.
+    """
+
+    superposed = result.get("superposed") or aligned_structures
+    after = [superposed[i].select_atoms(user_select[i]).positions for i in range(2)]
+    return alignment_transform(before[0], after[0], before[1], after[1])
+
+
 def compute_alignment(
-    method, benchmarking_structures, structure, mobile, w0, counter, except_counter, df
+    method,
+    benchmarking_structures,
+    structure,
+    mobile,
+    w0,
+    counter,
+    except_counter,
+    df,
+    warmup=0,
+    repeats=1,
+    chain_index=None,
+    pocket_index=None,
+    telemetry=None,
+    residue_store=None,
+    transform_store=None,
+    warm_starts=None,
+    failure_cache=None,
+    failures=None,
 ):
     """
     Perform the alignment of the pair of structures and the method provided.
@@ -173,6 +970,41 @@ def compute_alignment(
     df: Pandas.DataFrame
         The DataFrame where the results are stored.
 
+    warmup: int, Optional
+        Number of alignments performed before the time is measured. Default is 0.
+
+    repeats: int, Optional
+        Number of measured alignments. The minimal time is stored in the ``time`` column,
+        the median and the spread in the ``time_median`` and ``time_spread`` columns. Default is 1.
+
+    chain_index: dict, Optional
+        The chain index returned by ``structure_utils.read_chain_index``.
+        If provided, the sizes of the structures are taken from the index instead of the metadata of the alignment.
+
+    pocket_index: dict, Optional
+        The pocket index returned by ``structure_utils.read_pocket_index``.
+        If provided, only the CA atoms of the KLIFS pocket are aligned and the sizes of the structures are the pocket sizes.
+
+    telemetry: telemetry.Telemetry, Optional
+        If provided, the alignment is recorded in the telemetry instead of printing a line for every alignment.
+
+    residue_store: residue_store.ResidueStore, Optional
+        If provided, the matched residues and their distances after the superposition are appended to the store.
+
+    transform_store: transform_store.TransformStore, Optional
+        If provided, the transformation matrix of the superposition is appended to the store.
+
+    warm_starts: transform_store.TransformGraph, Optional
+        If provided, the methods in ``WARM_START_METHODS`` start from the composed superposition of the pair, if it is good enough,
+        and the transformation matrix of the superposition is added to the graph.
+
+    failure_cache: str, Optional
+        Path of the SQLite database of the failures. If provided, the alignment is skipped, if it is known to fail,
+        otherwise a failure is classified and recorded (see ``failure_cache.py``).
+
+    failures: list, Optional
+        If provided, the exception of a failed alignment is appended, e.g. to classify the failure.
+
     Returns
     -------
     df: Pandas.DataFrame
@@ -183,92 +1015,116 @@ def compute_alignment(
         Counts the occurences of excepts while performing all alignments. 0 means, that there were no problems performing the alignemnts.
     """
 
-    print(counter, method, structure, mobile)
+    if telemetry is None:
+        print(counter, method, structure, mobile)
+    start = time.perf_counter()
+    failed = False
+    mode = "pocket" if pocket_index else "chain"
+    warm_start = False
     try:
+        user_select = [
+            f"backbone and name CA and segid {structure[4]}",
+            f"backbone and name CA and segid {mobile[4]}",
+        ]
+        if pocket_index:
+            # the pocket residues are selected by their residue number and insertion code
+            user_select = [
+                f"{user_select[0]} and resid {' '.join(pocket_index[(structure[0], structure[4])]['residues'])}",
+                f"{user_select[1]} and resid {' '.join(pocket_index[(mobile[0], mobile[4])]['residues'])}",
+            ]
+        if failure_cache is not None:
+            known = known_failure(failure_cache, structure, mobile, method)
+            if known:
+                raise KnownFailure(known[0], f"known failure: {known[1]}")
+        for i, pdb in enumerate([structure, mobile]):
+            # an empty selection fails in every run, so it is found before the alignment
+            if not benchmarking_structures[i].select_atoms(user_select[i]).n_atoms:
+                has_chain = benchmarking_structures[i].select_atoms(f"segid {pdb[4]}").n_atoms
+                raise AlignmentFailure(
+                    "empty_selection" if has_chain else "missing_chain",
+                    f"no CA atoms selected in {pdb[0]} chain {pdb[4]}",
+                    pdb,
+                )
         if method == "mda":
-            start_time = time.time()
-            result = api.align(
-                benchmarking_structures,
-                method=api.METHODS[method],
-                alignment_strategy="clustalo",
-                user_select=[
-                    f"backbone and name CA and segid {structure[4]}",
-                    f"backbone and name CA and segid {mobile[4]}",
-                ],
-            )
-            end_time = time.time()
+            method_kwargs = {"alignment_strategy": "clustalo"}
         elif method == "theseus":
-            start_time = time.time()
-            result = api.align(
-                benchmarking_structures,
-                method=api.METHODS[method],
-                sequence_alignment="CLUSTALO",
-                user_select=[
-                    f"backbone and name CA and segid {structure[4]}",
-                    f"backbone and name CA and segid {mobile[4]}",
-                ],
-            )
-            end_time = time.time()
+            method_kwargs = {"sequence_alignment": "CLUSTALO"}
         else:
-            start_time = time.time()
-            result = api.align(
-                benchmarking_structures,
-                method=api.METHODS[method],
-                user_select=[
-                    f"backbone and name CA and segid {structure[4]}",
-                    f"backbone and name CA and segid {mobile[4]}",
-                ],
+            method_kwargs = {}
+        aligned_structures = benchmarking_structures
+        if transform_store is not None or warm_starts is not None:
+            # the coordinates before the alignment, the methods may move the structures in place
+            before = [benchmarking_structures[i].select_atoms(user_select[i]).positions.copy() for i in range(2)]
+        if warm_starts is not None and method in WARM_START_METHODS:
+            seed = warm_starts.warm_start(structure[0], mobile[0], before[0], before[1])
+            if seed is not None:
+                # the alignment starts from the composed superposition, the loaded mobile structure is not changed,
+                # because it can be used by the next methods
+                aligned_structures = [benchmarking_structures[0], benchmarking_structures[1].copy()]
+                aligned_structures[1].atoms.transform(seed)
+                warm_start = True
+        # only the call of api.align is measured, the structures are already loaded
+        # and the wait for a free slot of the method (see resource_governor.py) is not measured
+        # transient failures, e.g. a timeout of an external program, are retried after a delay
+        with governed(method):
+            result, timing = retry_transient(
+                time_call,
+                superposition_api().align,
+                aligned_structures,
+                method=superposition_api().METHODS[method],
+                user_select=user_select,
+                warmup=warmup,
+                repeats=repeats,
+                **method_kwargs,
             )
-            end_time = time.time()
 
-        # if no alignment is found, set quality measures to NaN and add entry to DF
-        if result[0]["scores"]["coverage"] == 0:
-            df.loc[counter] = [
-                structure[0],
-                mobile[0],
-                method,
-                result[0]["scores"]["rmsd"],
-                result[0]["scores"]["coverage"],
-                result[0]["metadata"]["reference_size"],
-                result[0]["metadata"]["mobile_size"],
-                round(end_time - start_time, 4),
-                np.nan,
-                np.nan,
-                np.nan,
-            ]
-        # else calculate quality measures
+        rmsd = result[0]["scores"]["rmsd"]
+        coverage = result[0]["scores"]["coverage"]
+        if pocket_index:
+            reference_size = pocket_index[(structure[0], structure[4])]["pocket_size"]
+            mobile_size = pocket_index[(mobile[0], mobile[4])]["pocket_size"]
+        elif chain_index:
+            reference_size = chain_index[(structure[0], structure[4])]["ca_count"]
+            mobile_size = chain_index[(mobile[0], mobile[4])]["ca_count"]
         else:
-            si = (result[0]["scores"]["rmsd"] * min(result[0]["metadata"]["reference_size"],
-                                                    result[0]["metadata"]["mobile_size"])) / result[0]["scores"]["coverage"]
-            mi = 1 - ((1 + result[0]["scores"]["coverage"]) / ((1 + result[0]["scores"]["rmsd"] / w0) * (1 + min(result[0]["metadata"]["reference_size"], 
-                                                                                                                 result[0]["metadata"]["mobile_size"]))))
-            sas = (result[0]["scores"]["rmsd"] * 100) / result[0]["scores"]["coverage"]
-
-            # add alignment entry to DataFrame
-            df.loc[counter] = [
-                structure[0],
-                mobile[0],
-                method,
-                result[0]["scores"]["rmsd"],
-                result[0]["scores"]["coverage"],
-                result[0]["metadata"]["reference_size"],
-                result[0]["metadata"]["mobile_size"],
-                round(end_time - start_time, 4),
-                si,
-                mi,
-                sas,
-                structure[1],
-                structure[2],
-                structure[3],
-                structure[4],
-                mobile[1],
-                mobile[2],
-                mobile[3],
-                mobile[4],
-            ]
-    except:
+            reference_size = result[0]["metadata"]["reference_size"]
+            mobile_size = result[0]["metadata"]["mobile_size"]
+        # if no alignment is found, the quality measures are NaN
+        si, mi, sas = compute_quality_measures(rmsd, coverage, reference_size, mobile_size, w0)
+
+        # add alignment entry to DataFrame
+        df.loc[counter] = [
+            structure[0],
+            mobile[0],
+            method,
+            rmsd,
+            coverage,
+            reference_size,
+            mobile_size,
+            timing["time"],
+            si,
+            mi,
+            sas,
+            structure[1],
+            structure[2],
+            structure[3],
+            structure[4],
+            mobile[1],
+            mobile[2],
+            mobile[3],
+            mobile[4],
+            timing["time_median"],
+            timing["time_spread"],
+            mode,
+            warm_start,
+        ]
+    except Exception as e:
         # If there is an error, the counter is incremented and printed at the end to indicate how many
         # alignments did not work.
+        if failure_cache is not None and not isinstance(e, KnownFailure):
+            record_failure(failure_cache, structure, mobile, method, e)
+        if failures is not None:
+            failures.append(e)
         df.loc[counter] = [
             structure[0],
             mobile[0],
@@ -289,7 +1145,22 @@ def compute_alignment(
             mobile[2],
             mobile[3],
             mobile[4],
+            np.nan,
+            np.nan,
+            mode,
+            warm_start,
         ]
         except_counter += 1
+        failed = True
+    if residue_store is not None and not failed:
+        capture_deviations(residue_store, result[0], aligned_structures, user_select, structure, mobile, method)
+    if (transform_store is not None or warm_starts is not None) and not failed:
+        transform = superposition_transform(result[0], aligned_structures, user_select, before)
+        if transform_store is not None:
+            transform_store.append(structure[0], mobile[0], method, transform)
+        if warm_starts is not None:
+            warm_starts.add(structure[0], mobile[0], transform)
+    if telemetry is not None:
+        telemetry.record(method, time.perf_counter() - start, failed=failed)
     counter += 1
     return df, counter, except_counter
@@ -3,46 +3,179 @@ This script is called in ChimeraX to perform all alignments between structures o
 In this project sample sets represent kinase groups, so the alignments are performed between structures of one group.
 Before calling this script in ChimeraX, the path for the sample set has to be adjusted appropiately as well as the path where the logfile should be saved.
 This logfile is parsed afterwards using the "matchmaker_log_parser.py" script, to convert the results into a *.csv file similar to the other methods.
+The number of warm-up and measured alignments for every pair can be set by WARMUP and REPEATS.
+The sizes of the structures are taken from the chain index created by "structure_utils.build_chain_index",
+the path to the chain index needs to be adjusted as well.
+When the path to the pocket index created by "structure_utils.build_pocket_index" is provided,
+only the CA atoms of the KLIFS pocket are aligned (pocket mode).
+When the path to the cache folder of the PDB files is provided, the structures are opened from the cache folder instead of fetched,
+missing files are downloaded to the cache folder in the background ahead of their alignment (PREFETCH_DEPTH),
+so synthetic structures created by "synthetic_structures.py" can be aligned without network access.
 """
 # open this script in ChimeraX
 
 from chimerax.core.commands import run
+from chimerax.atomic import AtomsArg
+from chimerax.match_maker.match import cmd_match
+import os
+import sys
 import time
 
+# the helper modules are shared with the other drivers and located in the src folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from prefetch import prefetch
+from residue_store import ResidueStore, match_residues
+from structure_utils import fetch_pdb_file, read_chain_index, read_pocket_index, read_samples
+from telemetry import Telemetry
+from timing_utils import TIMING_SCOPES, format_timing, time_call
+from transform_store import TransformStore, alignment_transform
 
-structures = []
-with open("<PATH_TO_SAMPLE_SET>") as f:
-    # split line, so no newline characters are left
-    # then split lines into lists to get the same structure as in the benchmark for OpenCADD
-    temp = f.read().splitlines()
-    for line in temp:
-        struc = line.split(",")
-        structures.append(struc)
+# number of alignments before the measurement and number of measured alignments for every pair
+WARMUP = 0
+REPEATS = 1
 
-counter = 0
+# path of the metrics file written periodically during the run (None for no file), see "telemetry.py"
+# the progress line is written to stderr, so the log is not changed
+METRICS_PATH = None
+METRICS_FORMAT = "json"
+
+# number of PDB files downloaded ahead in a background thread, while the current pair is aligned (0 to disable),
+# only used with the cache folder of the PDB files
+PREFETCH_DEPTH = 4
+
+# folder of the store of the per-residue deviations (None for no capture), see "residue_store.py"
+RESIDUE_STORE = None
+
+# folder of the store of the 4x4 transformation matrices (None for no capture), see "transform_store.py"
+TRANSFORM_STORE = None
+
+
+# the paths can also be passed as arguments:
+# chimerax --nogui --exit --script "matchmaker_in_group_alignment.py <SAMPLE_SET> <CHAIN_INDEX> <LOGFILE> [<POCKET_INDEX> [<PDB_CACHE>]]"
+# with "-" as logfile, the log is not saved (without GUI the output is written to stdout)
+if len(sys.argv) > 3:
+    sample_path, chain_index_path, log_path = sys.argv[1:4]
+else:
+    sample_path = "<PATH_TO_SAMPLE_SET>"
+    chain_index_path = "<PATH_TO_CHAIN_INDEX>"
+    log_path = "<PATH_WHERE_TO_STORE_THE_LOGFILE>"
+# the pocket mode is used, when the path to the pocket index is provided ("-" for the alignment of the complete chains)
+pocket_index_path = sys.argv[4] if len(sys.argv) > 4 and sys.argv[4] != "-" else None
+cache_dir = sys.argv[5] if len(sys.argv) > 5 else None
+
+structures = read_samples(sample_path)
+
+# sizes of all structures, computed once for all methods
+chain_index = read_chain_index(chain_index_path)
+pocket_index = read_pocket_index(pocket_index_path) if pocket_index_path else None
+
+
+def atom_spec(model, structure):
+    spec = f"#{model}/{structure[4]}"
+    if pocket_index:
+        # only the residues of the KLIFS pocket, the residues are selected by their number and insertion code
+        spec += f":{','.join(pocket_index[(structure[0], structure[4])]['residues'])}"
+    return f"{spec}@ca"
 
-# iterate through all structures of the samples
-for structure in structures:
-    for mobile in structures[structures.index(structure) + 1 :]:
-        # fetch pdb file with only the first model and get the length of structures (amount of CA)
 
+# pairs in the order of the alignments
+pairs = [(structure, mobile) for i, structure in enumerate(structures) for mobile in structures[i + 1 :]]
+# with the cache folder, the PDB files are prefetched in the background in the order in which the structures are opened,
+# missing files are downloaded to the cache folder, otherwise the structures are fetched by ChimeraX
+pdb_files = (
+    prefetch(
+        [pdb[0] for pair in pairs for pdb in pair],
+        lambda pdb_id: fetch_pdb_file(pdb_id, cache_dir),
+        depth=PREFETCH_DEPTH,
+    )
+    if cache_dir
+    else None
+)
+
+
+def open_structure(structure):
+    if pdb_files:
+        run(session, f'open "{next(pdb_files)}" maxModels 1')
+    else:
         run(session, f"open {structure[0]} format pdb maxModels 1")
-        print(f"reference: {structure} ")
-        run(session, f"select #1/{structure[4]}@ca")
-        run(session, f"open {mobile[0]} format pdb maxModels 1")
-        print(f"mobile: {mobile} ")
-        run(session, f"select #2/{mobile[4]}@ca")
-        # run alignment on the selected chains and only CA without any cutoff score, so a global alignment is performed
-        print(f"\nalignment: {counter} ")
-        start_time = time.time()
-        run(session, f"mmaker #1/{structure[4]}@ca to #2/{mobile[4]}@ca cut None")
-        end_time = time.time()
-        duration = round(end_time - start_time, 4)
-        print(f"time: {duration} ")
-        counter += 1
-        # reset
-        run(session, "close #1")
-        run(session, "close #2")
+
+
+def size(structure):
+    if pocket_index:
+        return pocket_index[(structure[0], structure[4])]["pocket_size"]
+    return chain_index[(structure[0], structure[4])]["ca_count"]
+
+
+residue_store = ResidueStore(RESIDUE_STORE) if RESIDUE_STORE else None
+transform_store = TransformStore(TRANSFORM_STORE) if TRANSFORM_STORE else None
+counter = 0
+telemetry = Telemetry(len(pairs), metrics_path=METRICS_PATH, metrics_format=METRICS_FORMAT)
+print(f"timing_scope: {TIMING_SCOPES['matchmaker']} ")
+print(f"mode: {'pocket' if pocket_index else 'chain'} ")
+
+# the pairs are aligned in the order of the prefetched PDB files, also with duplicate structures in the samples
+for structure, mobile in pairs:
+    start = time.perf_counter()
+    # fetch pdb file with only the first model, the length of the structures is taken from the chain index
+
+    open_structure(structure)
+    print(f"reference: {structure} ")
+    print(f"reference_size: {size(structure)} ")
+    open_structure(mobile)
+    print(f"mobile: {mobile} ")
+    print(f"mobile_size: {size(mobile)} ")
+    # run alignment on the selected chains and only CA without any cutoff score, so a global alignment is performed
+    # equivalent to "mmaker #1/<chain>@ca to #2/<chain>@ca cut None"
+    # the atom specs are parsed before the measurement, so only the matchmaker call is measured
+    match_atoms = AtomsArg.parse(atom_spec(1, structure), session)[0]
+    to_atoms = AtomsArg.parse(atom_spec(2, mobile), session)[0]
+    if transform_store:
+        before = [match_atoms.scene_coords.copy(), to_atoms.scene_coords.copy()]
+    print(f"\nalignment: {counter} ")
+    _, timing = time_call(
+        cmd_match,
+        session,
+        match_atoms,
+        to=to_atoms,
+        cutoff_distance=None,
+        warmup=WARMUP,
+        repeats=REPEATS,
+    )
+    print(f"time: {timing['time']} ")
+    print(f"{format_timing(timing)} ")
+    counter += 1
+    if residue_store:
+        # matchmaker moves the reference structure onto the mobile structure
+        reference_positions, mobile_positions, distances = match_residues(
+            match_atoms.scene_coords, to_atoms.scene_coords
+        )
+        residue_store.append(
+            structure[0],
+            mobile[0],
+            "matchmaker",
+            match_atoms.residues.numbers[reference_positions],
+            to_atoms.residues.numbers[mobile_positions],
+            distances,
+        )
+    if transform_store:
+        transform_store.append(
+            structure[0],
+            mobile[0],
+            "matchmaker",
+            alignment_transform(before[0], match_atoms.scene_coords, before[1], to_atoms.scene_coords),
+        )
+    # reset
+    run(session, "close #1")
+    run(session, "close #2")
+    # wall time of the pair including loading, the measured alignment time is in the log
+    telemetry.record("matchmaker", time.perf_counter() - start)
+
+telemetry.update()
+if residue_store:
+    residue_store.close()
+if transform_store:
+    transform_store.close()
 
 # save logfile
-run(session, 'log save "<PATH_WHERE_TO_STORE_THE_LOGFILE>"')
+if log_path != "-":
+    run(session, f'log save "{log_path}"')
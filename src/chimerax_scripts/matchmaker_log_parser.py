@@ -7,155 +7,178 @@ For this project the csv file is saved in the `data/ChimeraX_results` folder.
 
 import pandas as pd
 import numpy as np
+import ast
+import html
+import os
+import sys
 
+# the helper modules are shared with the other methods and located in the src folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from results_utils import RESULT_COLUMNS, compute_quality_measures
+from timing_utils import parse_timing
 
-# get the logfile
-with open("<PATH_TO_LOGFILE>") as f:
-    lines = f.readlines()
-
-    ref_ids = []
-    ref_names = []
-    ref_groups = []
-    ref_species_list = []
-    ref_chains = []
-    mob_ids = []
-    mob_names = []
-    mob_groups = []
-    mob_species_list = []
-    mob_chains = []
-    residuesize_list = []
-    alignment_list = []
-    cov_list = []
-    rmsd_list = []
-    time_list = []
 
+def _parse_structure(line):
+    # the quotes of the printed list are escaped in the saved logfile, e.g. [&#x27;6itj&#x27;, ...
+    # but not in the output written to stdout without GUI
+    line = html.unescape(line)
+    return ast.literal_eval(line[line.index("[") : line.index("]") + 1])
+
+
+def parse_log(log_path):
+    """
+    Parses the logfile of the ChimeraX alignment scripts.
+
+    Parameters
+    ----------
+    log_path: str
+        Path of the logfile.
+
+    Returns
+    -------
+    list
+        Contains a dict for every alignment with the information of the structures,
+        the sizes, the RMSD, the coverage, the timing and the mode.
+    """
+
+    with open(str(log_path)) as f:
+        lines = f.readlines()
+
+    alignments = []
+    entry = {}
+    # logs created before the pocket mode was introduced contain alignments of the complete chains
+    mode = "chain"
     # iterate over the lines
     for line in lines:
+        # get the residues used in the alignments, the complete chains or the KLIFS pocket
+        if line.startswith("mode: "):
+            mode = line.split(" ")[1].strip()
         # get metadata for reference structure
-        if "reference: " in line:
-            line = line.split(";")
-            ref_ids.append(line[1][:-5])
-            ref_names.append(line[3][:-5])
-            ref_groups.append(line[5][:-5])
-            ref_species_list.append(line[7][:-5])
-            ref_chains.append(line[9][:-5])
+        elif "reference: " in line:
+            entry = {"reference": _parse_structure(line), "sizes": [], "mode": mode}
         # get metadata for mobile structure
         elif "mobile: " in line:
-            line = line.split(";")
-            mob_ids.append(line[1][:-5])
-            mob_names.append(line[3][:-5])
-            mob_groups.append(line[5][:-5])
-            mob_species_list.append(line[7][:-5])
-            mob_chains.append(line[9][:-5])
-        # get size of structure
+            entry["mobile"] = _parse_structure(line)
+        # get size of structure from the chain index
+        elif "reference_size: " in line:
+            entry["sizes"].append(int(line.split("reference_size: ")[1].split()[0]))
+        elif "mobile_size: " in line:
+            entry["sizes"].append(int(line.split("mobile_size: ")[1].split()[0]))
+        # get size of structure from the selection, for logfiles created before the chain index was introduced
         elif "residues," in line:
             try:
                 res = line.split(" ")
-                residuesize_list.append(int(res[10]))
+                entry["sizes"].append(int(res[10]))
             except:
                 print(line)
-        elif line.startswith("alignment: "):
-            alignment_list.append(line.split(" ")[1])
         # get RMSD and coverage of the alignment
+        # with repeated measurements every call logs the result, the values of the last call are kept
         elif line.startswith("RMSD"):
             line = line.split(" ")
-            cov_list.append(int(line[2]))
-            rmsd_list.append(float(line[6]))  # without cutoff
-        # when the coverage is really low, we take the values from this line. Should not occur in best case.
+            entry["coverage"] = int(line[2])
+            entry["rmsd"] = float(line[6])  # without cutoff
+        # when the coverage is really low, no alignment is found. Should not occur in best case.
+        # the RMSD is NaN like for the failed alignments of the other methods, not 0
         elif "Fewer" in line:
-            cov_list.append(0)
-            rmsd_list.append(0)
+            entry["coverage"] = 0
+            entry["rmsd"] = np.nan
         # get the time required to compute the alignment
         elif "time: " in line:
-            time_list.append(float(line.split(" ")[1]))
-
-
-# create emptry dataframe
-df = pd.DataFrame(
-    columns=[
-        "reference_id",
-        "mobile_id",
-        "method",
-        "rmsd",
-        "coverage",
-        "reference_size",
-        "mobile_size",
-        "time",
-        "SI",
-        "MI",
-        "SAS",
-        "ref_name",
-        "ref_group",
-        "ref_species",
-        "ref_chain",
-        "mob_name",
-        "mob_group",
-        "mob_species",
-        "mob_chain",
-    ]
-)
-
-counter_struc = 0
-method = "matchmaker"
-w0 = 1.5
-
-counter = 0
-# iterate through the alignments and append them to the dataframe
-for al in range(len(alignment_list)):
-    ref = ref_ids[al]
-    ref_size = residuesize_list[al + counter_struc]
-    counter_struc += 1
-    mob = mob_ids[al]
-    mob_size = residuesize_list[al + counter_struc]
-
-    rmsd = round(rmsd_list[al], 4)
-    cov = cov_list[al]
-    time = round(time_list[al], 4)
-
-    # when coverage and RMSD are 0, the quality measures can not be computed
-    if cov == 0 and rmsd == 0:
-        si = np.nan
-        mi = np.nan
-        sas = np.nan
-    # compute quality measures
+            # logs created before the timing harness was introduced only contain the time of a single alignment
+            entry["timing"] = {
+                "time": float(line.split(" ")[1]),
+                "time_median": np.nan,
+                "time_spread": np.nan,
+            }
+            alignments.append(entry)
+        elif "timing: " in line:
+            entry["timing"] = parse_timing(line)
+    return alignments
+
+
+def create_results(alignments, w0=1.5, chain_index=None):
+    """
+    Creates the result DataFrame from the parsed alignments.
+
+    Parameters
+    ----------
+    alignments: list
+        The alignments returned by ``parse_log``.
+
+    w0: float, Optional
+        The value for the normalization factor for MI. Default is set to 1.5 analog to the other methods.
+
+    chain_index: dict, Optional
+        The chain index returned by ``structure_utils.read_chain_index``.
+        If provided, the sizes of the structures are taken from the index instead of the logfile.
+        The sizes of alignments in the pocket mode are always taken from the logfile.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        Contains one row for every alignment.
+    """
+
+    method = "matchmaker"
+    rows = []
+    # iterate through the alignments and append them to the dataframe
+    for alignment in alignments:
+        structure = alignment["reference"]
+        mobile = alignment["mobile"]
+        if chain_index and alignment["mode"] == "chain":
+            ref_size = chain_index[(structure[0], structure[4])]["ca_count"]
+            mob_size = chain_index[(mobile[0], mobile[4])]["ca_count"]
+        else:
+            ref_size, mob_size = alignment["sizes"][:2]
+
+        rmsd = round(alignment["rmsd"], 4)
+        cov = alignment["coverage"]
+        time = round(alignment["timing"]["time"], 4)
+
+        # when coverage and RMSD are 0, the quality measures can not be computed
+        si, mi, sas = [
+            round(value, 4) for value in compute_quality_measures(rmsd, cov, ref_size, mob_size, w0)
+        ]
+
+        # append alignment to dataframe
+        rows.append(
+            [
+                structure[0],
+                mobile[0],
+                method,
+                rmsd,
+                cov,
+                ref_size,
+                mob_size,
+                time,
+                si,
+                mi,
+                sas,
+                structure[1],
+                structure[2],
+                structure[3],
+                structure[4],
+                mobile[1],
+                mobile[2],
+                mobile[3],
+                mobile[4],
+                alignment["timing"]["time_median"],
+                alignment["timing"]["time_spread"],
+                alignment["mode"],
+                # the alignments in ChimeraX are not warm-started
+                False,
+            ]
+        )
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+
+if __name__ == "__main__":
+    # the paths can also be passed as arguments: "python3 matchmaker_log_parser.py <LOGFILE> <RESULT.csv>"
+    if len(sys.argv) > 2:
+        log_path, result_path = sys.argv[1:3]
     else:
-        si = round((rmsd * min(ref_size, mob_size)) / cov, 4)
-        mi = round(1 - ((1 + cov) / ((1 + (rmsd / w0)) * (1 + min(ref_size, mob_size)))), 4)
-        sas = round((rmsd * 100) / cov, 4)
-
-    ref_name = ref_names[al]
-    ref_group = ref_groups[al]
-    ref_species = ref_species_list[al]
-    ref_chain = ref_chains[al]
-    mob_name = mob_names[al]
-    mob_group = mob_groups[al]
-    mob_species = mob_species_list[al]
-    mob_chain = mob_chains[al]
-
-    # append alignment to dataframe
-    df.loc[al] = [
-        ref,
-        mob,
-        method,
-        rmsd,
-        cov,
-        ref_size,
-        mob_size,
-        time,
-        si,
-        mi,
-        sas,
-        ref_name,
-        ref_group,
-        ref_species,
-        ref_chain,
-        mob_name,
-        mob_group,
-        mob_species,
-        mob_chain,
-    ]
-
-    counter += 1
-
-# write dataframe to file
-df.to_csv("<PATH_FOR_RESULT.csv>", mode="w", header=False, index=False)
+        log_path = "<PATH_TO_LOGFILE>"
+        result_path = "<PATH_FOR_RESULT.csv>"
+    # write dataframe to file
+    df = create_results(parse_log(log_path))
+    df.to_csv(result_path, mode="w", header=False, index=False)
@@ -0,0 +1,131 @@
+"""
+This script is called in ChimeraX to perform the alignments of a work queue created by "work_queue.py" (method "matchmaker"),
+so the alignments can be spread over several machines. Every machine runs this script with its own logfile,
+the script claims jobs from the queue until no job is left. Jobs of a stopped machine are claimed again after their lease expired.
+Every logfile is parsed afterwards using the "matchmaker_log_parser.py" script.
+The number of warm-up and measured alignments for every pair can be set by WARMUP and REPEATS.
+When the path to the pocket index created by "structure_utils.build_pocket_index" is provided,
+only the CA atoms of the KLIFS pocket are aligned (pocket mode).
+When the path to the cache folder of the PDB files is provided, the structures are opened from the cache folder instead of fetched.
+"""
+# open this script in ChimeraX
+
+from chimerax.core.commands import run
+from chimerax.atomic import AtomsArg
+from chimerax.match_maker.match import cmd_match
+import os
+import sys
+import time
+
+# the helper modules are shared with the other drivers and located in the src folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from failure_cache import DETERMINISTIC, classify_failure
+from structure_utils import fetch_pdb_file, read_chain_index, read_pocket_index
+from telemetry import Telemetry
+from timing_utils import TIMING_SCOPES, format_timing, time_call
+from work_queue import claim_jobs, complete_job, default_worker, fail_job, queue_status, release_jobs
+
+# number of alignments before the measurement and number of measured alignments for every pair
+WARMUP = 0
+REPEATS = 1
+
+# path of the metrics file written periodically during the run (None for no file), see "telemetry.py"
+METRICS_PATH = None
+METRICS_FORMAT = "json"
+
+# number of jobs claimed at once and number of seconds they are reserved for this machine
+QUEUE_BATCH = 10
+QUEUE_LEASE = 600
+
+# chimerax --nogui --exit --script "matchmaker_queue_alignment.py <QUEUE> <CHAIN_INDEX> <LOGFILE> [<POCKET_INDEX> [<PDB_CACHE>]]"
+# with "-" as logfile, the log is not saved (without GUI the output is written to stdout)
+queue_path, chain_index_path, log_path = sys.argv[1:4]
+# the pocket mode is used, when the path to the pocket index is provided ("-" for the alignment of the complete chains)
+pocket_index_path = sys.argv[4] if len(sys.argv) > 4 and sys.argv[4] != "-" else None
+cache_dir = sys.argv[5] if len(sys.argv) > 5 else None
+
+chain_index = read_chain_index(chain_index_path)
+pocket_index = read_pocket_index(pocket_index_path) if pocket_index_path else None
+worker = default_worker()
+
+
+def atom_spec(model, structure):
+    spec = f"#{model}/{structure[4]}"
+    if pocket_index:
+        # only the residues of the KLIFS pocket, the residues are selected by their number and insertion code
+        spec += f":{','.join(pocket_index[(structure[0], structure[4])]['residues'])}"
+    return f"{spec}@ca"
+
+
+def open_structure(structure):
+    if cache_dir:
+        run(session, f'open "{fetch_pdb_file(structure[0], cache_dir)}" maxModels 1')
+    else:
+        run(session, f"open {structure[0]} format pdb maxModels 1")
+
+
+def size(structure):
+    if pocket_index:
+        return pocket_index[(structure[0], structure[4])]["pocket_size"]
+    return chain_index[(structure[0], structure[4])]["ca_count"]
+
+
+counter = 0
+telemetry = Telemetry(
+    sum(queue_status(queue_path).get("matchmaker", {}).get(status, 0) for status in ["pending", "running"]),
+    metrics_path=METRICS_PATH,
+    metrics_format=METRICS_FORMAT,
+)
+print(f"timing_scope: {TIMING_SCOPES['matchmaker']} ")
+print(f"mode: {'pocket' if pocket_index else 'chain'} ")
+
+try:
+    jobs = claim_jobs(queue_path, worker, methods=["matchmaker"], count=QUEUE_BATCH, lease=QUEUE_LEASE)
+    while jobs:
+        for job in jobs:
+            structure, mobile = job["structure"], job["mobile"]
+            start = time.perf_counter()
+            try:
+                open_structure(structure)
+                print(f"reference: {structure} ")
+                print(f"reference_size: {size(structure)} ")
+                open_structure(mobile)
+                print(f"mobile: {mobile} ")
+                print(f"mobile_size: {size(mobile)} ")
+                # the atom specs are parsed before the measurement, so only the matchmaker call is measured
+                match_atoms = AtomsArg.parse(atom_spec(1, structure), session)[0]
+                to_atoms = AtomsArg.parse(atom_spec(2, mobile), session)[0]
+                print(f"\nalignment: {counter} ")
+                _, timing = time_call(
+                    cmd_match,
+                    session,
+                    match_atoms,
+                    to=to_atoms,
+                    cutoff_distance=None,
+                    warmup=WARMUP,
+                    repeats=REPEATS,
+                )
+            except Exception as e:
+                # the log parser only keeps alignments with a time, the job is returned to the queue
+                # for another attempt, unless the failure is deterministic, e.g. an empty selection
+                category = classify_failure(e)
+                fail_job(queue_path, job["id"], f"{category}: {e!r}", worker, deterministic=category in DETERMINISTIC)
+                telemetry.record("matchmaker", time.perf_counter() - start, failed=True)
+                run(session, "close")
+                continue
+            print(f"time: {timing['time']} ")
+            print(f"{format_timing(timing)} ")
+            counter += 1
+            run(session, "close #1")
+            run(session, "close #2")
+            # the results are in the log, the queue only records that the job is done
+            complete_job(queue_path, job["id"], worker)
+            telemetry.record("matchmaker", time.perf_counter() - start)
+        jobs = claim_jobs(queue_path, worker, methods=["matchmaker"], count=QUEUE_BATCH, lease=QUEUE_LEASE)
+finally:
+    release_jobs(queue_path, worker)
+    telemetry.update()
+
+# save logfile
+if log_path != "-":
+    run(session, f'log save "{log_path}"')
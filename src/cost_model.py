@@ -0,0 +1,260 @@
+"""
+Provides runtime models of the methods fitted on previous results, e.g. for the capacity planning of large benchmarks.
+
+The time of an alignment is modelled per method as a power law of the sizes of both structures,
+fitted by a linear regression in log-log space:
+    log(time) = intercept + exp_reference * log(reference_size) + exp_mobile * log(mobile_size)
+The sum of both exponents is the exponent of the product of the sizes.
+"""
+
+import numpy as np
+import pandas as pd
+
+# columns of the DataFrame returned by fit_cost_models
+MODEL_COLUMNS = ["intercept", "exp_reference", "exp_mobile", "residual_std", "r2", "n"]
+
+
+def _valid_rows(all_methods_df):
+    # failed alignments have no time, the logarithm requires positive values
+    df = all_methods_df.dropna(subset=["time", "reference_size", "mobile_size"])
+    return df[(df["time"] > 0) & (df["reference_size"] > 0) & (df["mobile_size"] > 0)]
+
+
+def fit_cost_models(all_methods_df):
+    """
+    Fits the runtime model of every method.
+
+    Parameters
+    ----------
+    all_methods_df : Pandas.DataFrame
+
+    Returns
+    -------
+    Pandas.DataFrame
+        Contains one row for every method with the coefficients of the model, the standard deviation of the residuals
+        (in natural log space), the coefficient of determination and the number of alignments used for the fit.
+    """
+
+    models = {}
+    for method, df in _valid_rows(all_methods_df).groupby("method"):
+        y = np.log(df["time"].to_numpy(dtype=float))
+        x = np.column_stack(
+            [
+                np.ones(len(df)),
+                np.log(df["reference_size"].to_numpy(dtype=float)),
+                np.log(df["mobile_size"].to_numpy(dtype=float)),
+            ]
+        )
+        # lstsq returns the minimum norm solution, if the sizes are not varied enough to determine both exponents
+        coefficients = np.linalg.lstsq(x, y, rcond=None)[0]
+        residuals = y - x @ coefficients
+        total = np.sum((y - y.mean()) ** 2)
+        models[method] = list(coefficients) + [
+            residuals.std(ddof=min(3, len(df) - 1)) if len(df) > 1 else 0.0,
+            1 - np.sum(residuals ** 2) / total if total > 0 else np.nan,
+            len(df),
+        ]
+    return pd.DataFrame.from_dict(models, orient="index", columns=MODEL_COLUMNS).rename_axis("method")
+
+
+def predict_cost(models, method, reference_size, mobile_size, mean=False):
+    """
+    Predicts the time of alignments with the model of a method.
+
+    Parameters
+    ----------
+    models: Pandas.DataFrame
+        The models returned by ``fit_cost_models``.
+
+    method: str
+        The method.
+
+    reference_size: int or numpy.ndarray
+        Size(s) of the reference structures.
+
+    mobile_size: int or numpy.ndarray
+        Size(s) of the mobile structures.
+
+    mean: bool, Optional
+        If True, the expected time is returned, which is larger than the median for log-normal residuals
+        and should be used to predict the sum of many alignments. Default is False (median time).
+
+    Returns
+    -------
+    float or numpy.ndarray
+        The predicted time in seconds.
+    """
+
+    model = models.loc[method]
+    log_time = (
+        model["intercept"]
+        + model["exp_reference"] * np.log(np.asarray(reference_size, dtype=float))
+        + model["exp_mobile"] * np.log(np.asarray(mobile_size, dtype=float))
+    )
+    if mean:
+        log_time = log_time + model["residual_std"] ** 2 / 2
+    return np.exp(log_time)
+
+
+def cost_function(models, method, mean=False):
+    """
+    Returns the predicted-cost function of a method, e.g. to estimate the cost of the jobs before a run.
+
+    Parameters
+    ----------
+    models: Pandas.DataFrame
+        The models returned by ``fit_cost_models``.
+
+    method: str
+        The method.
+
+    mean: bool, Optional
+        See ``predict_cost``. Default is False.
+
+    Returns
+    -------
+    function
+        Takes the sizes of the reference and the mobile structure and returns the predicted time in seconds.
+    """
+
+    def cost(reference_size, mobile_size):
+        return predict_cost(models, method, reference_size, mobile_size, mean=mean)
+
+    return cost
+
+
+def compute_residuals(all_methods_df, models):
+    """
+    Computes the residuals of the models for all alignments.
+
+    Parameters
+    ----------
+    all_methods_df : Pandas.DataFrame
+
+    models: Pandas.DataFrame
+        The models returned by ``fit_cost_models``.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        The alignments with the columns "predicted_time", "time_ratio" (measured / predicted time)
+        and "z_score" (residual in log space divided by the standard deviation of the residuals of the method).
+    """
+
+    df = _valid_rows(all_methods_df)
+    df = df[df["method"].isin(models.index)].copy()
+    # the predictions are assigned by position, the index may contain duplicates, e.g. of concatenated result files
+    predicted = np.full(len(df), np.nan)
+    methods = df["method"].to_numpy()
+    for method in pd.unique(methods):
+        selected = methods == method
+        predicted[selected] = predict_cost(
+            models, method, df["reference_size"].to_numpy()[selected], df["mobile_size"].to_numpy()[selected]
+        )
+    df["predicted_time"] = predicted
+    df["time_ratio"] = df["time"] / df["predicted_time"]
+    std = df["method"].map(models["residual_std"]).replace(0, np.nan)
+    df["z_score"] = np.log(df["time_ratio"]) / std
+    return df
+
+
+def residual_report(all_methods_df, models, threshold=3.0):
+    """
+    Summarizes the residuals of the models for every method.
+
+    Parameters
+    ----------
+    all_methods_df : Pandas.DataFrame
+
+    models: Pandas.DataFrame
+        The models returned by ``fit_cost_models``.
+
+    threshold: float, Optional
+        The z-score above which an alignment is counted as outlier, see ``flag_outliers``. Default is 3.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        Contains the exponents, r2, the median and the 95th percentile of the time ratio
+        and the number of outliers for every method.
+    """
+
+    residuals = compute_residuals(all_methods_df, models)
+    grouped = residuals.groupby("method")
+    report = models[["exp_reference", "exp_mobile", "r2", "n"]].copy()
+    report["median_ratio"] = grouped["time_ratio"].median()
+    report["p95_ratio"] = grouped["time_ratio"].quantile(0.95)
+    report["outliers"] = grouped["z_score"].apply(lambda z: int((z > threshold).sum()))
+    return round(report, 4)
+
+
+def flag_outliers(all_methods_df, models, threshold=3.0):
+    """
+    Returns the alignments whose time is far above the prediction of the model of the method.
+
+    Parameters
+    ----------
+    all_methods_df : Pandas.DataFrame
+
+    models: Pandas.DataFrame
+        The models returned by ``fit_cost_models``.
+
+    threshold: float, Optional
+        Minimal z-score of the residual of an outlier. Default is 3.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        The outliers sorted by the z-score with the columns added by ``compute_residuals``.
+    """
+
+    residuals = compute_residuals(all_methods_df, models)
+    return residuals[residuals["z_score"] > threshold].sort_values("z_score", ascending=False)
+
+
+def estimate_run_time(models, sizes1, sizes2=None, methods=None):
+    """
+    Estimates the total time of all alignments of a benchmark before running it.
+
+    Parameters
+    ----------
+    models: Pandas.DataFrame
+        The models returned by ``fit_cost_models``.
+
+    sizes1: list
+        Sizes of the structures of the first sample set.
+
+    sizes2: list, Optional
+        Sizes of the structures of the second sample set. If not provided, the alignments between the structures
+        of the first sample set are estimated (like in the within-group benchmark).
+
+    methods: list, Optional
+        The methods. Default are all methods of the models.
+
+    Returns
+    -------
+    Pandas.Series
+        The expected total time of every method in seconds.
+
+    .. note::
+
+        The sums over all pairs are computed without creating the pairs, e.g. all-vs-all of 2000 structures
+        (about 2 million pairs per method) takes milliseconds.
+    """
+
+    methods = list(models.index) if methods is None else methods
+    sizes1 = np.asarray(sizes1, dtype=float)
+    sizes2 = None if sizes2 is None else np.asarray(sizes2, dtype=float)
+    totals = {}
+    for method in methods:
+        model = models.loc[method]
+        factor = np.exp(model["intercept"] + model["residual_std"] ** 2 / 2)
+        reference = sizes1 ** model["exp_reference"]
+        if sizes2 is not None:
+            # sum over all pairs of the product of both terms is the product of the sums
+            totals[method] = factor * reference.sum() * (sizes2 ** model["exp_mobile"]).sum()
+        else:
+            # pairs (i, j) with i < j, the structure i is the reference structure
+            mobile = sizes1 ** model["exp_mobile"]
+            totals[method] = factor * np.sum(reference[:-1] * np.cumsum(mobile[::-1])[::-1][1:])
+    return pd.Series(totals, name="time")
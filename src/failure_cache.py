@@ -0,0 +1,346 @@
+"""
+Provides the classification of failed alignments and a persistent negative cache of the known-bad structures and pairs.
+
+Every failure is classified into a category and recorded with its message in a SQLite database.
+Deterministic failures (e.g. a missing chain, an empty selection or a failed sequence alignment) fail again in every run,
+so they are added to the negative cache, which is keyed by (pdb, chain, method, version), and later runs skip them
+without paying the cost of the alignment again. Failures of a single structure are keyed by its PDB-ID and chain,
+failures of a pair by "<reference_id>-<mobile_id>" and "<reference_chain>-<mobile_chain>".
+The version of the method is part of the key, so the failures are retried with a new version of the method.
+Transient failures (e.g. a timeout, missing resources or an external program killed by a signal) are retried
+with a growing delay and not cached.
+Only the standard library is used.
+"""
+
+import argparse
+import errno
+import importlib.metadata
+import os
+import sqlite3
+import subprocess
+import time
+import urllib.error
+from collections import Counter
+
+# failures, which occur in every run with the same structures and method
+DETERMINISTIC = ["missing_chain", "empty_selection", "sequence_alignment", "program_error"]
+
+# failures, which may not occur in the next attempt
+TRANSIENT = ["timeout", "network", "resource"]
+
+# other failures are recorded, but neither cached nor retried
+UNKNOWN = "unknown"
+
+# error numbers of missing resources of the operating system
+RESOURCE_ERRNOS = {errno.EAGAIN, errno.ENOMEM, errno.EMFILE, errno.ENFILE, errno.ENOSPC}
+
+# number of retries of transient failures and the delay before the first retry in seconds, doubled for every retry
+RETRIES = 2
+RETRY_DELAY = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS failures (
+    pdb TEXT NOT NULL,
+    chain TEXT NOT NULL,
+    method TEXT NOT NULL,
+    version TEXT NOT NULL,
+    category TEXT NOT NULL,
+    message TEXT,
+    deterministic INTEGER NOT NULL,
+    reference_id TEXT,
+    mobile_id TEXT,
+    recorded REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS failures_key ON failures (pdb, chain, method, version, deterministic);
+"""
+
+
+class AlignmentFailure(Exception):
+    """
+    A classified failure of an alignment.
+
+    Parameters
+    ----------
+    category: str
+        The category, one of ``DETERMINISTIC``, ``TRANSIENT`` or ``UNKNOWN``.
+
+    message: str
+        Description of the failure.
+
+    structure: list, Optional
+        The structure causing the failure, if the failure is caused by one structure and not by the pair.
+    """
+
+    def __init__(self, category, message, structure=None):
+        super().__init__(message)
+        self.category = category
+        self.structure = structure
+
+
+class KnownFailure(AlignmentFailure):
+    """
+    An alignment skipped, because it is in the negative cache.
+    """
+
+
+def classify_failure(exception):
+    """
+    Classifies the exception of a failed alignment.
+
+    Parameters
+    ----------
+    exception: Exception
+        The exception.
+
+    Returns
+    -------
+    str
+        The category.
+    """
+
+    if isinstance(exception, AlignmentFailure):
+        return exception.category
+    message = str(exception).lower()
+    if isinstance(exception, (TimeoutError, subprocess.TimeoutExpired)):
+        return "timeout"
+    if isinstance(exception, (ConnectionError, urllib.error.URLError)) and not isinstance(
+        exception, urllib.error.HTTPError
+    ):
+        return "network"
+    if isinstance(exception, MemoryError) or (
+        isinstance(exception, OSError) and exception.errno in RESOURCE_ERRNOS
+    ):
+        return "resource"
+    if isinstance(exception, subprocess.CalledProcessError) and exception.returncode < 0:
+        # the external program was killed by a signal, e.g. by the OOM killer, only clean exits are deterministic
+        return "resource"
+    if "clustal" in message or "sequence alignment" in message:
+        return "sequence_alignment"
+    if isinstance(exception, subprocess.CalledProcessError):
+        command = " ".join(exception.cmd) if isinstance(exception.cmd, (list, tuple)) else str(exception.cmd)
+        return "sequence_alignment" if "clustal" in command.lower() else "program_error"
+    if "selection" in message and ("empty" in message or "no atoms" in message):
+        return "empty_selection"
+    return UNKNOWN
+
+
+def method_version(method):
+    """
+    Returns the version of the package of a method.
+
+    Parameters
+    ----------
+    method: str
+        The method, the OpenCADD methods are versioned by the version of OpenCADD.
+
+    Returns
+    -------
+    str
+        The version, "unknown" if the package is not installed.
+    """
+
+    package = {"pymol": "pymol", "pymol_refined": "pymol", "matchmaker": "ChimeraX"}.get(method, "opencadd")
+    try:
+        return importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def _connect(cache_path):
+    connection = sqlite3.connect(str(cache_path), timeout=60)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def failure_keys(structure, mobile):
+    """
+    Returns the keys (pdb, chain) of the structures and of the pair.
+
+    Parameters
+    ----------
+    structure: list
+        The reference structure.
+
+    mobile: list
+        The mobile structure.
+
+    Returns
+    -------
+    list
+        The keys of the reference structure, the mobile structure and the pair.
+    """
+
+    return [
+        (structure[0], structure[4]),
+        (mobile[0], mobile[4]),
+        (f"{structure[0]}-{mobile[0]}", f"{structure[4]}-{mobile[4]}"),
+    ]
+
+
+def record_failure(cache_path, structure, mobile, method, exception):
+    """
+    Records a failed alignment, deterministic failures are added to the negative cache.
+
+    Parameters
+    ----------
+    cache_path: str
+        Path of the SQLite database, created if it does not exist.
+
+    structure: list
+        The reference structure.
+
+    mobile: list
+        The mobile structure.
+
+    method: str
+        The method.
+
+    exception: Exception
+        The exception of the failure.
+
+    Returns
+    -------
+    str
+        The category of the failure.
+    """
+
+    category = classify_failure(exception)
+    if isinstance(exception, AlignmentFailure) and exception.structure is not None:
+        pdb, chain = exception.structure[0], exception.structure[4]
+    else:
+        pdb, chain = failure_keys(structure, mobile)[2]
+    connection = _connect(cache_path)
+    try:
+        with connection:
+            connection.execute(
+                "INSERT INTO failures VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    pdb,
+                    chain,
+                    method,
+                    method_version(method),
+                    category,
+                    f"{type(exception).__name__}: {exception}",
+                    int(category in DETERMINISTIC),
+                    structure[0],
+                    mobile[0],
+                    time.time(),
+                ),
+            )
+    finally:
+        connection.close()
+    return category
+
+
+def known_failure(cache_path, structure, mobile, method):
+    """
+    Looks up the structures and the pair in the negative cache.
+
+    Parameters
+    ----------
+    cache_path: str
+        Path of the SQLite database.
+
+    structure: list
+        The reference structure.
+
+    mobile: list
+        The mobile structure.
+
+    method: str
+        The method.
+
+    Returns
+    -------
+    tuple or None
+        The category and the message of the cached failure, None if the alignment is not known to fail.
+    """
+
+    if not os.path.isfile(str(cache_path)):
+        return None
+    version = method_version(method)
+    connection = _connect(cache_path)
+    try:
+        for pdb, chain in failure_keys(structure, mobile):
+            row = connection.execute(
+                "SELECT category, message FROM failures "
+                "WHERE pdb = ? AND chain = ? AND method = ? AND version = ? AND deterministic = 1 LIMIT 1",
+                (pdb, chain, method, version),
+            ).fetchone()
+            if row:
+                return row
+    finally:
+        connection.close()
+    return None
+
+
+def retry_transient(func, *args, retries=RETRIES, delay=RETRY_DELAY, **kwargs):
+    """
+    Calls the function and retries it after transient failures with a growing delay.
+
+    Parameters
+    ----------
+    func: function
+        The function.
+
+    args:
+        The arguments of the function.
+
+    retries: int, Optional
+        Maximal number of retries. Default is ``RETRIES``.
+
+    delay: float, Optional
+        Delay before the first retry in seconds, doubled for every retry. Default is ``RETRY_DELAY``.
+
+    kwargs:
+        The keyword arguments of the function.
+
+    Returns
+    -------
+    object
+        The return value of the function.
+
+    .. note::
+
+        The exception of the last attempt and all non-transient exceptions are raised.
+    """
+
+    for attempt in range(retries + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt == retries or classify_failure(e) not in TRANSIENT:
+                raise
+            time.sleep(delay * 2**attempt)
+
+
+def read_failures(cache_path):
+    """
+    Reads all recorded failures.
+
+    Parameters
+    ----------
+    cache_path: str
+        Path of the SQLite database.
+
+    Returns
+    -------
+    list
+        Contains a dict for every failure.
+    """
+
+    connection = _connect(cache_path)
+    connection.row_factory = sqlite3.Row
+    try:
+        return [dict(row) for row in connection.execute("SELECT * FROM failures ORDER BY recorded")]
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shows the recorded failures by method and category.")
+    parser.add_argument("cache_path", help="path of the SQLite database of the failures")
+    args = parser.parse_args()
+    counts = Counter((failure["method"], failure["category"]) for failure in read_failures(args.cache_path))
+    for (method, category), count in sorted(counts.items()):
+        print(f"{method:<15} {category:<20} {count}")
@@ -0,0 +1,120 @@
+"""
+Measures the import time of the modules used in worker processes and in the unix terminal, so slow imports are noticed.
+
+Every module is imported in a new interpreter, the median time of several imports is compared with the limit of the module.
+Additionally, the heavy packages (plotting, statistics and OpenCADD with its superposition engines) must not be imported
+with the modules, they are imported in the functions which use them.
+The benchmark fails (exit code 1), if a limit is exceeded or a heavy package is imported:
+
+    python import_benchmark.py [--repeats 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# limits of the import time in seconds, the time of pandas is included
+LIMITS = {
+    "analysis_utils": 1.5,
+    "benchmark_utils": 1.5,
+    "results_utils": 1.5,
+    "scheduling": 1.5,
+    "rmsd_verification": 1.5,
+    "result_statistics": 1.5,
+    "structure_utils": 0.5,
+    "residue_store": 0.5,
+    "transform_store": 0.5,
+    "telemetry": 0.2,
+    "prefetch": 0.2,
+    "work_queue": 0.2,
+}
+
+HEAVY_PACKAGES = ["matplotlib", "seaborn", "scipy", "statsmodels", "opencadd", "MDAnalysis"]
+
+# imports the module in a new interpreter and prints the time and the imported heavy packages
+IMPORT_SCRIPT = """
+import json, sys, time
+sys.path.insert(0, {src!r})
+start = time.perf_counter()
+import {module}
+duration = time.perf_counter() - start
+print(json.dumps([duration, [package for package in {heavy!r} if package in sys.modules]]))
+"""
+
+
+def measure_import(module, repeats=5):
+    """
+    Measures the import time of a module in new interpreters.
+
+    Parameters
+    ----------
+    module: str
+        Name of the module in the src folder.
+
+    repeats: int, Optional
+        Number of imports. Default is 5.
+
+    Returns
+    -------
+    tuple
+        The median import time in seconds and the imported heavy packages.
+    """
+
+    src = os.path.dirname(os.path.abspath(__file__))
+    script = IMPORT_SCRIPT.format(src=src, module=module, heavy=HEAVY_PACKAGES)
+    times = []
+    heavy = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+        duration, heavy = json.loads(output.strip().splitlines()[-1])
+        times.append(duration)
+    return statistics.median(times), heavy
+
+
+def run_import_benchmark(limits=LIMITS, repeats=5):
+    """
+    Measures the import times of all modules and checks them.
+
+    Parameters
+    ----------
+    limits: dict, Optional
+        Maps the modules to their limits in seconds. Default are the limits in ``LIMITS``.
+
+    repeats: int, Optional
+        Number of imports of every module. Default is 5.
+
+    Returns
+    -------
+    list
+        Contains a dict for every module with the median time ("time"), the limit ("limit"),
+        the imported heavy packages ("heavy") and whether the module passed the check ("passed").
+    """
+
+    results = []
+    for module, limit in limits.items():
+        duration, heavy = measure_import(module, repeats)
+        results.append(
+            {
+                "module": module,
+                "time": round(duration, 3),
+                "limit": limit,
+                "heavy": heavy,
+                "passed": duration <= limit and not heavy,
+            }
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks the import time of the modules.")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    results = run_import_benchmark(repeats=args.repeats)
+    for result in results:
+        status = "ok" if result["passed"] else "FAILED"
+        heavy = f" imports {', '.join(result['heavy'])}" if result["heavy"] else ""
+        print(f"{result['module']:<20} {result['time']:>7.3f} s (limit {result['limit']} s) {status}{heavy}")
+    sys.exit(0 if all(result["passed"] for result in results) else 1)
@@ -0,0 +1,237 @@
+"""
+Provides functions to draw the sample sets for the benchmark from the KLIFS dataset export
+(data/samples/20211102_klifs_dataset.csv, created in the Acquire_samples notebook).
+
+The export is converted once into a typed cache with categorical columns and an index of the rows of each kinase group,
+so samples of any size can be drawn without reading the csv file again.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from structure_utils import fetch_pdb_file, read_ca_atoms
+
+CATEGORICAL_COLUMNS = [
+    "kinase.group",
+    "kinase.family",
+    "kinase.subfamily",
+    "species.klifs",
+    "structure.dfg",
+    "structure.ac_helix",
+]
+
+FLOAT_COLUMNS = [
+    "structure.resolution",
+    "structure.qualityscore",
+    "structure.missing_residues",
+    "structure.missing_atoms",
+    "structure.rmsd1",
+    "structure.rmsd2",
+]
+
+SAMPLE_COLUMNS = ["structure.pdb_id", "kinase.klifs_name", "kinase.group", "species.klifs", "chain"]
+
+
+def build_klifs_cache(csv_path, cache_path):
+    """
+    Converts the KLIFS dataset export into a typed cache.
+
+    Parameters
+    ----------
+    csv_path: str
+        Path of the KLIFS dataset export in csv format.
+
+    cache_path: str
+        Path of the cache file (pickle).
+
+    Returns
+    -------
+    dict
+        - klifs: Pandas.DataFrame with categorical columns for the groups, families, species, DFG and aC-helix conformations
+          and float32 columns for the quality measures of the structures.
+        - group_index: dict mapping every kinase group to a numpy.ndarray with the positions of its rows.
+    """
+
+    dtypes = {column: "category" for column in CATEGORICAL_COLUMNS}
+    dtypes.update({column: "float32" for column in FLOAT_COLUMNS})
+    klifs = pd.read_csv(str(csv_path), dtype=dtypes)
+    group_codes = klifs["kinase.group"].cat.codes.to_numpy()
+    group_index = {
+        group: np.flatnonzero(group_codes == code).astype(np.int32)
+        for code, group in enumerate(klifs["kinase.group"].cat.categories)
+    }
+    cache = {"klifs": klifs, "group_index": group_index}
+    pd.to_pickle(cache, str(cache_path))
+    return cache
+
+
+def load_klifs(csv_path, cache_path=None):
+    """
+    Loads the KLIFS dataset from the cache. The cache is created, if it does not exist or is older than the export.
+
+    Parameters
+    ----------
+    csv_path: str
+        Path of the KLIFS dataset export in csv format.
+
+    cache_path: str, Optional
+        Path of the cache file. Default is the path of the export with the extension ".pkl".
+
+    Returns
+    -------
+    dict
+        The cache as returned by ``build_klifs_cache``.
+    """
+
+    csv_path = str(csv_path)
+    cache_path = str(cache_path) if cache_path else f"{os.path.splitext(csv_path)[0]}.pkl"
+    if os.path.isfile(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(csv_path):
+        return pd.read_pickle(cache_path)
+    return build_klifs_cache(csv_path, cache_path)
+
+
+def draw_samples(
+    klifs,
+    group,
+    size=50,
+    seed=2021,
+    dfg="in",
+    min_quality=8,
+    exclude=(),
+    stratify_by=None,
+):
+    """
+    Draws a reproducible sample of structures of one kinase group.
+
+    Parameters
+    ----------
+    klifs: dict
+        The cache returned by ``load_klifs``.
+
+    group: str
+        The kinase group, e.g. "TK".
+
+    size: int, Optional
+        Number of structures in the sample. Default is 50.
+
+    seed: int, Optional
+        Seed of the random sample. Default is 2021 as in the Acquire_samples notebook.
+
+    dfg: str, Optional
+        Required DFG conformation of the structures. Default is "in". With None, all conformations are used.
+
+    min_quality: float, Optional
+        Minimal KLIFS quality score of the structures. Default is 8.
+
+    exclude: list, Optional
+        PDB-IDs of structures that are excluded from the sample, e.g. structures causing errors in a method.
+
+    stratify_by: str, Optional
+        Column used for stratification, e.g. "kinase.family".
+        The sample size of every stratum is proportional to the number of its structures.
+        With None, a simple random sample is drawn. Default is None.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        The rows of the KLIFS dataset in the sample.
+
+    .. note::
+
+        Without stratification, the same samples as in the Acquire_samples notebook are drawn
+        for the same group, seed and excluded structures.
+    """
+
+    df = klifs["klifs"].iloc[klifs["group_index"][group]]
+    mask = df["structure.qualityscore"].to_numpy() >= min_quality
+    if dfg is not None:
+        mask &= (df["structure.dfg"] == dfg).to_numpy()
+    if len(exclude):
+        mask &= ~df["structure.pdb_id"].isin(list(exclude)).to_numpy()
+    df = df[mask]
+
+    if stratify_by is None:
+        return df.sample(size, random_state=seed)
+
+    # proportional allocation with the largest remainder method, so the sizes add up to the sample size
+    counts = df[stratify_by].value_counts(sort=False)
+    counts = counts[counts > 0]
+    quotas = counts / counts.sum() * size
+    allocation = np.floor(quotas).astype(int)
+    remainder = size - allocation.sum()
+    allocation[(quotas - allocation).sort_values(ascending=False).index[:remainder]] += 1
+    rng = np.random.default_rng(seed)
+    codes = df[stratify_by].astype(str).to_numpy()
+    positions = [
+        rng.choice(np.flatnonzero(codes == str(stratum)), n, replace=False)
+        for stratum, n in allocation.items()
+        if n > 0
+    ]
+    return df.iloc[np.sort(np.concatenate(positions))]
+
+
+def select_chain(pdb_id, cache_dir, preferred=("A", "B")):
+    """
+    Selects the chain used for the alignments like in the Acquire_samples notebook:
+    chain A, or chain B if chain A is not present. If both are missing (renamed chains),
+    the first chain containing CA atoms is used.
+
+    Parameters
+    ----------
+    pdb_id: str
+        PDB-ID of the structure.
+
+    cache_dir: str
+        Folder containing the cached PDB files. Missing files are downloaded.
+
+    preferred: tuple, Optional
+        The preferred chains in this order. Default is ("A", "B").
+
+    Returns
+    -------
+    str
+        The selected chain.
+    """
+
+    path = fetch_pdb_file(pdb_id, cache_dir)
+    for chain in preferred:
+        if read_ca_atoms(path, chain)["residues"]:
+            return chain
+    with open(path) as f:
+        for line in f:
+            if line.startswith("ATOM") and line[12:16].strip() == "CA":
+                return line[21]
+    return preferred[0]
+
+
+def write_samples(sample_df, sample_path, cache_dir=None, chain="A"):
+    """
+    Writes a sample in the format of the sample files: PDB-ID, kinase name, group, species and chain.
+
+    Parameters
+    ----------
+    sample_df: Pandas.DataFrame
+        The sample returned by ``draw_samples``.
+
+    sample_path: str
+        Path of the sample file.
+
+    cache_dir: str, Optional
+        Folder containing the cached PDB files. If provided, the chain is selected by ``select_chain``.
+
+    chain: str, Optional
+        The chain used for all structures, if no cache_dir is provided. Default is "A".
+
+    Returns
+    -------
+    None
+    """
+
+    df = sample_df.copy()
+    if cache_dir:
+        df["chain"] = [select_chain(pdb_id, cache_dir) for pdb_id in df["structure.pdb_id"]]
+    else:
+        df["chain"] = chain
+    df[SAMPLE_COLUMNS].astype(str).to_csv(str(sample_path), header=False, index=False)
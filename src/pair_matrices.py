@@ -0,0 +1,108 @@
+"""
+Provides the export of the results as dense pairwise matrices.
+
+Every metric is stored as memory-mapped float32 array of shape (N, M, methods) in the numpy format,
+together with the IDs of the rows (reference structures), the columns (mobile structures) and the methods.
+Within-group results use the same IDs for rows and columns and fill the upper triangle,
+between-groups results fill the rectangle of both groups. Missing alignments are NaN.
+The matrices are read with the accessors in ``analysis_utils``.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# metrics exported by default
+MATRIX_METRICS = ["rmsd", "coverage", "time", "SI", "MI", "SAS"]
+
+INDEX_FILE = "index.json"
+
+
+def export_pair_matrices(all_methods_df, output_dir, metrics=MATRIX_METRICS, in_group=None):
+    """
+    Exports the metrics of the results as memory-mapped pairwise matrices.
+
+    Parameters
+    ----------
+    all_methods_df : Pandas.DataFrame
+
+    output_dir: str
+        Folder of the matrices. Every metric is written to "<metric>.npy", the IDs to "index.json".
+
+    metrics: list, Optional
+        The exported metrics. Default are the columns in ``MATRIX_METRICS``.
+
+    in_group: bool, Optional
+        If True, rows and columns share the IDs of all structures. Default is True, if the reference
+        and the mobile structure of every alignment belong to the same group.
+
+    Returns
+    -------
+    dict
+        The index with the entries "rows", "columns", "methods", "metrics" and "in_group".
+    """
+
+    if in_group is None:
+        in_group = bool((all_methods_df["ref_group"] == all_methods_df["mob_group"]).all())
+    reference_ids = all_methods_df["reference_id"].astype(str)
+    mobile_ids = all_methods_df["mobile_id"].astype(str)
+    if in_group:
+        # order of the first occurrence, which is the order of the sample file
+        rows = columns = list(pd.unique(np.ravel(np.column_stack([reference_ids, mobile_ids]))))
+    else:
+        rows = list(pd.unique(reference_ids))
+        columns = list(pd.unique(mobile_ids))
+    methods = list(pd.unique(all_methods_df["method"]))
+
+    row_positions = pd.Index(rows).get_indexer(reference_ids)
+    column_positions = pd.Index(columns).get_indexer(mobile_ids)
+    method_positions = pd.Index(methods).get_indexer(all_methods_df["method"])
+
+    os.makedirs(str(output_dir), exist_ok=True)
+    for metric in metrics:
+        matrix = np.lib.format.open_memmap(
+            os.path.join(str(output_dir), f"{metric}.npy"),
+            mode="w+",
+            dtype=np.float32,
+            shape=(len(rows), len(columns), len(methods)),
+        )
+        matrix[:] = np.nan
+        matrix[row_positions, column_positions, method_positions] = all_methods_df[metric].to_numpy(dtype=np.float32)
+        matrix.flush()
+        del matrix
+
+    index = {"rows": rows, "columns": columns, "methods": methods, "metrics": list(metrics), "in_group": in_group}
+    with open(os.path.join(str(output_dir), INDEX_FILE), "w") as f:
+        json.dump(index, f)
+    return index
+
+
+def load_pair_matrices(matrix_dir):
+    """
+    Opens the matrices exported by ``export_pair_matrices`` without reading them into memory.
+
+    Parameters
+    ----------
+    matrix_dir: str
+        Folder of the matrices.
+
+    Returns
+    -------
+    dict
+        The index (see ``export_pair_matrices``) with the additional entries
+        "row_positions", "column_positions" and "method_positions" (dicts mapping the IDs to the positions)
+        and "matrices" (dict mapping the metrics to the read-only memory-mapped arrays).
+    """
+
+    with open(os.path.join(str(matrix_dir), INDEX_FILE)) as f:
+        matrices = json.load(f)
+    matrices["row_positions"] = {pdb_id: i for i, pdb_id in enumerate(matrices["rows"])}
+    matrices["column_positions"] = {pdb_id: i for i, pdb_id in enumerate(matrices["columns"])}
+    matrices["method_positions"] = {method: i for i, method in enumerate(matrices["methods"])}
+    matrices["matrices"] = {
+        metric: np.load(os.path.join(str(matrix_dir), f"{metric}.npy"), mmap_mode="r")
+        for metric in matrices["metrics"]
+    }
+    return matrices
@@ -0,0 +1,525 @@
+"""
+Measures the time and the peak memory of the analysis functions, the log parsers and the writing of the results,
+so performance regressions are noticed before the runs with many structures time out.
+
+The benchmarks use synthetic data and run offline: result tables with the columns of the result files and logfiles
+in the format of the PyMol and ChimeraX alignment scripts, generated for every size (number of rows, for the logs the
+number of alignments). Every benchmark is timed several times (the best time is kept) and run once more while
+``tracemalloc`` records the peak memory. The results are compared with a baseline in JSON format, the benchmark fails
+(exit code 1), if the time of a benchmark grows or its peak memory grows beyond the threshold or a benchmark fails,
+which passed in the baseline:
+
+    python performance_benchmark.py --baseline baseline.json --update
+    python performance_benchmark.py --baseline baseline.json [--sizes 1000 10000] [--benchmarks pymol_log_parser]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# the log parsers are located in the folders of the drivers
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "pymol_scripts"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "chimerax_scripts"))
+import analysis_utils
+import cost_model
+import matchmaker_log_parser
+import pymol_log_parser
+from benchmark_utils import METHODS
+from result_statistics import compute_result_statistics
+from results_utils import RESULT_COLUMNS, read_results
+
+# number of rows of the synthetic tables and number of alignments of the synthetic logs
+SIZES = [10**3, 10**4, 10**5, 10**6, 10**7]
+
+# maximal relative growth of the time and of the peak memory compared with the baseline
+TIME_THRESHOLD = 0.25
+MEMORY_THRESHOLD = 0.25
+
+# shorter times and smaller differences of the peak memory (in bytes) are dominated by noise and not checked
+MIN_TIME = 0.01
+MIN_MEMORY = 2**20
+
+# the methods of the full benchmark, the OpenCADD methods, PyMol and ChimeraX MatchMaker
+BENCHMARK_METHODS = METHODS + ["pymol", "matchmaker"]
+
+GROUPS = ["TK", "TKL", "CMGC", "CAMK", "AGC"]
+SPECIES = ["Human", "Mouse"]
+
+
+def _structures(count, seed=0):
+    # the structures and the pairs of an in-group run, every pair is aligned by all methods
+    n = int(np.ceil((1 + np.sqrt(1 + 8 * max(count, 1))) / 2))
+    references, mobiles = (indices[:count] for indices in np.triu_indices(n, 1))
+    rng = np.random.default_rng(seed)
+    structures = pd.DataFrame(
+        {
+            "id": [f"s{i:05d}" for i in range(n)],
+            "name": [f"KIN{i % 500}" for i in range(n)],
+            "group": np.array(GROUPS, dtype=object)[np.arange(n) % len(GROUPS)],
+            "species": np.array(SPECIES, dtype=object)[rng.integers(0, len(SPECIES), n)],
+            "chain": "A",
+            "size": rng.integers(250, 350, n),
+        }
+    )
+    return structures, references, mobiles
+
+
+def synthetic_results(rows, seed=0):
+    """
+    Creates a synthetic result table like the tables returned by ``results_utils.read_results``.
+
+    Parameters
+    ----------
+    rows: int
+        Number of rows, the pairs of an in-group run are aligned by all methods in ``BENCHMARK_METHODS``.
+
+    seed: int, Optional
+        Seed of the random values. Default is 0.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        The results with the columns ``RESULT_COLUMNS``, about 1 % of the alignments failed (NaN values).
+    """
+
+    structures, references, mobiles = _structures(-(-rows // len(BENCHMARK_METHODS)), seed)
+    rng = np.random.default_rng(seed)
+    pairs = np.repeat(np.arange(len(references)), len(BENCHMARK_METHODS))[:rows]
+    methods = np.tile(np.array(BENCHMARK_METHODS, dtype=object), len(references))[:rows]
+    reference = structures.iloc[references[pairs]].reset_index(drop=True)
+    mobile = structures.iloc[mobiles[pairs]].reset_index(drop=True)
+    smaller = np.minimum(reference["size"].to_numpy(), mobile["size"].to_numpy())
+    rmsd = np.round(rng.gamma(2.0, 1.0, rows), 4)
+    coverage = np.round(smaller * rng.uniform(0.3, 1.0, rows)).astype(float)
+    duration = rng.lognormal(-3, 1, rows)
+    failed = rng.random(rows) < 0.01
+    rmsd[failed] = np.nan
+    coverage[failed] = np.nan
+    df = pd.DataFrame(
+        {
+            "reference_id": reference["id"],
+            "mobile_id": mobile["id"],
+            "method": methods,
+            "rmsd": rmsd,
+            "coverage": coverage,
+            "reference_size": reference["size"],
+            "mobile_size": mobile["size"],
+            "time": duration,
+            # the quality measures of results_utils.compute_quality_measures
+            "SI": rmsd * smaller / coverage,
+            "MI": 1 - (1 + coverage) / ((1 + rmsd / 1.5) * (1 + smaller)),
+            "SAS": rmsd * 100 / coverage,
+            "ref_name": reference["name"],
+            "ref_group": reference["group"],
+            "ref_species": reference["species"],
+            "ref_chain": reference["chain"],
+            "mob_name": mobile["name"],
+            "mob_group": mobile["group"],
+            "mob_species": mobile["species"],
+            "mob_chain": mobile["chain"],
+            "time_median": duration * 1.05,
+            "time_spread": duration * 0.1,
+            "mode": "chain",
+            "warm_start": False,
+        }
+    )
+    return df[RESULT_COLUMNS]
+
+
+def _log_entries(count, seed=0):
+    structures, references, mobiles = _structures(count, seed)
+    rng = np.random.default_rng(seed)
+    lists = [str([row.id, row.name, row.group, row.species, row.chain]) for row in structures.itertuples()]
+    sizes = structures["size"].tolist()
+    coverage = rng.integers(100, 250, (len(references), 2)).tolist()
+    rmsd = np.round(rng.gamma(2.0, 1.0, (len(references), 2)), 4).tolist()
+    duration = np.round(rng.lognormal(-3, 1, len(references)), 4).tolist()
+    for i, (reference, mobile) in enumerate(zip(references.tolist(), mobiles.tolist())):
+        yield (
+            lists[reference],
+            sizes[reference],
+            lists[mobile],
+            sizes[mobile],
+            rmsd[i],
+            coverage[i],
+            duration[i],
+        )
+
+
+def write_pymol_log(path, count, seed=0):
+    """
+    Writes a synthetic logfile in the format of the PyMol alignment scripts.
+
+    Parameters
+    ----------
+    path: str
+        Path of the logfile.
+
+    count: int
+        Number of alignments.
+
+    seed: int, Optional
+        Seed of the random values. Default is 0.
+
+    Returns
+    -------
+    None
+    """
+
+    with open(str(path), "w") as f:
+        f.write("timing_scope: align\nmode: chain\n")
+        for counter, (reference, reference_size, mobile, mobile_size, rmsd, coverage, duration) in enumerate(
+            _log_entries(count, seed)
+        ):
+            f.write(
+                f"{counter}\nreference: {reference}\nreference_size: {reference_size}\n"
+                f"mobile: {mobile}\nmobile_size: {mobile_size}\n"
+                f"result: ({rmsd[0]}, {coverage[0]}, 5, {rmsd[1]}, {coverage[1]}, 464.0, {coverage[1] + 5})\n"
+                f"time: {duration}\n"
+                f"timing: min={duration} median={duration} spread=0.001 repeats=5 warmup=1\n"
+            )
+
+
+def write_chimerax_log(path, count, seed=0):
+    """
+    Writes a synthetic logfile in the format of the ChimeraX alignment scripts.
+
+    Parameters
+    ----------
+    path: str
+        Path of the logfile.
+
+    count: int
+        Number of alignments.
+
+    seed: int, Optional
+        Seed of the random values. Default is 0.
+
+    Returns
+    -------
+    None
+    """
+
+    with open(str(path), "w") as f:
+        f.write("timing_scope: matchmaker \nmode: chain \n")
+        for counter, (reference, reference_size, mobile, mobile_size, rmsd, coverage, duration) in enumerate(
+            _log_entries(count, seed)
+        ):
+            f.write(
+                f"reference: {reference} \nreference_size: {reference_size} \n"
+                f"mobile: {mobile} \nmobile_size: {mobile_size} \n\nalignment: {counter} \n"
+                f"Matchmaker {reference[2:8]}, chain A (#1) with {mobile[2:8]}, chain A (#2), "
+                f"sequence alignment score = 1012.3\n"
+                f"RMSD between {coverage[0]} atom pairs is {rmsd[0]} angstroms\n"
+                f"time: {duration} \n"
+                f"timing: min={duration} median={duration} spread=0.001 repeats=5 warmup=1 \n"
+            )
+
+
+def _close_figures(func):
+    # the figures are closed after every call, otherwise they remain in memory
+    def benchmark(*args):
+        import matplotlib.pyplot as plt
+
+        try:
+            return func(*args)
+        finally:
+            plt.close("all")
+
+    return benchmark
+
+
+def _write_results_loc(rows, path):
+    # the DataFrame of the sequential runs, grown by one row per alignment in compute_alignment
+    df = pd.DataFrame(columns=RESULT_COLUMNS)
+    for counter, row in enumerate(rows):
+        df.loc[counter] = row
+    df.to_csv(str(path), mode="w", header=False, index=False)
+
+
+def _write_results_rows(rows, path):
+    # the DataFrame of the parallel runs, created from the collected rows
+    pd.DataFrame(rows, columns=RESULT_COLUMNS).to_csv(str(path), mode="w", header=False, index=False)
+
+
+# the input of every benchmark, its largest size and the function
+BENCHMARKS = {
+    "general_checks": ("results", 10**7, analysis_utils.general_checks),
+    "compute_rel_cov": ("results", 10**7, lambda df: analysis_utils.compute_rel_cov(df.copy(deep=False))),
+    "create_scatter_plot": ("results", 10**5, _close_figures(analysis_utils.create_scatter_plot)),
+    "create_violine_plot": ("results", 10**5, _close_figures(analysis_utils.create_violine_plot)),
+    "compute_correlation": ("results", 10**7, _close_figures(analysis_utils.compute_correlation)),
+    "pivot_pairs": ("results", 10**7, analysis_utils.pivot_pairs),
+    "compute_method_agreement": ("results", 10**7, analysis_utils.compute_method_agreement),
+    "compute_pair_concordance": ("results", 10**7, analysis_utils.compute_pair_concordance),
+    "check_distribution": ("results", 10**5, _close_figures(analysis_utils.check_distribution)),
+    "compute_anova": ("results", 10**6, analysis_utils.compute_anova),
+    "compute_kruskal": ("results", 10**7, analysis_utils.compute_kruskal),
+    "compute_mannwhitneyu": ("results", 10**6, analysis_utils.compute_mannwhitneyu),
+    "count_best_results": ("results", 10**4, analysis_utils.count_best_results),
+    "compute_mean_median": ("results", 10**7, analysis_utils.compute_mean_median),
+    "compute_scaling": ("results", 10**7, analysis_utils.compute_scaling),
+    "create_scaling_plot": ("results", 10**7, _close_figures(analysis_utils.create_scaling_plot)),
+    "compare_warm_start": ("results", 10**7, lambda df: analysis_utils.compare_warm_start(df, df)),
+    # the results of several files are concatenated without a new index, like in the README, e.g. duplicates are kept
+    "cost_model_residuals": (
+        "results",
+        10**7,
+        lambda df: cost_model.residual_report(pd.concat([df, df]), cost_model.fit_cost_models(df)),
+    ),
+    "pymol_log_parser": (
+        "pymol_log",
+        10**6,
+        lambda path: pymol_log_parser.create_results(pymol_log_parser.parse_log(path)),
+    ),
+    "matchmaker_log_parser": (
+        "chimerax_log",
+        10**6,
+        lambda path: matchmaker_log_parser.create_results(matchmaker_log_parser.parse_log(path)),
+    ),
+    "write_results_loc": ("rows", 10**4, _write_results_loc),
+    "write_results_rows": ("rows", 10**6, _write_results_rows),
+    "read_results": ("result_file", 10**6, read_results),
+    "result_statistics": ("result_file", 10**6, lambda path: compute_result_statistics([path])),
+}
+
+
+def _inputs(kind, size, folder):
+    # the synthetic input of a kind of benchmarks, created once for every size
+    if kind == "results":
+        df = synthetic_results(size)
+        # the relative coverage is plotted by check_distribution, it is added like in the notebooks
+        analysis_utils.compute_rel_cov(df)
+        return (df,)
+    if kind == "pymol_log":
+        path = os.path.join(folder, f"pymol_{size}.log")
+        write_pymol_log(path, size)
+        return (path,)
+    if kind == "chimerax_log":
+        path = os.path.join(folder, f"chimerax_{size}.log")
+        write_chimerax_log(path, size)
+        return (path,)
+    rows = synthetic_results(size).values.tolist()
+    if kind == "rows":
+        return rows, os.path.join(folder, f"results_{size}.csv")
+    path = os.path.join(folder, f"result_file_{size}.csv")
+    _write_results_rows(rows, path)
+    return (path,)
+
+
+def measure(func, args, repeats=3):
+    """
+    Measures the time and the peak memory of a function.
+
+    Parameters
+    ----------
+    func: function
+        The function.
+
+    args: tuple
+        The arguments of the function.
+
+    repeats: int, Optional
+        Number of timed calls, the best time is kept. Default is 3.
+
+    Returns
+    -------
+    tuple
+        The time in seconds and the peak memory in bytes.
+
+    .. note::
+
+        The peak memory is measured in an additional call with ``tracemalloc``, which slows down the function.
+        It contains the memory allocated by Python and NumPy, but not by other libraries (e.g. BLAS).
+    """
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return min(times), peak
+
+
+def run_benchmarks(sizes=SIZES, benchmarks=None, repeats=3):
+    """
+    Runs the benchmarks with synthetic data of all sizes up to the largest size of every benchmark.
+
+    Parameters
+    ----------
+    sizes: list, Optional
+        The numbers of rows (alignments of the logs). Default are the sizes in ``SIZES``.
+
+    benchmarks: list, Optional
+        Names of the benchmarks in ``BENCHMARKS``. Default are all benchmarks.
+
+    repeats: int, Optional
+        Number of timed calls of every benchmark. Default is 3.
+
+    Returns
+    -------
+    dict
+        The environment ("environment") and the results ("results"), which map the benchmarks and the sizes to the
+        time in seconds ("time"), the rows per second ("throughput") and the peak memory in bytes ("peak_memory"),
+        or to the error ("error") of a failed benchmark.
+    """
+
+    import matplotlib
+
+    # the figures are created without display
+    matplotlib.use("Agg")
+    names = benchmarks or list(BENCHMARKS)
+    results = {name: {} for name in names}
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sorted(sizes):
+            inputs = {}
+            for name in names:
+                kind, max_size, func = BENCHMARKS[name]
+                if size > max_size:
+                    continue
+                if kind not in inputs:
+                    inputs[kind] = _inputs(kind, size, folder)
+                try:
+                    # the printed results of the analysis functions are discarded
+                    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                        duration, peak = measure(func, inputs[kind], repeats)
+                    results[name][str(size)] = {
+                        "time": round(duration, 6),
+                        "throughput": round(size / duration, 1),
+                        "peak_memory": peak,
+                    }
+                except Exception as e:
+                    results[name][str(size)] = {"error": f"{type(e).__name__}: {e}"}
+                print(f"{name:<25} {size:>9} {_format(results[name][str(size)])}", file=sys.stderr)
+            # the input of the previous size is released before the next one is created
+            del inputs
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def _format(result):
+    if "error" in result:
+        return f"FAILED {result['error']}"
+    return f"{result['time']:>10.4f} s {result['throughput']:>12.0f} rows/s {result['peak_memory'] / 2**20:>9.1f} MiB"
+
+
+def compare_results(results, baseline, time_threshold=TIME_THRESHOLD, memory_threshold=MEMORY_THRESHOLD):
+    """
+    Compares the results with the baseline.
+
+    Parameters
+    ----------
+    results: dict
+        The results returned by ``run_benchmarks``.
+
+    baseline: dict
+        The baseline, results of an earlier call of ``run_benchmarks``.
+
+    time_threshold: float, Optional
+        Maximal relative growth of the time. Default is ``TIME_THRESHOLD``.
+
+    memory_threshold: float, Optional
+        Maximal relative growth of the peak memory. Default is ``MEMORY_THRESHOLD``.
+
+    Returns
+    -------
+    list
+        Contains a dict for every regression with the benchmark ("benchmark"), the size ("size"),
+        the measure ("measure": "time", "peak_memory" or "error"), the baseline value ("baseline")
+        and the current value ("current"). Benchmarks and sizes missing in the baseline are not compared.
+    """
+
+    regressions = []
+    for name, sizes in results["results"].items():
+        for size, current in sizes.items():
+            previous = baseline["results"].get(name, {}).get(size)
+            if previous is None or "error" in previous:
+                continue
+            if "error" in current:
+                regressions.append(
+                    {"benchmark": name, "size": size, "measure": "error", "baseline": None, "current": current["error"]}
+                )
+                continue
+            if (
+                max(current["time"], previous["time"]) >= MIN_TIME
+                and current["time"] > previous["time"] * (1 + time_threshold)
+            ):
+                regressions.append(
+                    {
+                        "benchmark": name,
+                        "size": size,
+                        "measure": "time",
+                        "baseline": previous["time"],
+                        "current": current["time"],
+                    }
+                )
+            if (
+                current["peak_memory"] - previous["peak_memory"] >= MIN_MEMORY
+                and current["peak_memory"] > previous["peak_memory"] * (1 + memory_threshold)
+            ):
+                regressions.append(
+                    {
+                        "benchmark": name,
+                        "size": size,
+                        "measure": "peak_memory",
+                        "baseline": previous["peak_memory"],
+                        "current": current["peak_memory"],
+                    }
+                )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks the time and the peak memory of the analysis and parsing code.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), help="default are all benchmarks")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--baseline", help="baseline in JSON format")
+    parser.add_argument("--update", action="store_true", help="writes the results as new baseline")
+    parser.add_argument("--time-threshold", type=float, default=TIME_THRESHOLD)
+    parser.add_argument("--memory-threshold", type=float, default=MEMORY_THRESHOLD)
+    args = parser.parse_args()
+    results = run_benchmarks(args.sizes, args.benchmarks, args.repeats)
+    if not args.baseline:
+        print(json.dumps(results, indent=2))
+        sys.exit(0)
+    if args.update or not os.path.isfile(args.baseline):
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+        sys.exit(0)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline["environment"] != results["environment"]:
+        print(f"the baseline was measured in another environment: {baseline['environment']}")
+    regressions = compare_results(results, baseline, args.time_threshold, args.memory_threshold)
+    for regression in regressions:
+        print(
+            f"{regression['benchmark']:<25} {regression['size']:>9} {regression['measure']:<12} "
+            f"{regression['baseline']} -> {regression['current']}"
+        )
+    print(f"{len(regressions)} regressions")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,605 @@
+"""
+Provides a config-driven runner for the complete benchmark.
+
+The stages of the benchmark (sample acquisition, structure caching, chain index, alignments per tool and group pair,
+parsing of the logs, metrics and figures) are modelled as a dependency graph.
+Every stage is identified by a hash of its parameters and the content of its input files.
+A stage is only recomputed, if this hash changed or one of its outputs is missing, independent stages run concurrently.
+
+The runner is called in the terminal by:
+    python3 pipeline.py <PATH_TO_CONFIG.json> [--force] [--dry-run]
+"""
+
+import argparse
+import ast
+import concurrent.futures
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_CONFIG = {
+    "tools": ["opencadd", "pymol", "matchmaker"],
+    "w0": 1.5,
+    "warmup": 0,
+    "repeats": 1,
+    "mode": "chain",
+    "klifs_dataset": os.path.join(SRC_DIR, "..", "data", "samples", "20211102_klifs_dataset.csv"),
+    "max_workers": 4,
+    "alignment_workers": 1,
+    "cost_results": [],
+    "python_command": [sys.executable],
+    "pymol_command": ["pymol", "-cq"],
+    "chimerax_command": ["chimerax", "--nogui", "--exit"],
+}
+
+STATE_FILE = "pipeline_state.json"
+
+# pyplot is not thread-safe, so the figures of different group pairs are created one after another
+_PLOT_LOCK = threading.Lock()
+
+
+def load_config(config_path):
+    """
+    Reads the config file of the pipeline and resolves all paths relative to the folder of the config file.
+
+    Parameters
+    ----------
+    config_path: str
+        Path of the config file in json format.
+
+    Returns
+    -------
+    dict
+        The config with the default values for all missing entries.
+
+    .. note::
+
+        Required entries are "work_dir", "cache_dir", "samples" (mapping of the group names to the sample files)
+        and "group_pairs" (list of lists with one group for within-group or two groups for between-groups alignments).
+        Instead of a sample file, a group can be mapped to the parameters of ``klifs_sampling.draw_samples``
+        with the path of the KLIFS dataset export as "klifs", e.g. {"klifs": "...csv", "size": 50, "seed": 2021},
+        or to the parameters of ``synthetic_structures.generate_samples`` as "synthetic", e.g. {"synthetic": {"length": 200}}.
+        With "mode" set to "pocket", only the KLIFS pockets taken from "klifs_dataset" are aligned.
+    """
+
+    with open(str(config_path)) as f:
+        config = {**DEFAULT_CONFIG, **json.load(f)}
+    base_dir = os.path.dirname(os.path.abspath(str(config_path)))
+    config["work_dir"] = os.path.join(base_dir, config["work_dir"])
+    config["cache_dir"] = os.path.join(base_dir, config["cache_dir"])
+    config["klifs_dataset"] = os.path.join(base_dir, config["klifs_dataset"])
+    config["cost_results"] = [os.path.join(base_dir, path) for path in config["cost_results"]]
+    for group, source in config["samples"].items():
+        if isinstance(source, dict) and "klifs" in source:
+            config["samples"][group] = {**source, "klifs": os.path.join(base_dir, source["klifs"])}
+        elif isinstance(source, dict):
+            config["samples"][group] = source
+        else:
+            config["samples"][group] = os.path.join(base_dir, source)
+    return config
+
+
+def _file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def source_files(path):
+    """
+    Returns a script and the modules of this folder, which it imports directly or indirectly,
+    so the stages running the script are recomputed, if one of these modules changes.
+
+    Parameters
+    ----------
+    path: str
+        Path of the script.
+
+    Returns
+    -------
+    list
+        The paths of the script and of the imported modules, sorted after the script.
+    """
+
+    found = {os.path.abspath(path)}
+    pending = [os.path.abspath(path)]
+    while pending:
+        with open(pending.pop()) as f:
+            tree = ast.parse(f.read())
+        # the imports in functions are included, e.g. modules imported on the first call
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                module = os.path.join(SRC_DIR, f"{name.split('.')[0]}.py")
+                if os.path.exists(module) and module not in found:
+                    found.add(module)
+                    pending.append(module)
+    found.discard(os.path.abspath(path))
+    return [path] + sorted(found)
+
+
+def stage_key(stage):
+    """
+    Computes the content hash of a stage from its name, its parameters and the content of its input files.
+
+    Parameters
+    ----------
+    stage: dict
+        The stage as created by ``build_stages``.
+
+    Returns
+    -------
+    str
+        The hash of the stage.
+    """
+
+    sha = hashlib.sha256()
+    sha.update(stage["name"].encode())
+    sha.update(json.dumps(stage["params"], sort_keys=True).encode())
+    for path in stage["inputs"]:
+        sha.update(path.encode())
+        sha.update(_file_hash(path).encode())
+    return sha.hexdigest()
+
+
+def _run_command(command, stdout_path=None, cwd=SRC_DIR):
+    if stdout_path:
+        with open(stdout_path, "w") as f:
+            subprocess.run(command, stdout=f, stderr=subprocess.STDOUT, cwd=cwd, check=True)
+    else:
+        subprocess.run(command, cwd=cwd, check=True)
+
+
+def _load_module(path):
+    # the parsers are scripts in the subfolders and therefore loaded from their path
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(path))[0], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _copy_samples(stage):
+    shutil.copyfile(stage["params"]["source"], stage["outputs"][0])
+
+
+def _draw_samples(stage):
+    import klifs_sampling as ks
+
+    params = dict(stage["params"])
+    klifs = ks.load_klifs(params.pop("klifs"))
+    cache_dir = params.pop("cache_dir")
+    sample_df = ks.draw_samples(klifs, **params)
+    ks.write_samples(sample_df, stage["outputs"][0], cache_dir=cache_dir)
+
+
+def _generate_samples(stage):
+    from synthetic_structures import generate_samples
+
+    params = stage["params"]
+    generate_samples(params["cache_dir"], stage["outputs"][0], **params["synthetic"])
+
+
+def _cache_structures(stage):
+    from structure_utils import fetch_pdb_file, read_samples
+
+    pdb_ids = sorted({structure[0] for path in stage["inputs"] for structure in read_samples(path)})
+    paths = [fetch_pdb_file(pdb_id, stage["params"]["cache_dir"]) for pdb_id in pdb_ids]
+    # the manifest lists the cached files, so the following stages depend on the cached structures
+    with open(stage["outputs"][0], "w") as f:
+        for pdb_id, path in zip(pdb_ids, paths):
+            f.write(f"{pdb_id},{_file_hash(path)}\n")
+
+
+def _build_chain_index(stage):
+    from structure_utils import build_chain_index
+
+    build_chain_index(stage["params"]["samples"], stage["outputs"][0], stage["params"]["cache_dir"])
+
+
+def _build_pocket_index(stage):
+    from structure_utils import build_pocket_index
+
+    params = stage["params"]
+    build_pocket_index(params["samples"], params["klifs_dataset"], stage["outputs"][0], params["cache_dir"])
+
+
+def _align_opencadd(stage):
+    params = stage["params"]
+    call = (
+        "import benchmark_utils as bu; "
+        f"bu.run_alignments(sample1_path={params['samples'][0]!r}, "
+        f"sample2_path={(params['samples'][1:] or [None])[0]!r}, "
+        f"output_path={stage['outputs'][0]!r}, w0={params['w0']!r}, warmup={params['warmup']!r}, "
+        f"repeats={params['repeats']!r}, chain_index_path={params['chain_index']!r}, "
+        f"mode={params['mode']!r}, pocket_index_path={params.get('pocket_index')!r}, "
+        f"cache_dir={params['cache_dir']!r}, workers={params['alignment_workers']!r}, "
+        f"cost_results={params['cost_results']!r})"
+    )
+    _run_command(params["python_command"] + ["-c", call], stdout_path=f"{stage['outputs'][0]}.log")
+
+
+def _align_pymol(stage):
+    params = stage["params"]
+    command = params["pymol_command"] + [params["script"], "--"] + params["samples"] + [params["chain_index"]]
+    # the structures are loaded from the cache folder filled by the structures stage
+    command += [params.get("pocket_index", "-"), params["cache_dir"]]
+    _run_command(command, stdout_path=stage["outputs"][0])
+
+
+def _align_matchmaker(stage):
+    params = stage["params"]
+    # without GUI the output is written to stdout, so the log is not saved by the script
+    script = " ".join([params["script"]] + params["samples"] + [params["chain_index"], "-"])
+    # the structures are opened from the cache folder filled by the structures stage
+    script += f" {params.get('pocket_index', '-')} {params['cache_dir']}"
+    _run_command(params["chimerax_command"] + ["--script", script], stdout_path=stage["outputs"][0])
+
+
+def _parse_log(stage):
+    parser = _load_module(stage["params"]["parser"])
+    df = parser.create_results(parser.parse_log(stage["inputs"][0]), w0=stage["params"]["w0"])
+    df.to_csv(stage["outputs"][0], mode="w", header=False, index=False)
+
+
+def _read_pair_results(stage):
+    import pandas as pd
+    from results_utils import read_results
+
+    return pd.concat([read_results(path) for path in stage["params"]["results"]]).reset_index(drop=True)
+
+
+def _compute_metrics(stage):
+    import analysis_utils as au
+
+    all_methods_df = _read_pair_results(stage)
+    au.compute_rel_cov(all_methods_df)
+    counts, nans, times = au.general_checks(all_methods_df)
+    numeric_df = all_methods_df.select_dtypes("number").assign(method=all_methods_df["method"])
+    means, medians = au.compute_mean_median(numeric_df)
+    for output, df in zip(stage["outputs"], [counts, nans, times, means, medians]):
+        df.to_csv(output)
+
+
+def _create_figures(stage):
+    import matplotlib
+
+    # the figures are only saved, no window is opened
+    matplotlib.use("Agg")
+    import analysis_utils as au
+    from results_utils import select_variant
+
+    # the figures compare the five methods, so PyMol is used without refinement
+    all_methods_df = select_variant(_read_pair_results(stage), "pymol")
+    au.compute_rel_cov(all_methods_df)
+    path = os.path.dirname(stage["outputs"][0])
+    with _PLOT_LOCK:
+        au.create_scatter_plot(all_methods_df, path=path)
+        matplotlib.pyplot.close("all")
+        au.create_violine_plot(all_methods_df, path=path)
+        matplotlib.pyplot.close("all")
+
+
+def _create_scaling(stage):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import analysis_utils as au
+
+    all_methods_df = _read_pair_results(stage)
+    au.compute_scaling(all_methods_df).to_csv(stage["outputs"][0], index=False)
+    with _PLOT_LOCK:
+        au.create_scaling_plot(all_methods_df, path=os.path.dirname(stage["outputs"][1]))
+        matplotlib.pyplot.close("all")
+
+
+def build_stages(config):
+    """
+    Creates the dependency graph of the benchmark from the config.
+
+    Parameters
+    ----------
+    config: dict
+        The config returned by ``load_config``.
+
+    Returns
+    -------
+    dict
+        Maps the names of the stages to dicts with the entries "name", "deps" (names of the stages this stage depends on),
+        "inputs" (files hashed for the stage key), "outputs", "params" and "func".
+    """
+
+    work_dir = config["work_dir"]
+    stages = {}
+
+    def add(name, deps, inputs, outputs, params, func):
+        stages[name] = {
+            "name": name,
+            "deps": deps,
+            "inputs": inputs,
+            "outputs": outputs,
+            "params": params,
+            "func": func,
+        }
+
+    # sample acquisition
+    sample_paths = {}
+    for group, source in config["samples"].items():
+        sample_paths[group] = os.path.join(work_dir, "samples", f"{group}_samples.txt")
+        if isinstance(source, dict) and "synthetic" in source:
+            params = {"synthetic": source["synthetic"], "cache_dir": config["cache_dir"]}
+            generator = os.path.join(SRC_DIR, "synthetic_structures.py")
+            add(f"samples:{group}", [], source_files(generator), [sample_paths[group]], params, _generate_samples)
+        elif isinstance(source, dict):
+            params = {"group": group, **source, "cache_dir": config["cache_dir"]}
+            add(f"samples:{group}", [], [source["klifs"]], [sample_paths[group]], params, _draw_samples)
+        else:
+            add(f"samples:{group}", [], [source], [sample_paths[group]], {"source": source}, _copy_samples)
+
+    # structure caching and chain index
+    sample_stages = [f"samples:{group}" for group in config["samples"]]
+    manifest_path = os.path.join(work_dir, "structures.txt")
+    add(
+        "structures",
+        sample_stages,
+        list(sample_paths.values()),
+        [manifest_path],
+        {"cache_dir": config["cache_dir"]},
+        _cache_structures,
+    )
+    chain_index_path = os.path.join(work_dir, "chain_index.csv")
+    add(
+        "chain_index",
+        ["structures"] + sample_stages,
+        list(sample_paths.values()) + [manifest_path],
+        [chain_index_path],
+        {"samples": list(sample_paths.values()), "cache_dir": config["cache_dir"]},
+        _build_chain_index,
+    )
+    index_paths = [chain_index_path]
+    index_stages = ["chain_index"]
+    if config["mode"] == "pocket":
+        pocket_index_path = os.path.join(work_dir, "pocket_index.csv")
+        add(
+            "pocket_index",
+            ["structures"] + sample_stages,
+            list(sample_paths.values()) + [manifest_path, config["klifs_dataset"]],
+            [pocket_index_path],
+            {
+                "samples": list(sample_paths.values()),
+                "klifs_dataset": config["klifs_dataset"],
+                "cache_dir": config["cache_dir"],
+            },
+            _build_pocket_index,
+        )
+        index_paths.append(pocket_index_path)
+        index_stages.append("pocket_index")
+
+    scripts = {
+        "pymol": (
+            "pymol_scripts",
+            "pymol_in_group_alignment.py",
+            "pymol_between_groups_alignment.py",
+            "pymol_log_parser.py",
+        ),
+        "matchmaker": (
+            "chimerax_scripts",
+            "matchmaker_in_group_alignment.py",
+            "matchmaker_between_groups_alignment.py",
+            "matchmaker_log_parser.py",
+        ),
+    }
+    commands = {
+        "pymol": ("pymol_command", config["pymol_command"]),
+        "matchmaker": ("chimerax_command", config["chimerax_command"]),
+    }
+
+    # alignments, parsing, metrics and figures for every group pair
+    all_results = []
+    all_result_stages = []
+    for groups in config["group_pairs"]:
+        pair = "_".join(groups)
+        samples = [sample_paths[group] for group in groups]
+        deps = index_stages + [f"samples:{group}" for group in groups]
+        results = []
+        result_stages = []
+        for tool in config["tools"]:
+            result_path = os.path.join(work_dir, "results", f"{tool}_{pair}.csv")
+            params = {"samples": samples, "chain_index": chain_index_path, "cache_dir": config["cache_dir"]}
+            if config["mode"] == "pocket":
+                params["pocket_index"] = pocket_index_path
+            if tool == "opencadd":
+                keys = ["w0", "warmup", "repeats", "mode", "alignment_workers", "cost_results", "python_command"]
+                params.update({key: config[key] for key in keys})
+                add(
+                    f"align:opencadd:{pair}",
+                    deps,
+                    samples + index_paths + source_files(os.path.join(SRC_DIR, "benchmark_utils.py")),
+                    [result_path],
+                    params,
+                    _align_opencadd,
+                )
+                result_stages.append(f"align:opencadd:{pair}")
+            else:
+                folder, in_group, between_groups, parser = scripts[tool]
+                script = os.path.join(SRC_DIR, folder, in_group if len(groups) == 1 else between_groups)
+                parser = os.path.join(SRC_DIR, folder, parser)
+                log_path = os.path.join(work_dir, "logs", f"{tool}_{pair}.txt")
+                command_name, command = commands[tool]
+                params.update({"script": script, command_name: command})
+                add(
+                    f"align:{tool}:{pair}",
+                    deps,
+                    samples + index_paths + source_files(script),
+                    [log_path],
+                    params,
+                    _align_pymol if tool == "pymol" else _align_matchmaker,
+                )
+                add(
+                    f"parse:{tool}:{pair}",
+                    [f"align:{tool}:{pair}"],
+                    [log_path] + source_files(parser),
+                    [result_path],
+                    {"parser": parser, "w0": config["w0"]},
+                    _parse_log,
+                )
+                result_stages.append(f"parse:{tool}:{pair}")
+            results.append(result_path)
+
+        metrics_dir = os.path.join(work_dir, "metrics", pair)
+        add(
+            f"metrics:{pair}",
+            result_stages,
+            results + source_files(os.path.join(SRC_DIR, "analysis_utils.py")),
+            [os.path.join(metrics_dir, f"{name}.csv") for name in ["counts", "nans", "times", "means", "medians"]],
+            {"results": results},
+            _compute_metrics,
+        )
+        figures_dir = os.path.join(work_dir, "figures", pair)
+        add(
+            f"figures:{pair}",
+            result_stages,
+            results + source_files(os.path.join(SRC_DIR, "analysis_utils.py")),
+            [os.path.join(figures_dir, "scatter_plot.png"), os.path.join(figures_dir, "violine_plot.png")],
+            {"results": results},
+            _create_figures,
+        )
+        all_results += results
+        all_result_stages += result_stages
+
+    # time-versus-size curves of all methods for the synthetic structures
+    if any(isinstance(source, dict) and "synthetic" in source for source in config["samples"].values()):
+        add(
+            "scaling",
+            all_result_stages,
+            all_results + source_files(os.path.join(SRC_DIR, "analysis_utils.py")),
+            [
+                os.path.join(work_dir, "metrics", "scaling.csv"),
+                os.path.join(work_dir, "figures", "scaling_plot.png"),
+            ],
+            {"results": all_results},
+            _create_scaling,
+        )
+    return stages
+
+
+def run_pipeline(config_path, force=False, dry_run=False):
+    """
+    Runs all stages of the benchmark whose inputs changed since the last run.
+
+    Parameters
+    ----------
+    config_path: str
+        Path of the config file in json format (see ``load_config``).
+
+    force: bool, Optional
+        If True, all stages are recomputed. Default is False.
+
+    dry_run: bool, Optional
+        If True, the stages that would be recomputed are only printed.
+        Stages depending on a recomputed stage are listed as well. Default is False.
+
+    Returns
+    -------
+    dict
+        Maps the names of the stages to their status: "cached", "done", "failed", "skipped" or "pending" (dry run).
+    """
+
+    config = load_config(config_path)
+    stages = build_stages(config)
+    state_path = os.path.join(config["work_dir"], STATE_FILE)
+    state = {}
+    if os.path.isfile(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+    lock = threading.Lock()
+    status = {}
+
+    def is_cached(stage, key):
+        return (
+            not force
+            and state.get(stage["name"]) == key
+            and all(os.path.exists(path) for path in stage["outputs"])
+        )
+
+    def execute(stage, key):
+        for path in stage["outputs"]:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        stage["func"](stage)
+        with lock:
+            os.makedirs(config["work_dir"], exist_ok=True)
+            state[stage["name"]] = key
+            with open(state_path, "w") as f:
+                json.dump(state, f, indent=1, sort_keys=True)
+
+    futures = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=config["max_workers"]) as executor:
+        while len(status) < len(stages):
+            resolved = len(status)
+            for name, stage in stages.items():
+                if name in status or name in futures.values():
+                    continue
+                dep_status = [status.get(dep) for dep in stage["deps"]]
+                if any(s in ("failed", "skipped") for s in dep_status):
+                    status[name] = "skipped"
+                    print(f"skipped  {name}")
+                elif any(s == "pending" for s in dep_status):
+                    status[name] = "pending"
+                    print(f"pending  {name}")
+                elif all(s in ("cached", "done") for s in dep_status):
+                    try:
+                        key = stage_key(stage)
+                    except OSError as error:
+                        status[name] = "failed"
+                        print(f"failed   {name}: {error}")
+                        continue
+                    if is_cached(stage, key):
+                        status[name] = "cached"
+                        print(f"cached   {name}")
+                    elif dry_run:
+                        status[name] = "pending"
+                        print(f"pending  {name}")
+                    else:
+                        print(f"running  {name}")
+                        futures[executor.submit(execute, stage, key)] = name
+            if not futures:
+                if len(status) == resolved:
+                    raise ValueError("The stages contain a dependency on an unknown stage.")
+                continue
+            finished, _ = concurrent.futures.wait(
+                futures, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in finished:
+                name = futures.pop(future)
+                try:
+                    future.result()
+                    status[name] = "done"
+                    print(f"done     {name}")
+                except Exception as error:
+                    status[name] = "failed"
+                    print(f"failed   {name}: {error}")
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the stages of the benchmark whose inputs changed.")
+    parser.add_argument("config", help="path of the config file in json format")
+    parser.add_argument("--force", action="store_true", help="recompute all stages")
+    parser.add_argument("--dry-run", action="store_true", help="only print the stages to recompute")
+    args = parser.parse_args()
+    result = run_pipeline(args.config, force=args.force, dry_run=args.dry_run)
+    sys.exit(1 if "failed" in result.values() else 0)
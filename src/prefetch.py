@@ -0,0 +1,154 @@
+"""
+Provides a bounded background prefetch of the structures, so loading and parsing the next structures
+overlaps with the alignment of the current pair.
+
+The structures are loaded by background threads in the order in which they are used (schedule order)
+and handed over in this order. At most ``depth`` structures are loaded or waiting ahead of the consumer
+and no new structure is started, while the waiting structures exceed the memory limit.
+Only the standard library is used, so the prefetch can also be used in PyMol and ChimeraX.
+"""
+
+import threading
+
+
+class Prefetcher:
+    """
+    Loads items in the background and returns them in the given order.
+
+    Parameters
+    ----------
+    items: list
+        The items in the order in which they are used, e.g. the PDB-IDs of the structures.
+
+    load: function
+        Called with an item in a background thread, returns the loaded item.
+
+    depth: int, Optional
+        Maximal number of items loaded or waiting ahead of the consumer. Default is 4.
+
+    memory_limit: int, Optional
+        Maximal number of bytes of the waiting items, estimated by ``size``. The next item is always loaded,
+        so a single large item does not block the run. Default is no limit.
+
+    size: function, Optional
+        Called with a loaded item, returns its estimated memory in bytes. Default is 0 for every item.
+
+    threads: int, Optional
+        Number of background threads. Default is 1.
+
+    .. note::
+
+        Errors of ``load`` are raised in the consumer, when the item is requested.
+        Use the prefetcher as iterator or call ``close``, so the background threads stop, if the run ends early.
+    """
+
+    def __init__(self, items, load, depth=4, memory_limit=None, size=None, threads=1):
+        if depth < 1:
+            raise ValueError("The prefetch depth needs to be at least 1.")
+        self.items = list(items)
+        self.load = load
+        self.depth = depth
+        self.memory_limit = memory_limit
+        self.size = size or (lambda loaded: 0)
+        self._condition = threading.Condition()
+        # loaded items waiting for the consumer: position -> (loaded item, error, size)
+        self._ready = {}
+        self._held = 0
+        self._submitted = 0
+        self._consumed = 0
+        self._closed = False
+        self._threads = [threading.Thread(target=self._produce, daemon=True) for _ in range(threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def _may_start(self):
+        # the next item is always allowed, if nothing is waiting, otherwise the depth and the memory limit apply
+        if self._submitted - self._consumed >= self.depth:
+            return False
+        return self.memory_limit is None or self._held < self.memory_limit or not self._ready
+
+    def _produce(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._closed or self._submitted >= len(self.items) or self._may_start()
+                )
+                if self._closed or self._submitted >= len(self.items):
+                    return
+                position = self._submitted
+                self._submitted += 1
+            loaded, error, size = None, None, 0
+            try:
+                loaded = self.load(self.items[position])
+                size = self.size(loaded)
+            except Exception as e:
+                error = e
+            with self._condition:
+                self._ready[position] = (loaded, error, size)
+                self._held += size
+                self._condition.notify_all()
+
+    def __iter__(self):
+        try:
+            for position in range(len(self.items)):
+                with self._condition:
+                    self._condition.wait_for(lambda: position in self._ready)
+                    loaded, error, size = self._ready.pop(position)
+                    self._held -= size
+                    self._consumed = position + 1
+                    self._condition.notify_all()
+                if error is not None:
+                    raise error
+                yield loaded
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Stops the background threads after their current item.
+
+        Returns
+        -------
+        None
+        """
+
+        with self._condition:
+            self._closed = True
+            self._ready.clear()
+            self._condition.notify_all()
+
+
+def prefetch(items, load, depth=4, memory_limit=None, size=None, threads=1):
+    """
+    Returns the loaded items in the given order, loading up to ``depth`` items ahead in the background.
+    With depth 0, the items are loaded on demand without background threads.
+
+    Parameters
+    ----------
+    items: list
+        The items in the order in which they are used.
+
+    load: function
+        Called with an item, returns the loaded item.
+
+    depth: int, Optional
+        See ``Prefetcher``. Default is 4.
+
+    memory_limit: int, Optional
+        See ``Prefetcher``. Default is no limit.
+
+    size: function, Optional
+        See ``Prefetcher``.
+
+    threads: int, Optional
+        See ``Prefetcher``. Default is 1.
+
+    Returns
+    -------
+    iterator
+        The loaded items.
+    """
+
+    if depth == 0:
+        return (load(item) for item in items)
+    return iter(Prefetcher(items, load, depth=depth, memory_limit=memory_limit, size=size, threads=threads))
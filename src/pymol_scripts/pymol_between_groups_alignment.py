@@ -3,64 +3,186 @@ This script is used to run all alignments between two sample sets.
 The paths to the sample set files need to be changed appropriately.
 After changing the paths, run this script in the terminal by calling "pymol pymol_between_groups_alignment.py > <PATH_TO_OUTPUT_FILE>"
 This output file is parsed afterwards using the "pymol_log_parser.py".
+The number of warm-up and measured alignments for every pair can be set by WARMUP and REPEATS.
+The sizes of the structures are taken from the chain index created by "structure_utils.build_chain_index",
+the path to the chain index needs to be changed appropriately as well.
+When the path to the pocket index created by "structure_utils.build_pocket_index" is provided,
+only the CA atoms of the KLIFS pocket are aligned (pocket mode).
+When the path to the cache folder of the PDB files is provided, the structures are loaded from the cache folder instead of fetched,
+the files are downloaded (if missing) and read in the background ahead of their alignment (PREFETCH_DEPTH),
+so synthetic structures created by "synthetic_structures.py" can be aligned without network access.
 """
 
 from pymol import cmd
+import os
+import sys
 import time
 
+# the helper modules are shared with the other drivers and located in the src folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from prefetch import prefetch
+from residue_store import ResidueStore, match_residues
+from structure_utils import fetch_pdb_file, read_chain_index, read_pocket_index, read_samples
+from telemetry import Telemetry
+from timing_utils import TIMING_SCOPES, format_timing, time_call
+from transform_store import TransformStore, alignment_transform
+
+# number of alignments before the measurement and number of measured alignments for every pair
+WARMUP = 0
+REPEATS = 1
+
+# path of the metrics file written periodically during the run (None for no file), see "telemetry.py"
+# the progress line is written to stderr, so the log is not changed
+METRICS_PATH = None
+METRICS_FORMAT = "json"
+
+# number of PDB files downloaded and read ahead in a background thread, while the current pair is aligned (0 to disable)
+# and maximal size of the files read ahead in bytes (None for no limit), only used with the cache folder of the PDB files
+PREFETCH_DEPTH = 4
+PREFETCH_MEMORY = None
+
+# folder of the store of the per-residue deviations (None for no capture), see "residue_store.py"
+RESIDUE_STORE = None
+
+# folder of the store of the 4x4 transformation matrices (None for no capture), see "transform_store.py"
+TRANSFORM_STORE = None
+
 # get all structures (the sample sets created before, so the same structures as for OpenCADD)
-reference_strucs = []
-with open("<PATH_TO_SAMPLE_SET1>") as f:
-    # split line, so no newline characters are left
-    # then split lines into lists to get the same structure as in the benchmark for the OpenCADD methods
-    temp = f.read().splitlines()
-    for line in temp:
-        struc = line.split(",")
-        reference_strucs.append(struc)
-
-mobile_strucs = []
-with open("<PATH_TO_SAMPLE_SET2>") as f:
-    # split line, so no newline characters are left
-    # then split lines into lists to get the same structure as in the benchmark for the OpenCADD methods
-    temp = f.read().splitlines()
-    for line in temp:
-        struc = line.split(",")
-        mobile_strucs.append(struc)
+# the paths can also be passed as arguments:
+# "pymol -cq pymol_between_groups_alignment.py -- <SAMPLE_SET1> <SAMPLE_SET2> <CHAIN_INDEX> [<POCKET_INDEX> [<PDB_CACHE>]]"
+if len(sys.argv) > 3:
+    sample1_path, sample2_path, chain_index_path = sys.argv[1:4]
+else:
+    sample1_path = "<PATH_TO_SAMPLE_SET1>"
+    sample2_path = "<PATH_TO_SAMPLE_SET2>"
+    chain_index_path = "<PATH_TO_CHAIN_INDEX>"
+# the pocket mode is used, when the path to the pocket index is provided ("-" for the alignment of the complete chains)
+pocket_index_path = sys.argv[4] if len(sys.argv) > 4 and sys.argv[4] != "-" else None
+cache_dir = sys.argv[5] if len(sys.argv) > 5 else None
 
-counter = 0
+reference_strucs = read_samples(sample1_path)
+mobile_strucs = read_samples(sample2_path)
 
-for structure in reference_strucs:
-    for mobile in mobile_strucs:
-        counter += 1
-        print(counter)
-        # set default to pdb download
-        cmd.set("fetch_type_default", "pdb")
-        cmd.fetch(structure[0])
-        print(f"reference: {structure}")
-        # get size of reference structure
-        s1_size = cmd.select(f"n. CA and chain {structure[4]} and not alt A")
-        print(f"reference_size: {s1_size}")
-        # reinitialize to get the size of the other structure
-        cmd.reinitialize()
-        cmd.set("fetch_type_default", "pdb")
-        cmd.fetch(mobile[0])
-        print(f"mobile: {mobile}")
-        # size of mobile structure
-        mobile_size = cmd.select(f"n. CA and chain {mobile[4]} and not alt A")
-        print(f"mobile_size: {mobile_size}")
-        # have to fetch reference again, pymol saves all fetched structures in local files
-        # so this is very fast
+# sizes of all structures, computed once for all methods
+chain_index = read_chain_index(chain_index_path)
+pocket_index = read_pocket_index(pocket_index_path) if pocket_index_path else None
+
+
+def select(structure):
+    # only take the same chains as in OpenCADD and only CA
+    # altlocs are not used in computation
+    selection = f"{structure[0]}////ca and chain {structure[4]} and not alt A"
+    if pocket_index:
+        # only the residues of the KLIFS pocket, the residues are selected by their number and insertion code
+        selection += f" and resi {'+'.join(pocket_index[(structure[0], structure[4])]['residues'])}"
+    return selection
+
+
+def read_pdb_file(pdb_id):
+    # called in the background thread, only the download and the reading of the file, because PyMol is not thread-safe
+    with open(fetch_pdb_file(pdb_id, cache_dir)) as f:
+        return f.read()
+
+
+# pairs in the order of the alignments
+pairs = [(structure, mobile) for structure in reference_strucs for mobile in mobile_strucs]
+# with the cache folder, the PDB files are prefetched in the order in which the structures are loaded,
+# missing files are downloaded to the cache folder, otherwise the structures are fetched by PyMol
+pdb_files = (
+    prefetch(
+        [pdb[0] for pair in pairs for pdb in pair],
+        read_pdb_file,
+        depth=PREFETCH_DEPTH,
+        memory_limit=PREFETCH_MEMORY,
+        size=len,
+    )
+    if cache_dir
+    else None
+)
+
+
+def load(structure):
+    if pdb_files:
+        cmd.read_pdbstr(next(pdb_files), structure[0])
+    else:
         cmd.fetch(structure[0])
-        start_time = time.time()
-        # actual computation
-        # only take the same chains as in OpenCADD and only CA
-        # altlocs are not used in computation
-        res = cmd.align(
-            f"{structure[0]}////ca and chain {structure[4]} and not alt A",
-            f"{mobile[0]}////ca and chain {mobile[4]} and not alt A",
+
+
+def capture_deviations(structure, mobile, method):
+    models = [cmd.get_model(select(structure)), cmd.get_model(select(mobile))]
+    reference_positions, mobile_positions, distances = match_residues(
+        [atom.coord for atom in models[0].atom], [atom.coord for atom in models[1].atom]
+    )
+    residue_store.append(
+        structure[0],
+        mobile[0],
+        method,
+        [models[0].atom[i].resi_number for i in reference_positions],
+        [models[1].atom[i].resi_number for i in mobile_positions],
+        distances,
+    )
+
+
+def size(structure):
+    if pocket_index:
+        return pocket_index[(structure[0], structure[4])]["pocket_size"]
+    return chain_index[(structure[0], structure[4])]["ca_count"]
+
+
+residue_store = ResidueStore(RESIDUE_STORE) if RESIDUE_STORE else None
+transform_store = TransformStore(TRANSFORM_STORE) if TRANSFORM_STORE else None
+counter = 0
+telemetry = Telemetry(len(pairs), metrics_path=METRICS_PATH, metrics_format=METRICS_FORMAT)
+print(f"timing_scope: {TIMING_SCOPES['pymol']}")
+print(f"mode: {'pocket' if pocket_index else 'chain'}")
+
+# the pairs are aligned in the order of the prefetched PDB files
+for structure, mobile in pairs:
+    start = time.perf_counter()
+    counter += 1
+    print(counter)
+    # set default to pdb download
+    cmd.set("fetch_type_default", "pdb")
+    load(structure)
+    print(f"reference: {structure}")
+    # get size of reference structure from the chain index or the pocket index
+    print(f"reference_size: {size(structure)}")
+    load(mobile)
+    print(f"mobile: {mobile}")
+    # size of mobile structure
+    print(f"mobile_size: {size(mobile)}")
+    if transform_store:
+        before = [cmd.get_coords(select(structure)), cmd.get_coords(select(mobile))]
+    # actual computation
+    # only the call of cmd.align is measured
+    res, timing = time_call(
+        cmd.align,
+        select(structure),
+        select(mobile),
+        warmup=WARMUP,
+        repeats=REPEATS,
+    )
+    print(f"result: {res}")
+    print(f"time: {timing['time']}")
+    print(format_timing(timing))
+    if residue_store:
+        # cmd.align moves the reference structure onto the mobile structure with refinement
+        capture_deviations(structure, mobile, "pymol_refined")
+    if transform_store:
+        transform_store.append(
+            structure[0],
+            mobile[0],
+            "pymol_refined",
+            alignment_transform(
+                before[0], cmd.get_coords(select(structure)), before[1], cmd.get_coords(select(mobile))
+            ),
         )
-        end_time = time.time()
-        duration = round(end_time - start_time, 4)
-        print(f"result: {res}")
-        print(f"time: {duration}")
-        cmd.reinitialize()
+    cmd.reinitialize()
+    # wall time of the pair including loading, the measured alignment time is in the log
+    telemetry.record("pymol", time.perf_counter() - start)
+
+telemetry.update()
+if residue_store:
+    residue_store.close()
+if transform_store:
+    transform_store.close()
@@ -3,122 +3,159 @@ This script is used to parse the logfiles created by the alignment scripts for p
 It saves the results in a csv for further analysis like in the notebooks.
 The path for the logfile aswell as the path for the resulting *.csv file need to be adjusted appropriately.
 For this project the csv file is saved in the `data/PyMol_results` folder.
+
+cmd.align returns the results before and after the refinement, so both are written from one alignment run:
+the rows with the method "pymol" contain the results without refinement,
+the rows with the method "pymol_refined" contain the results with refinement.
 """
 
-from numpy import e
+import numpy as np
 import pandas as pd
 import ast
+import os
+import sys
+
+# the helper modules are shared with the other methods and located in the src folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from results_utils import RESULT_COLUMNS, compute_quality_measures
+from timing_utils import parse_timing
+
+# positions of the RMSD and the coverage in the tuple returned by cmd.align for both variants
+VARIANTS = {
+    "pymol": (3, 4),  # without refinement
+    "pymol_refined": (0, 1),  # with refinement
+}
+
+
+def parse_log(log_path):
+    """
+    Parses the logfile of the PyMol alignment scripts.
+
+    Parameters
+    ----------
+    log_path: str
+        Path of the logfile.
+
+    Returns
+    -------
+    list
+        Contains a dict for every alignment with the information of the structures,
+        the sizes, the result tuple of cmd.align, the timing and the mode.
+    """
+
+    with open(str(log_path)) as f:
+        lines = f.readlines()
+
+    alignments = []
+    entry = {}
+    # logs created before the pocket mode was introduced contain alignments of the complete chains
+    mode = "chain"
+    for line in lines:
+        if line.startswith("mode: "):
+            mode = line.split(" ")[1].strip()
+        elif line.startswith("reference: "):
+            entry = {"reference": ast.literal_eval(line.split(": ")[1]), "mode": mode}
+        elif line.startswith("reference_size: "):
+            entry["reference_size"] = int(line.split(" ")[1])
+        elif line.startswith("mobile: "):
+            entry["mobile"] = ast.literal_eval(line.split(": ")[1])
+        elif line.startswith("mobile_size: "):
+            entry["mobile_size"] = int(line.split(" ")[1])
+        elif line.startswith("result: "):
+            result = line.split(": (")
+            entry["result"] = ast.literal_eval(result[1][:-2])
+        elif line.startswith("time: "):
+            # logs created before the timing harness was introduced only contain the time of a single alignment
+            entry["timing"] = {
+                "time": float(line.split(" ")[1]),
+                "time_median": np.nan,
+                "time_spread": np.nan,
+            }
+            alignments.append(entry)
+        elif line.startswith("timing: "):
+            entry["timing"] = parse_timing(line)
+    return alignments
+
+
+def create_results(alignments, variants=("pymol", "pymol_refined"), w0=1.5, chain_index=None):
+    """
+    Creates the result DataFrame from the parsed alignments.
+
+    Parameters
+    ----------
+    alignments: list
+        The alignments returned by ``parse_log``.
+
+    variants: tuple, Optional
+        The variants written to the DataFrame, see ``VARIANTS``. Default are both variants.
+
+    w0: float, Optional
+        The value for the normalization factor for MI. Default is set to 1.5 analog to the other methods.
+
+    chain_index: dict, Optional
+        The chain index returned by ``structure_utils.read_chain_index``.
+        If provided, the sizes of the structures are taken from the index instead of the logfile,
+        e.g. for logfiles created before the chain index was introduced.
+        The sizes of alignments in the pocket mode are always taken from the logfile.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        Contains one row for every alignment and variant.
+    """
+
+    rows = []
+    for variant in variants:
+        rmsd_index, cov_index = VARIANTS[variant]
+        for alignment in alignments:
+            structure = alignment["reference"]
+            mobile = alignment["mobile"]
+            if chain_index and alignment["mode"] == "chain":
+                reference_size = chain_index[(structure[0], structure[4])]["ca_count"]
+                mobile_size = chain_index[(mobile[0], mobile[4])]["ca_count"]
+            else:
+                reference_size = alignment["reference_size"]
+                mobile_size = alignment["mobile_size"]
+            rmsd = round(float(alignment["result"][rmsd_index]), 4)
+            cov = int(alignment["result"][cov_index])
+            si, mi, sas = compute_quality_measures(rmsd, cov, reference_size, mobile_size, w0)
+            rows.append(
+                [
+                    structure[0],
+                    mobile[0],
+                    variant,
+                    rmsd,
+                    cov,
+                    reference_size,
+                    mobile_size,
+                    alignment["timing"]["time"],
+                    si,
+                    mi,
+                    sas,
+                    structure[1],
+                    structure[2],
+                    structure[3],
+                    structure[4],
+                    mobile[1],
+                    mobile[2],
+                    mobile[3],
+                    mobile[4],
+                    alignment["timing"]["time_median"],
+                    alignment["timing"]["time_spread"],
+                    alignment["mode"],
+                    # the alignments in PyMol are not warm-started
+                    False,
+                ]
+            )
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
 
-with open("<PATH_TO_LOG_FILE>") as f:
-    lines = f.readlines()
-
-ref_list = []
-ref_name = []
-ref_group = []
-ref_species = []
-ref_chain = []
-ref_size_list = []
-mob_list = []
-mob_name = []
-mob_group = []
-mob_species = []
-mob_chain = []
-mob_size_list = []
-rmsd_list = []
-cov_list = []
-time_list = []
-
-w0 = 1.5  # set the normalization factor of MI to 1.5 analog to the other methods
-method = "pymol"
-
-df = pd.DataFrame(
-    columns=[
-        "reference_id",
-        "mobile_id",
-        "method",
-        "rmsd",
-        "coverage",
-        "reference_size",
-        "mobile_size",
-        "time",
-        "SI",
-        "MI",
-        "SAS",
-        "ref_name",
-        "ref_group",
-        "ref_species",
-        "ref_chain",
-        "mob_name",
-        "mob_group",
-        "mob_species",
-        "mob_chain",
-    ]
-)
-
-
-# parsing of the file
-for line in lines:
-    if line.startswith("reference: "):
-        ref = line.split(": ")[1]
-        ref_info = ast.literal_eval(ref)
-        ref_list.append(ref_info[0])
-        ref_name.append(ref_info[1])
-        ref_group.append(ref_info[2])
-        ref_species.append(ref_info[3])
-        ref_chain.append(ref_info[4])
-    elif line.startswith("reference_size: "):
-        ref_size_list.append(int(line.split(" ")[1]))
-    elif line.startswith("mobile: "):
-        mob = line.split(": ")[1]
-        mob_info = ast.literal_eval(mob)
-        mob_list.append(mob_info[0])
-        mob_name.append(mob_info[1])
-        mob_group.append(mob_info[2])
-        mob_species.append(mob_info[3])
-        mob_chain.append(mob_info[4])
-    elif line.startswith("mobile_size: "):
-        mob_size_list.append(int(line.split(" ")[1]))
-    elif line.startswith("result: "):
-        result = line.split(": (")
-        result = ast.literal_eval(result[1][:-2])
-        # use the next two lines for results with refinement
-        # rmsd_list.append(round(float(result[0]), 4))
-        # cov_list.append(int(result[1]))
-
-        # use the next two lines for resutls without refinement
-        rmsd_list.append(round(float(result[3]), 4))
-        cov_list.append(int(result[4]))
-    elif line.startswith("time: "):
-        time_list.append(float(line.split(" ")[1]))
-
-for entry in range(len(ref_list)):
-    si = (rmsd_list[entry] * min(ref_size_list[entry], mob_size_list[entry])) / cov_list[entry]
-    mi = 1 - (
-        (1 + cov_list[entry])
-        / ((1 + (rmsd_list[entry] / w0)) * (1 + min(ref_size_list[entry], mob_size_list[entry])))
-    )
-    sas = (rmsd_list[entry] * 100) / cov_list[entry]
-
-    df.loc[entry] = [
-        ref_list[entry],
-        mob_list[entry],
-        method,
-        rmsd_list[entry],
-        cov_list[entry],
-        ref_size_list[entry],
-        mob_size_list[entry],
-        time_list[entry],
-        si,
-        mi,
-        sas,
-        ref_name[entry],
-        ref_group[entry],
-        ref_species[entry],
-        ref_chain[entry],
-        mob_name[entry],
-        mob_group[entry],
-        mob_species[entry],
-        mob_chain[entry],
-    ]
-
-df.to_csv("<PATH_FOR_RESULT.csv>", mode="w", header=False, index=False)
+if __name__ == "__main__":
+    # the paths can also be passed as arguments: "python3 pymol_log_parser.py <LOGFILE> <RESULT.csv>"
+    if len(sys.argv) > 2:
+        log_path, result_path = sys.argv[1:3]
+    else:
+        log_path = "<PATH_TO_LOG_FILE>"
+        result_path = "<PATH_FOR_RESULT.csv>"
+    df = create_results(parse_log(log_path))
+    df.to_csv(result_path, mode="w", header=False, index=False)
@@ -0,0 +1,123 @@
+"""
+This script is used to run the PyMol alignments of a work queue created by "work_queue.py" (method "pymol"),
+so the alignments can be spread over several machines. Every machine runs this script with its own output file,
+the script claims jobs from the queue until no job is left. Jobs of a stopped machine are claimed again after their lease expired.
+Run this script in the terminal by calling "pymol -cq pymol_queue_alignment.py -- <QUEUE> <CHAIN_INDEX> > <PATH_TO_OUTPUT_FILE>"
+Every output file is parsed afterwards using the "pymol_log_parser.py".
+The number of warm-up and measured alignments for every pair can be set by WARMUP and REPEATS.
+When the path to the pocket index created by "structure_utils.build_pocket_index" is provided,
+only the CA atoms of the KLIFS pocket are aligned (pocket mode).
+When the path to the cache folder of the PDB files is provided, the structures are loaded from the cache folder instead of fetched.
+"""
+
+from pymol import cmd
+import os
+import sys
+import time
+
+# the helper modules are shared with the other drivers and located in the src folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from failure_cache import DETERMINISTIC, classify_failure
+from structure_utils import fetch_pdb_file, read_chain_index, read_pocket_index
+from telemetry import Telemetry
+from timing_utils import TIMING_SCOPES, format_timing, time_call
+from work_queue import claim_jobs, complete_job, default_worker, fail_job, queue_status, release_jobs
+
+# number of alignments before the measurement and number of measured alignments for every pair
+WARMUP = 0
+REPEATS = 1
+
+# path of the metrics file written periodically during the run (None for no file), see "telemetry.py"
+METRICS_PATH = None
+METRICS_FORMAT = "json"
+
+# number of jobs claimed at once and number of seconds they are reserved for this machine
+QUEUE_BATCH = 10
+QUEUE_LEASE = 600
+
+# "pymol -cq pymol_queue_alignment.py -- <QUEUE> <CHAIN_INDEX> [<POCKET_INDEX> [<PDB_CACHE>]]"
+queue_path, chain_index_path = sys.argv[1:3]
+# the pocket mode is used, when the path to the pocket index is provided ("-" for the alignment of the complete chains)
+pocket_index_path = sys.argv[3] if len(sys.argv) > 3 and sys.argv[3] != "-" else None
+cache_dir = sys.argv[4] if len(sys.argv) > 4 else None
+
+chain_index = read_chain_index(chain_index_path)
+pocket_index = read_pocket_index(pocket_index_path) if pocket_index_path else None
+worker = default_worker()
+
+
+def select(structure):
+    # only take the same chains as in OpenCADD and only CA
+    # altlocs are not used in computation
+    selection = f"{structure[0]}////ca and chain {structure[4]} and not alt A"
+    if pocket_index:
+        # only the residues of the KLIFS pocket, the residues are selected by their number and insertion code
+        selection += f" and resi {'+'.join(pocket_index[(structure[0], structure[4])]['residues'])}"
+    return selection
+
+
+def load(structure):
+    if cache_dir:
+        cmd.load(fetch_pdb_file(structure[0], cache_dir), structure[0])
+    else:
+        cmd.fetch(structure[0])
+
+
+def size(structure):
+    if pocket_index:
+        return pocket_index[(structure[0], structure[4])]["pocket_size"]
+    return chain_index[(structure[0], structure[4])]["ca_count"]
+
+
+counter = 0
+telemetry = Telemetry(
+    sum(queue_status(queue_path).get("pymol", {}).get(status, 0) for status in ["pending", "running"]),
+    metrics_path=METRICS_PATH,
+    metrics_format=METRICS_FORMAT,
+)
+print(f"timing_scope: {TIMING_SCOPES['pymol']}")
+print(f"mode: {'pocket' if pocket_index else 'chain'}")
+
+try:
+    jobs = claim_jobs(queue_path, worker, methods=["pymol"], count=QUEUE_BATCH, lease=QUEUE_LEASE)
+    while jobs:
+        for job in jobs:
+            structure, mobile = job["structure"], job["mobile"]
+            start = time.perf_counter()
+            try:
+                cmd.set("fetch_type_default", "pdb")
+                load(structure)
+                load(mobile)
+                res, timing = time_call(
+                    cmd.align,
+                    select(structure),
+                    select(mobile),
+                    warmup=WARMUP,
+                    repeats=REPEATS,
+                )
+            except Exception as e:
+                # nothing is written to the log, the job is returned to the queue for another attempt,
+                # unless the failure is deterministic, e.g. an empty selection
+                category = classify_failure(e)
+                fail_job(queue_path, job["id"], f"{category}: {e!r}", worker, deterministic=category in DETERMINISTIC)
+                telemetry.record("pymol", time.perf_counter() - start, failed=True)
+                cmd.reinitialize()
+                continue
+            # the log of a job is only written after the alignment, so the log contains no incomplete alignments
+            counter += 1
+            print(counter)
+            print(f"reference: {structure}")
+            print(f"reference_size: {size(structure)}")
+            print(f"mobile: {mobile}")
+            print(f"mobile_size: {size(mobile)}")
+            print(f"result: {res}")
+            print(f"time: {timing['time']}")
+            print(format_timing(timing))
+            cmd.reinitialize()
+            # the results are in the log, the queue only records that the job is done
+            complete_job(queue_path, job["id"], worker)
+            telemetry.record("pymol", time.perf_counter() - start)
+        jobs = claim_jobs(queue_path, worker, methods=["pymol"], count=QUEUE_BATCH, lease=QUEUE_LEASE)
+finally:
+    release_jobs(queue_path, worker)
+    telemetry.update()
@@ -0,0 +1,212 @@
+"""
+Provides a compact store of the per-residue deviations of the alignments, so deeper analyses do not need to repeat the alignments.
+
+After the superposition, the CA atoms of both structures are matched as mutual nearest neighbours,
+which gives the same residue correspondence for all methods and tools. For every (pair, method) the store contains
+the residue numbers of the matched reference and mobile residues (int16) and their distances in Angstrom (float16).
+The values of all alignments are appended to three flat files, the index contains the offset and the length of every alignment:
+
+    <store>/reference_residues.i16
+    <store>/mobile_residues.i16
+    <store>/distances.f16
+    <store>/index.csv  (reference_id, mobile_id, method, offset, length)
+
+The store is read with ``load_residue_store`` and the accessors in ``analysis_utils`` without reading all values into memory.
+Only the standard library and NumPy are used, so the deviations can also be captured in PyMol and ChimeraX.
+"""
+
+import csv
+import os
+
+import numpy as np
+
+INDEX_FILE = "index.csv"
+
+INDEX_COLUMNS = ["reference_id", "mobile_id", "method", "offset", "length"]
+
+# flat files of the store with their data types
+ARRAYS = {
+    "reference_residues": ("reference_residues.i16", np.int16),
+    "mobile_residues": ("mobile_residues.i16", np.int16),
+    "distances": ("distances.f16", np.float16),
+}
+
+
+def match_residues(reference_coords, mobile_coords):
+    """
+    Matches the CA atoms of the superposed structures as mutual nearest neighbours.
+
+    Parameters
+    ----------
+    reference_coords: numpy.ndarray
+        Coordinates of the CA atoms of the reference structure, shape (N, 3).
+
+    mobile_coords: numpy.ndarray
+        Coordinates of the CA atoms of the mobile structure in the same frame, shape (M, 3).
+
+    Returns
+    -------
+    tuple
+        The positions of the matched atoms in the reference and the mobile structure and their distances.
+    """
+
+    reference_coords = np.asarray(reference_coords, dtype=float)
+    mobile_coords = np.asarray(mobile_coords, dtype=float)
+    if not len(reference_coords) or not len(mobile_coords):
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0)
+    distances = np.linalg.norm(reference_coords[:, None, :] - mobile_coords[None, :, :], axis=2)
+    nearest_mobile = distances.argmin(axis=1)
+    nearest_reference = distances.argmin(axis=0)
+    reference_positions = np.flatnonzero(nearest_reference[nearest_mobile] == np.arange(len(reference_coords)))
+    mobile_positions = nearest_mobile[reference_positions]
+    return reference_positions, mobile_positions, distances[reference_positions, mobile_positions]
+
+
+class ResidueStore:
+    """
+    Appends the per-residue deviations of alignments to a store.
+
+    Parameters
+    ----------
+    store_dir: str
+        Folder of the store. An existing store is continued.
+
+    .. note::
+
+        Only one process may write to a store at the same time. Parallel runs collect the deviations in the workers
+        and write them in the main process.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = str(store_dir)
+        os.makedirs(self.store_dir, exist_ok=True)
+        self.offset = 0
+        path = os.path.join(self.store_dir, ARRAYS["distances"][0])
+        if os.path.isfile(path):
+            self.offset = os.path.getsize(path) // np.dtype(np.float16).itemsize
+        index_path = os.path.join(self.store_dir, INDEX_FILE)
+        is_new = not os.path.isfile(index_path)
+        self._index = open(index_path, "a", newline="")
+        self._writer = csv.writer(self._index)
+        if is_new:
+            self._writer.writerow(INDEX_COLUMNS)
+        self._files = {name: open(os.path.join(self.store_dir, file), "ab") for name, (file, _) in ARRAYS.items()}
+
+    def append(self, reference_id, mobile_id, method, reference_residues, mobile_residues, distances):
+        """
+        Appends the deviations of one alignment.
+
+        Parameters
+        ----------
+        reference_id: str
+            PDB-ID of the reference structure.
+
+        mobile_id: str
+            PDB-ID of the mobile structure.
+
+        method: str
+            The method.
+
+        reference_residues: numpy.ndarray
+            Residue numbers of the matched reference residues.
+
+        mobile_residues: numpy.ndarray
+            Residue numbers of the matched mobile residues.
+
+        distances: numpy.ndarray
+            Distances of the matched CA atoms after the superposition.
+
+        Returns
+        -------
+        None
+        """
+
+        values = {
+            "reference_residues": reference_residues,
+            "mobile_residues": mobile_residues,
+            "distances": distances,
+        }
+        for name, (_, dtype) in ARRAYS.items():
+            self._files[name].write(np.asarray(values[name]).astype(dtype).tobytes())
+        self._writer.writerow([reference_id, mobile_id, method, self.offset, len(distances)])
+        self.offset += len(distances)
+
+    def flush(self):
+        """
+        Writes the buffered deviations to the files, e.g. so the store can be read during a run.
+
+        Returns
+        -------
+        None
+        """
+
+        for f in self._files.values():
+            f.flush()
+        self._index.flush()
+
+    def close(self):
+        """
+        Closes the files of the store.
+
+        Returns
+        -------
+        None
+        """
+
+        for f in self._files.values():
+            f.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class CapturedDeviations:
+    """
+    Collects the deviations like ``ResidueStore`` in memory, e.g. in worker processes.
+    The collected deviations are written to a store with ``write_to``.
+    """
+
+    def __init__(self):
+        self.entries = []
+
+    def append(self, *entry):
+        self.entries.append(entry)
+
+    def write_to(self, store):
+        for entry in self.entries:
+            store.append(*entry)
+
+
+def load_residue_store(store_dir):
+    """
+    Opens a store without reading the deviations into memory.
+
+    Parameters
+    ----------
+    store_dir: str
+        Folder of the store.
+
+    Returns
+    -------
+    dict
+        Contains "positions" (dict mapping (reference_id, mobile_id, method) to (offset, length))
+        and the read-only memory-mapped arrays "reference_residues", "mobile_residues" and "distances".
+    """
+
+    store = {"positions": {}}
+    with open(os.path.join(str(store_dir), INDEX_FILE), newline="") as f:
+        for row in csv.DictReader(f):
+            # a repeated alignment replaces the previous entry
+            store["positions"][(row["reference_id"], row["mobile_id"], row["method"])] = (
+                int(row["offset"]),
+                int(row["length"]),
+            )
+    for name, (file, dtype) in ARRAYS.items():
+        path = os.path.join(str(store_dir), file)
+        # np.memmap can not map empty files
+        store[name] = np.memmap(path, dtype=dtype, mode="r") if os.path.getsize(path) else np.zeros(0, dtype=dtype)
+    return store
@@ -0,0 +1,230 @@
+"""
+Provides a resource governor for the parallel alignment runs, so the workers do not oversubscribe the cores.
+
+The methods use NumPy with a threaded BLAS library and start external programs (Clustal Omega, Theseus, MMLigner).
+With several workers, every worker would use all cores, which reduces the throughput and makes the measured times noisy.
+The governor pins the number of BLAS and OpenMP threads of every worker (environment variables, which are inherited by the
+external programs, and threadpoolctl for the libraries which are already loaded), limits the number of
+alignments of a method running at the same time in all workers and optionally binds every worker to its own cores.
+The forked workers have loaded NumPy and its BLAS library already, which read the environment variables only when
+they are loaded, so the threads of the workers themselves are only pinned with threadpoolctl
+(part of the environment file). The thread pools in effect after the pinning are inspected with threadpoolctl as well
+and are returned by ``ResourceGovernor.settings`` with the other settings, which are recorded with the results,
+so the times are reproducible. Without threadpoolctl, the thread pools in effect are recorded as unknown (None).
+"""
+
+import contextlib
+import importlib.util
+import multiprocessing
+import os
+
+# environment variables of the thread pools of the BLAS and OpenMP libraries
+THREAD_VARIABLES = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "BLIS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+]
+
+# the governor of the current process, set by ``activate``
+_active = None
+
+
+class ResourceGovernor:
+    """
+    Limits the threads, the concurrent external programs and optionally the cores of the alignment workers.
+
+    Parameters
+    ----------
+    threads: int, Optional
+        Number of BLAS and OpenMP threads of every worker. Default is None, the thread pools are not changed.
+
+    subprocess_limits: dict, Optional
+        Maps the methods to the maximal number of their alignments (and external programs) running at the same time
+        in all workers, e.g. {"theseus": 2}. Default is no limit.
+
+    affinity: bool, Optional
+        If True, every worker is bound to its own block of ``threads`` cores (Linux only). Default is False.
+
+    .. note::
+
+        The governor is passed to the worker processes with ``activate`` as initializer of the process pool,
+        because the semaphores of the limits can only be shared, when the processes are started.
+    """
+
+    def __init__(self, threads=None, subprocess_limits=None, affinity=False):
+        self.threads = threads
+        self.subprocess_limits = dict(subprocess_limits or {})
+        self.affinity = affinity and hasattr(os, "sched_setaffinity")
+        self._semaphores = {
+            method: multiprocessing.BoundedSemaphore(limit) for method, limit in self.subprocess_limits.items()
+        }
+        self._workers = multiprocessing.Value("i", 0)
+        self.worker = None
+        self.cpus = None
+        self.thread_pools = None
+
+    def apply(self, worker=0):
+        """
+        Pins the threads and the cores of the current process and inspects the thread pools in effect afterwards.
+
+        Parameters
+        ----------
+        worker: int, Optional
+            Index of the worker, selects the block of cores. Default is 0.
+
+        Returns
+        -------
+        None
+        """
+
+        self.worker = worker
+        if self.threads:
+            for variable in THREAD_VARIABLES:
+                os.environ[variable] = str(self.threads)
+            if importlib.util.find_spec("threadpoolctl"):
+                # the thread pools of libraries loaded before, e.g. the BLAS library of NumPy
+                from threadpoolctl import threadpool_limits
+
+                threadpool_limits(self.threads)
+        if self.affinity:
+            available = sorted(os.sched_getaffinity(0))
+            size = self.threads or 1
+            start = (worker * size) % len(available)
+            self.cpus = [available[(start + offset) % len(available)] for offset in range(min(size, len(available)))]
+            os.sched_setaffinity(0, self.cpus)
+        self.thread_pools = thread_pools()
+
+    def next_worker(self):
+        """
+        Returns the index of the next started worker, counted in all processes.
+
+        Returns
+        -------
+        int
+            The index.
+        """
+
+        with self._workers.get_lock():
+            worker = self._workers.value
+            self._workers.value += 1
+        return worker
+
+    @contextlib.contextmanager
+    def slot(self, method):
+        """
+        Waits until an alignment of the method may start and releases the slot afterwards.
+
+        Parameters
+        ----------
+        method: str
+            The method.
+        """
+
+        semaphore = self._semaphores.get(method)
+        if semaphore is None:
+            yield
+            return
+        with semaphore:
+            yield
+
+    def settings(self):
+        """
+        Returns the settings of the governor for the metadata of a run.
+
+        Returns
+        -------
+        dict
+            The requested number of threads, the thread pools in effect in the process, in which the governor was applied
+            (see ``thread_pools``), the limits of the methods, whether the cores are bound,
+            the number of available cores and whether threadpoolctl is used.
+        """
+
+        return {
+            "requested_threads": self.threads,
+            "thread_pools": self.thread_pools,
+            "thread_variables": THREAD_VARIABLES if self.threads else [],
+            "subprocess_limits": self.subprocess_limits,
+            "affinity": self.affinity,
+            "cpu_count": os.cpu_count(),
+            "threadpoolctl": importlib.util.find_spec("threadpoolctl") is not None,
+        }
+
+
+def thread_pools():
+    """
+    Returns the thread pools of the BLAS and OpenMP libraries loaded in the current process.
+
+    Returns
+    -------
+    list or None
+        Contains a dict with the library, its path and the number of threads in effect for every thread pool,
+        None if threadpoolctl is not installed and the thread pools are unknown.
+    """
+
+    if not importlib.util.find_spec("threadpoolctl"):
+        return None
+    from threadpoolctl import threadpool_info
+
+    return [
+        {"library": pool["internal_api"], "filepath": pool["filepath"], "num_threads": pool["num_threads"]}
+        for pool in threadpool_info()
+    ]
+
+
+def activate(governor, worker=None):
+    """
+    Applies the governor in the current process and makes it available by ``active_governor``.
+    Used as initializer of the worker processes.
+
+    Parameters
+    ----------
+    governor: ResourceGovernor
+        The governor.
+
+    worker: int, Optional
+        Index of the worker. Default is the next index counted by the governor.
+
+    Returns
+    -------
+    None
+    """
+
+    global _active
+    governor.apply(governor.next_worker() if worker is None else worker)
+    _active = governor
+
+
+def active_governor():
+    """
+    Returns the governor of the current process.
+
+    Returns
+    -------
+    ResourceGovernor or None
+        The governor set by ``activate``, None if no governor is used.
+    """
+
+    return _active
+
+
+def governed(method):
+    """
+    Returns the slot of the method of the active governor, a context without limit if no governor is used.
+
+    Parameters
+    ----------
+    method: str
+        The method.
+
+    Returns
+    -------
+    context manager
+        The slot.
+    """
+
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.slot(method)
@@ -0,0 +1,482 @@
+"""
+Provides the analysis of result sets larger than the memory with mergeable statistics of every method.
+
+The result files are read in chunks of rows and only the statistics of every method are kept: the number of values of
+every column, the sums and the sums of squared deviations from the mean of the numeric columns and a quantile sketch of
+every numeric column. The statistics of the chunks and of shards (e.g. result files processed in parallel processes or
+on other machines and saved with ``ResultStatistics.save``) are merged without loss, the squared deviations with the
+update of Chan et al., which is numerically stable unlike plain sums of squares. So the counts, the means and the
+one-way ANOVA tables are the same as returned by ``general_checks``, ``compute_mean_median`` and ``compute_anova`` in
+``analysis_utils.py`` (up to the rounding of floating-point sums), the medians are approximated by the sketches:
+
+    python result_statistics.py <RESULT.csv> [<RESULT.csv> <SHARD.json> ...] [--chunk-size 1000000] [--workers 4]
+        [--output <SHARD.json>]
+"""
+
+import argparse
+import concurrent.futures
+import json
+
+import numpy as np
+import pandas as pd
+
+from analysis_utils import AGREEMENT_METRICS
+from results_utils import read_results_chunks
+
+# number of rows read at once
+CHUNK_SIZE = 10**6
+
+# maximal relative error of the quantiles of the sketches
+SKETCH_ACCURACY = 0.005
+
+
+class QuantileSketch:
+    """
+    Mergeable sketch of the quantiles of a column with a bounded relative error.
+
+    The values are counted in buckets with logarithmically growing bounds, so the number of buckets only grows
+    with the logarithm of the range of the values and two sketches are merged by adding the counts of the buckets.
+
+    Parameters
+    ----------
+    accuracy: float, Optional
+        Maximal relative error of the quantiles. Default is ``SKETCH_ACCURACY``.
+    """
+
+    def __init__(self, accuracy=SKETCH_ACCURACY):
+        self.accuracy = accuracy
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = np.log(self._gamma)
+        # counts of the buckets of the positive values and of the absolute negative values
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, values):
+        """
+        Adds values to the sketch, NaN values are ignored.
+
+        Parameters
+        ----------
+        values: numpy.ndarray
+            The values.
+
+        Returns
+        -------
+        None
+        """
+
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self.zeros += int((values == 0).sum())
+        for buckets, selected in ((self.positive, values[values > 0]), (self.negative, -values[values < 0])):
+            # the bucket i contains the values in (gamma^(i-1), gamma^i]
+            indices, counts = np.unique(np.ceil(np.log(selected) / self._log_gamma).astype(np.int64), return_counts=True)
+            for index, count in zip(indices.tolist(), counts.tolist()):
+                buckets[index] = buckets.get(index, 0) + count
+
+    def merge(self, other):
+        """
+        Adds the values of another sketch with the same accuracy.
+
+        Parameters
+        ----------
+        other: QuantileSketch
+            The other sketch.
+
+        Returns
+        -------
+        None
+        """
+
+        if other.accuracy != self.accuracy:
+            raise ValueError(f"sketches with accuracy {self.accuracy} and {other.accuracy} can not be merged")
+        for buckets, other_buckets in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in other_buckets.items():
+                buckets[index] = buckets.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def _value(self, rank):
+        # the value of the given position in the sorted values: negative values, zeros, positive values
+        seen = 0
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return -2 * self._gamma**index / (self._gamma + 1)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return 2 * self._gamma**index / (self._gamma + 1)
+        return 2 * self._gamma ** max(self.positive) / (self._gamma + 1)
+
+    def quantile(self, q):
+        """
+        Returns an approximate quantile, interpolated linearly between two values like ``Pandas.Series.quantile``.
+
+        Parameters
+        ----------
+        q: float
+            The quantile between 0 and 1, e.g. 0.5 for the median.
+
+        Returns
+        -------
+        float
+            The quantile, NaN if the sketch is empty.
+        """
+
+        if self.count == 0:
+            return np.nan
+        rank = q * (self.count - 1)
+        lower = self._value(np.floor(rank))
+        upper = self._value(np.ceil(rank))
+        return lower + (upper - lower) * (rank - np.floor(rank))
+
+    def state(self):
+        """
+        Returns the content of the sketch for JSON files.
+
+        Returns
+        -------
+        dict
+            The accuracy, the counts of the buckets, the number of zeros and the number of values.
+        """
+
+        return {
+            "accuracy": self.accuracy,
+            "positive": {str(index): count for index, count in self.positive.items()},
+            "negative": {str(index): count for index, count in self.negative.items()},
+            "zeros": self.zeros,
+            "count": self.count,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Creates a sketch from the content returned by ``state``.
+
+        Parameters
+        ----------
+        state: dict
+            The content of the sketch.
+
+        Returns
+        -------
+        QuantileSketch
+            The sketch.
+        """
+
+        sketch = cls(state["accuracy"])
+        sketch.positive = {int(index): count for index, count in state["positive"].items()}
+        sketch.negative = {int(index): count for index, count in state["negative"].items()}
+        sketch.zeros = state["zeros"]
+        sketch.count = state["count"]
+        return sketch
+
+
+def _add_counts(counts1, counts2, columns):
+    # the counts of the methods and columns of both tables, the columns in the order of the result files
+    if counts1 is None:
+        return counts2.reindex(columns=columns, fill_value=0)
+    return counts1.add(counts2, fill_value=0).reindex(columns=columns, fill_value=0).astype(int)
+
+
+def _merge_moments(moments1, moments2, columns):
+    # the number of values, the sums and the sums of squared deviations of both tables (Chan et al.)
+    if moments1 is None:
+        return tuple(moment.reindex(columns=columns, fill_value=0) for moment in moments2)
+    index = moments1[0].index.union(moments2[0].index)
+    n1, sums1, squares1 = (moment.reindex(index=index, columns=columns, fill_value=0) for moment in moments1)
+    n2, sums2, squares2 = (moment.reindex(index=index, columns=columns, fill_value=0) for moment in moments2)
+    n = n1 + n2
+    both = (n1 > 0) & (n2 > 0)
+    delta = (sums2 / n2.where(both) - sums1 / n1.where(both)).where(both, 0)
+    squares = squares1 + squares2 + (delta**2 * n1 * n2 / n.where(both)).where(both, 0)
+    return n, sums1 + sums2, squares
+
+
+class ResultStatistics:
+    """
+    Statistics of every method of results, which are added in chunks and merged with the statistics of other shards.
+
+    Parameters
+    ----------
+    accuracy: float, Optional
+        Maximal relative error of the medians. Default is ``SKETCH_ACCURACY``.
+    """
+
+    def __init__(self, accuracy=SKETCH_ACCURACY):
+        self.accuracy = accuracy
+        self.columns = None
+        self.numeric_columns = None
+        self._counts = None
+        self._nans = None
+        self._moments = None
+        self._sketches = {}
+
+    def _set_columns(self, columns, numeric_columns):
+        # the columns of all chunks and shards, in the order of the first one
+        if self.columns is None:
+            self.columns = list(columns)
+            self.numeric_columns = list(numeric_columns)
+        else:
+            self.columns += [column for column in columns if column not in self.columns]
+            self.numeric_columns += [column for column in numeric_columns if column not in self.numeric_columns]
+
+    def update(self, chunk):
+        """
+        Adds a chunk of results.
+
+        Parameters
+        ----------
+        chunk: Pandas.DataFrame
+            The results, e.g. returned by ``results_utils.read_results_chunks``.
+
+        Returns
+        -------
+        None
+        """
+
+        others = chunk.drop(columns="method")
+        self._set_columns(others.columns, others.select_dtypes(include=["number", "bool"]).columns)
+        self._counts = _add_counts(self._counts, chunk.groupby("method").count(), self.columns)
+        self._nans = _add_counts(
+            self._nans, chunk[chunk["SI"].isnull()].groupby("method").count(), self.columns
+        )
+        values = chunk.reindex(columns=self.numeric_columns).astype(float)
+        grouped = values.groupby(chunk["method"])
+        n = grouped.count()
+        moments = (n, grouped.sum(), (grouped.var(ddof=0) * n).fillna(0))
+        self._moments = _merge_moments(self._moments, moments, self.numeric_columns)
+        for method, group in grouped:
+            for column in self.numeric_columns:
+                if (method, column) not in self._sketches:
+                    self._sketches[(method, column)] = QuantileSketch(self.accuracy)
+                self._sketches[(method, column)].add(group[column].to_numpy())
+
+    def merge(self, other):
+        """
+        Adds the statistics of another shard with the same accuracy.
+
+        Parameters
+        ----------
+        other: ResultStatistics
+            The statistics of the other shard.
+
+        Returns
+        -------
+        None
+        """
+
+        if other.columns is None:
+            return
+        self._set_columns(other.columns, other.numeric_columns)
+        self._counts = _add_counts(self._counts, other._counts, self.columns)
+        self._nans = _add_counts(self._nans, other._nans, self.columns)
+        self._moments = _merge_moments(self._moments, other._moments, self.numeric_columns)
+        for key, sketch in other._sketches.items():
+            if key not in self._sketches:
+                self._sketches[key] = QuantileSketch(self.accuracy)
+            self._sketches[key].merge(sketch)
+
+    def general_checks(self):
+        """
+        Returns the checks of ``analysis_utils.general_checks``.
+
+        Returns
+        -------
+        tuple
+            - counts: Pandas.DataFrame containing the amount of entries for each column and method
+            - nans: Pandas.DataFrame containing the amount of NaNs for each column and method
+            - times: Pandas.Series containing the time required for each method to perform the alignments
+        """
+
+        nans = self._nans[self._nans.sum(axis=1) > 0]
+        return self._counts, nans, round(self._moments[1]["time"] / 60, 2)
+
+    def mean_median(self):
+        """
+        Returns the means and the approximate medians of ``analysis_utils.compute_mean_median``.
+
+        Returns
+        -------
+        list
+            - means: Pandas.DataFrame containing the means of the numeric columns for each method
+            - medians: Pandas.DataFrame containing the medians of the numeric columns for each method,
+              with a relative error of at most the accuracy of the sketches
+        """
+
+        n, sums, _ = self._moments
+        medians = pd.DataFrame(
+            [[self._sketches[(method, column)].quantile(0.5) for column in self.numeric_columns] for method in n.index],
+            index=n.index,
+            columns=self.numeric_columns,
+        )
+        return [round(sums / n.where(n > 0), 4), round(medians, 4)]
+
+    def anova(self, metric):
+        """
+        Returns the one-way ANOVA of the metric between the methods, like ``statsmodels.stats.anova_lm`` of the model
+        "metric ~ C(method)". Rows with NaN values are not used.
+
+        Parameters
+        ----------
+        metric: str
+            The metric, e.g. "SI".
+
+        Returns
+        -------
+        Pandas.DataFrame
+            The ANOVA table with the rows "C(method)" and "Residual" and the columns "sum_sq", "df", "F" and "PR(>F)".
+        """
+
+        import scipy.stats as stats
+
+        n, sums, squares = (moment[metric] for moment in self._moments)
+        used = n > 0
+        n, sums, squares = n[used], sums[used], squares[used]
+        total = n.sum()
+        between = (n * (sums / n - sums.sum() / total) ** 2).sum()
+        within = squares.sum()
+        df_between = len(n) - 1
+        df_within = total - len(n)
+        f = (between / df_between) / (within / df_within)
+        return pd.DataFrame(
+            {
+                "sum_sq": [between, within],
+                "df": [float(df_between), float(df_within)],
+                "F": [f, np.nan],
+                "PR(>F)": [stats.f.sf(f, df_between, df_within), np.nan],
+            },
+            index=["C(method)", "Residual"],
+        )
+
+    def save(self, path):
+        """
+        Saves the statistics of the shard in JSON format, e.g. to merge them with the statistics of other shards.
+
+        Parameters
+        ----------
+        path: str
+            Path of the JSON file.
+
+        Returns
+        -------
+        None
+        """
+
+        with open(str(path), "w") as f:
+            json.dump(
+                {
+                    "accuracy": self.accuracy,
+                    "columns": self.columns,
+                    "numeric_columns": self.numeric_columns,
+                    "counts": self._counts.to_dict(orient="split"),
+                    "nans": self._nans.to_dict(orient="split"),
+                    "moments": [moment.to_dict(orient="split") for moment in self._moments],
+                    "sketches": [[method, column, sketch.state()] for (method, column), sketch in self._sketches.items()],
+                },
+                f,
+            )
+
+
+def load_result_statistics(path):
+    """
+    Loads the statistics of a shard saved with ``ResultStatistics.save``.
+
+    Parameters
+    ----------
+    path: str
+        Path of the JSON file.
+
+    Returns
+    -------
+    ResultStatistics
+        The statistics.
+    """
+
+    with open(str(path)) as f:
+        content = json.load(f)
+    statistics = ResultStatistics(content["accuracy"])
+    statistics.columns = content["columns"]
+    statistics.numeric_columns = content["numeric_columns"]
+    statistics._counts = pd.DataFrame(**content["counts"]).rename_axis("method")
+    statistics._nans = pd.DataFrame(**content["nans"]).rename_axis("method")
+    statistics._moments = tuple(pd.DataFrame(**moment).rename_axis("method") for moment in content["moments"])
+    statistics._sketches = {
+        (method, column): QuantileSketch.from_state(state) for method, column, state in content["sketches"]
+    }
+    return statistics
+
+
+def _file_statistics(args):
+    # the statistics of one result file, called in a worker process
+    path, chunk_size, accuracy = args
+    statistics = ResultStatistics(accuracy)
+    for chunk in read_results_chunks(path, chunk_size):
+        statistics.update(chunk)
+    return statistics
+
+
+def compute_result_statistics(paths, chunk_size=CHUNK_SIZE, workers=1, accuracy=SKETCH_ACCURACY):
+    """
+    Computes the statistics of result files, which are read in chunks, so they do not need to fit into the memory.
+
+    Parameters
+    ----------
+    paths: list
+        Paths of the result files in csv format.
+
+    chunk_size: int, Optional
+        Number of rows read at once. Default is ``CHUNK_SIZE``.
+
+    workers: int, Optional
+        Number of processes, the files are processed in parallel and their statistics are merged. Default is 1.
+
+    accuracy: float, Optional
+        Maximal relative error of the medians. Default is ``SKETCH_ACCURACY``.
+
+    Returns
+    -------
+    ResultStatistics
+        The merged statistics of all files.
+    """
+
+    tasks = [(path, chunk_size, accuracy) for path in paths]
+    if workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            shards = list(executor.map(_file_statistics, tasks))
+    else:
+        shards = [_file_statistics(task) for task in tasks]
+    statistics = ResultStatistics(accuracy)
+    for shard in shards:
+        statistics.merge(shard)
+    return statistics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Computes counts, means, medians and ANOVA tables in chunks.")
+    parser.add_argument("paths", nargs="+", help="result files in csv format or saved statistics of shards (.json)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", help="saves the merged statistics in JSON format")
+    args = parser.parse_args()
+    statistics = compute_result_statistics(
+        [path for path in args.paths if not path.endswith(".json")], args.chunk_size, args.workers
+    )
+    for path in args.paths:
+        if path.endswith(".json"):
+            statistics.merge(load_result_statistics(path))
+    counts, nans, times = statistics.general_checks()
+    means, medians = statistics.mean_median()
+    print(f"Counts:\n{counts}\n\nNaNs:\n{nans}\n\nTimes in minutes:\n{times}\n")
+    print(f"Means:\n{means}\n\nMedians (approximate):\n{medians}\n")
+    for metric in AGREEMENT_METRICS:
+        print(f"ANOVA results for {metric}:\n{statistics.anova(metric)}\n")
+    if args.output:
+        statistics.save(args.output)
@@ -0,0 +1,159 @@
+"""
+Provides the column definitions of the result files shared by all methods and a reader for these files.
+"""
+
+import numpy as np
+import pandas as pd
+
+# columns of the result files, see the README in the data folder
+COLUMNS = [
+    "reference_id",
+    "mobile_id",
+    "method",
+    "rmsd",
+    "coverage",
+    "reference_size",
+    "mobile_size",
+    "time",
+    "SI",
+    "MI",
+    "SAS",
+    "ref_name",
+    "ref_group",
+    "ref_species",
+    "ref_chain",
+    "mob_name",
+    "mob_group",
+    "mob_species",
+    "mob_chain",
+]
+
+# additional columns appended to the columns above by the current drivers
+EXTRA_COLUMNS = [
+    "time_median",
+    "time_spread",
+    "mode",
+    "warm_start",
+]
+
+# residues used in the alignments: the complete chain or only the KLIFS pocket
+MODES = ["chain", "pocket"]
+
+RESULT_COLUMNS = COLUMNS + EXTRA_COLUMNS
+
+
+def read_results(path):
+    """
+    Reads a result file without header.
+    The column names are assigned depending on the number of columns in the file,
+    so older files containing only a part of the columns can be read as well.
+    Files without the mode column contain alignments of the complete chains,
+    files without the warm_start column contain alignments started from the original coordinates.
+
+    Parameters
+    ----------
+    path: str
+        Path of the result file in csv format.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        The results with named columns.
+    """
+
+    return _name_columns(pd.read_csv(str(path), header=None))
+
+
+def read_results_chunks(path, chunk_size=10**6):
+    """
+    Reads a result file without header in chunks of rows, e.g. for result files larger than the memory.
+    The columns are named like in ``read_results``.
+
+    Parameters
+    ----------
+    path: str
+        Path of the result file in csv format.
+
+    chunk_size: int, Optional
+        Number of rows of every chunk. Default is 10⁶.
+
+    Returns
+    -------
+    iterator
+        The chunks of results (Pandas.DataFrame) with named columns.
+    """
+
+    with pd.read_csv(str(path), header=None, chunksize=chunk_size) as reader:
+        for chunk in reader:
+            yield _name_columns(chunk)
+
+
+def _name_columns(df):
+    df.columns = RESULT_COLUMNS[: len(df.columns)]
+    if "mode" not in df.columns:
+        df["mode"] = "chain"
+    if "warm_start" not in df.columns:
+        df["warm_start"] = False
+    return df
+
+
+def compute_quality_measures(rmsd, coverage, reference_size, mobile_size, w0=1.5):
+    """
+    Computes the quality measures SI, MI and SAS of an alignment.
+
+    Parameters
+    ----------
+    rmsd: float
+        The RMSD of the alignment.
+
+    coverage: int
+        The coverage of the alignment.
+
+    reference_size: int
+        Number of residues of the reference structure.
+
+    mobile_size: int
+        Number of residues of the mobile structure.
+
+    w0: float, Optional
+        The value for the normalization factor for MI. Default is set to 1.5.
+
+    Returns
+    -------
+    tuple
+        SI, MI and SAS. If the coverage is 0, all quality measures are NaN.
+    """
+
+    if coverage == 0:
+        return np.nan, np.nan, np.nan
+    si = (rmsd * min(reference_size, mobile_size)) / coverage
+    mi = 1 - ((1 + coverage) / ((1 + rmsd / w0) * (1 + min(reference_size, mobile_size))))
+    sas = (rmsd * 100) / coverage
+    return si, mi, sas
+
+
+def select_variant(all_methods_df, variant, label="pymol"):
+    """
+    Keeps only one variant of a method, e.g. the results of PyMol with or without refinement,
+    and renames it to the label of the method. The rows of the other methods are not changed.
+
+    Parameters
+    ----------
+    all_methods_df : Pandas.DataFrame
+
+    variant: str
+        The variant to keep, e.g. "pymol" or "pymol_refined".
+
+    label: str, Optional
+        The method label all variants start with and which is used for the kept variant. Default is "pymol".
+
+    Returns
+    -------
+    Pandas.DataFrame
+        The DataFrame with one variant of the method.
+    """
+
+    is_variant = all_methods_df["method"].str.startswith(label)
+    df = all_methods_df[~is_variant | (all_methods_df["method"] == variant)].copy()
+    df.loc[df["method"] == variant, "method"] = label
+    return df.reset_index(drop=True)
@@ -0,0 +1,384 @@
+"""
+Provides an independent verification of the RMSD values reported by the methods and tools.
+
+Every tool computes the RMSD over its own correspondence and its own atom selection (e.g. "not alt A" in PyMol,
+"@ca" in ChimeraX), so the values of different tools can not be checked against each other. Here the optimal RMSD
+(Kabsch superposition) of the CA atoms is recomputed from the cached PDB files for a given correspondence:
+the matched residues of the residue store (see ``residue_store.py``) or a shared correspondence of all methods
+by the sequences of the chains. The superpositions of all pairs are computed at once with batched covariance
+matrices and a batched SVD, and the rows whose reported RMSD deviates beyond a tolerance are flagged.
+"""
+
+import argparse
+import difflib
+
+import numpy as np
+
+from results_utils import read_results
+from structure_utils import THREE_TO_ONE, local_pdb_file, read_ca_atoms
+
+# maximal absolute difference between the reported and the recomputed RMSD in Angstrom
+TOLERANCE = 0.1
+
+# minimal number of matched atoms of a superposition
+MIN_LENGTH = 3
+
+
+def kabsch_rmsd(reference_coords, mobile_coords, lengths):
+    """
+    Computes the RMSD after the optimal superposition of many pairs of matched coordinates at once.
+
+    Parameters
+    ----------
+    reference_coords: numpy.ndarray
+        The matched coordinates of the reference structures of all pairs one after another, shape (N, 3).
+
+    mobile_coords: numpy.ndarray
+        The matched coordinates of the mobile structures in the same order, shape (N, 3).
+
+    lengths: numpy.ndarray
+        The number of matched atoms of every pair, the sum is N.
+
+    Returns
+    -------
+    numpy.ndarray
+        The RMSD of every pair, NaN for pairs with less than ``MIN_LENGTH`` matched atoms.
+
+    .. note::
+
+        The sums over the atoms of every pair are computed with ``np.add.reduceat`` for every coordinate column,
+        the 3x3 matrices of all pairs are decomposed in one call of ``np.linalg.svd``.
+    """
+
+    reference_coords = np.asarray(reference_coords, dtype=float).reshape(-1, 3)
+    mobile_coords = np.asarray(mobile_coords, dtype=float).reshape(-1, 3)
+    lengths = np.asarray(lengths, dtype=int)
+    rmsd = np.full(len(lengths), np.nan)
+    valid = lengths >= MIN_LENGTH
+    if not valid.any():
+        return rmsd
+    # pairs with too few atoms are removed, so every segment of reduceat is non-empty
+    if not valid.all():
+        keep = np.repeat(valid, lengths)
+        reference_coords = reference_coords[keep]
+        mobile_coords = mobile_coords[keep]
+        lengths = lengths[valid]
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    # the coordinates are reduced column by column, contiguous columns are summed faster than rows of 3 values,
+    # and the centered sums are computed from the uncentered sums, so the coordinates are not centered
+    reference_columns = np.ascontiguousarray(reference_coords.T)
+    mobile_columns = np.ascontiguousarray(mobile_coords.T)
+    reference_means = np.stack([np.add.reduceat(column, starts) for column in reference_columns], axis=1)
+    reference_means /= lengths[:, None]
+    mobile_means = np.stack([np.add.reduceat(column, starts) for column in mobile_columns], axis=1)
+    mobile_means /= lengths[:, None]
+    # covariance matrices of all pairs, shape (K, 3, 3)
+    covariance = np.stack(
+        [np.add.reduceat(mobile * reference, starts) for mobile in mobile_columns for reference in reference_columns],
+        axis=1,
+    ).reshape(-1, 3, 3) - lengths[:, None, None] * (mobile_means[:, :, None] * reference_means[:, None, :])
+    squares = np.add.reduceat((reference_columns**2).sum(axis=0) + (mobile_columns**2).sum(axis=0), starts)
+    squares -= lengths * ((reference_means**2).sum(axis=1) + (mobile_means**2).sum(axis=1))
+    u, s, vt = np.linalg.svd(covariance)
+    # correction of a reflection
+    s[:, 2] *= np.sign(np.linalg.det(u) * np.linalg.det(vt))
+    rmsd[valid] = np.sqrt(np.maximum(squares - 2 * s.sum(axis=1), 0) / lengths)
+    return rmsd
+
+
+def _sequence(atoms):
+    return "".join(THREE_TO_ONE.get(resname, "X") for resname in atoms["resnames"])
+
+
+def sequence_correspondence(reference_atoms, mobile_atoms):
+    """
+    Matches the residues of two chains by the alignment of their sequences, the same correspondence for all methods.
+
+    Parameters
+    ----------
+    reference_atoms: dict
+        The CA atoms of the reference chain returned by ``structure_utils.read_ca_atoms``.
+
+    mobile_atoms: dict
+        The CA atoms of the mobile chain.
+
+    Returns
+    -------
+    tuple
+        The positions of the matched atoms in the reference and in the mobile chain.
+    """
+
+    return _match_sequences(_sequence(reference_atoms), _sequence(mobile_atoms))
+
+
+def _match_sequences(sequence1, sequence2):
+    matcher = difflib.SequenceMatcher(None, sequence1, sequence2, autojunk=False)
+    blocks = [(start1, start2, size) for start1, start2, size in matcher.get_matching_blocks() if size]
+    if not blocks:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    return (
+        np.concatenate([np.arange(start1, start1 + size) for start1, _, size in blocks]),
+        np.concatenate([np.arange(start2, start2 + size) for _, start2, size in blocks]),
+    )
+
+
+def anchored_correspondence(reference_map, mobile_map):
+    """
+    Matches the residues of two chains, which are matched to the same residue of the anchor chain.
+
+    Parameters
+    ----------
+    reference_map: numpy.ndarray
+        The position in the anchor chain of every residue of the reference chain, -1 for unmatched residues,
+        e.g. from ``sequence_correspondence`` of the anchor chain and the reference chain.
+
+    mobile_map: numpy.ndarray
+        The position in the anchor chain of every residue of the mobile chain.
+
+    Returns
+    -------
+    tuple
+        The positions of the matched atoms in the reference and in the mobile chain.
+    """
+
+    inverse = np.full(max(reference_map.max(initial=-1), mobile_map.max(initial=-1)) + 1, -1)
+    mobile_positions = np.flatnonzero(mobile_map >= 0)
+    inverse[mobile_map[mobile_positions]] = mobile_positions
+    reference_positions = np.flatnonzero(reference_map >= 0)
+    matched = inverse[reference_map[reference_positions]]
+    return reference_positions[matched >= 0], matched[matched >= 0]
+
+
+def _anchor_maps(chains):
+    # the position in the anchor chain (the longest chain) of every residue of every chain, -1 for unmatched residues
+    loaded = {key: atoms for key, atoms in chains.items() if atoms is not None}
+    if not loaded:
+        return {}
+    anchor = _sequence(max(loaded.values(), key=lambda atoms: len(atoms["resnames"])))
+    maps = {}
+    for key, atoms in loaded.items():
+        anchor_positions, positions = _match_sequences(anchor, _sequence(atoms))
+        maps[key] = np.full(len(atoms["resnames"]), -1)
+        maps[key][positions] = anchor_positions
+    return maps
+
+
+def _residue_lookup(atoms):
+    # the sorted residue numbers and the position of their first residue, the store contains the numbers
+    # without insertion code
+    numbers = np.array([int(residue.rstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ")) for residue in atoms["residues"]], dtype=int)
+    unique, first = np.unique(numbers, return_index=True)
+    return unique, first
+
+
+def _lookup_positions(lookup, numbers):
+    # the positions of the residue numbers, -1 for numbers which are not in the chain
+    unique, first = lookup
+    numbers = np.asarray(numbers, dtype=int)
+    if not len(unique):
+        return np.full(len(numbers), -1)
+    index = np.minimum(np.searchsorted(unique, numbers), len(unique) - 1)
+    return np.where(unique[index] == numbers, first[index], -1)
+
+
+def store_correspondence(residue_store, reference_id, mobile_id, method, reference_atoms, mobile_atoms):
+    """
+    Returns the correspondence of an alignment captured in the residue store.
+
+    Parameters
+    ----------
+    residue_store: dict
+        The store returned by ``residue_store.load_residue_store``.
+
+    reference_id: str
+        PDB-ID of the reference structure.
+
+    mobile_id: str
+        PDB-ID of the mobile structure.
+
+    method: str
+        The method.
+
+    reference_atoms: dict
+        The CA atoms of the reference chain returned by ``structure_utils.read_ca_atoms``.
+
+    mobile_atoms: dict
+        The CA atoms of the mobile chain.
+
+    Returns
+    -------
+    tuple
+        The positions of the matched atoms in the reference and in the mobile chain,
+        empty if the alignment is not in the store.
+    """
+
+    offset, length = residue_store["positions"].get((reference_id, mobile_id, method), (0, 0))
+    reference_positions = _lookup_positions(
+        _residue_lookup(reference_atoms), residue_store["reference_residues"][offset : offset + length]
+    )
+    mobile_positions = _lookup_positions(
+        _residue_lookup(mobile_atoms), residue_store["mobile_residues"][offset : offset + length]
+    )
+    matched = (reference_positions >= 0) & (mobile_positions >= 0)
+    return reference_positions[matched], mobile_positions[matched]
+
+
+def _store_indices(residue_store, keys, chains, offsets):
+    # the indices in the array of all coordinates of the matched atoms of all alignments in the residue store,
+    # the residue numbers of all chains are encoded as chain * 65536 + number + 32768 and looked up at once
+    chain_numbers = {key: number for number, key in enumerate(offsets)}
+    codes, indices = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    for key, offset in offsets.items():
+        unique, first = _residue_lookup(chains[key])
+        codes.append(chain_numbers[key] * 65536 + unique + 32768)
+        indices.append(first + offset)
+    lookup = (np.concatenate(codes), np.concatenate(indices))
+    spans = np.array(
+        [
+            residue_store["positions"].get((reference_id, mobile_id, method), (0, 0))
+            if (reference_id, reference_chain) in offsets and (mobile_id, mobile_chain) in offsets
+            else (0, 0)
+            for reference_id, reference_chain, mobile_id, mobile_chain, method in keys
+        ],
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    starts, sizes = spans[:, 0], spans[:, 1]
+    # the positions of all stored residues of the alignments one after another
+    take = np.repeat(starts - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+    encoded = []
+    for side, (id_column, chain_column) in (("reference_residues", (0, 1)), ("mobile_residues", (2, 3))):
+        numbers = np.array([chain_numbers.get((key[id_column], key[chain_column]), 0) for key in keys], dtype=np.int64)
+        residues = np.asarray(residue_store[side][take], dtype=np.int64)
+        encoded.append(_lookup_positions(lookup, np.repeat(numbers, sizes) * 65536 + residues + 32768))
+    matched = (encoded[0] >= 0) & (encoded[1] >= 0)
+    lengths = np.bincount(np.repeat(np.arange(len(keys)), sizes)[matched], minlength=len(keys))
+    return encoded[0][matched], encoded[1][matched], lengths
+
+
+def verify_rmsd(all_methods_df, cache_dir, residue_store=None, tolerance=TOLERANCE, correspondence="anchored"):
+    """
+    Recomputes the RMSD of all alignments and flags the alignments, whose reported RMSD deviates beyond the tolerance.
+
+    Parameters
+    ----------
+    all_methods_df : Pandas.DataFrame
+        The results, e.g. returned by ``results_utils.read_results``.
+
+    cache_dir: str
+        Folder containing the cached PDB files.
+
+    residue_store: dict, Optional
+        The store returned by ``residue_store.load_residue_store``. If provided, the captured correspondence of every
+        alignment is used, otherwise a correspondence by the sequences of the chains is used for all methods.
+
+    tolerance: float, Optional
+        Maximal absolute difference between the reported and the recomputed RMSD in Angstrom. Default is ``TOLERANCE``.
+
+    correspondence: str, Optional
+        The correspondence by the sequences used without residue store. With "anchored", every chain is aligned once
+        with the longest chain (the anchor) and the residues matched to the same residue of the anchor are matched
+        (``anchored_correspondence``), with "pairwise" the sequences of every pair are aligned
+        (``sequence_correspondence``), which is more exact for residues missing in the anchor chain, but slower.
+        Default is "anchored".
+
+    Returns
+    -------
+    Pandas.DataFrame
+        The results with the recomputed RMSD ("verified_rmsd"), the number of matched atoms ("verified_length"),
+        the difference to the reported RMSD ("rmsd_deviation") and whether it exceeds the tolerance ("flagged").
+        Alignments without correspondence or without reported RMSD have NaN values and are not flagged.
+
+    .. note::
+
+        The correspondence and the RMSD are computed once for every pair (and method, with residue store),
+        the atoms of all pairs are gathered from one array of the coordinates of all chains.
+    """
+
+    # every chain is read once, the coordinates of all chains are stored in one array
+    chain_keys = dict.fromkeys(
+        list(zip(all_methods_df["reference_id"], all_methods_df["ref_chain"]))
+        + list(zip(all_methods_df["mobile_id"], all_methods_df["mob_chain"]))
+    )
+    chains = {}
+    for pdb_id, chain in chain_keys:
+        path = local_pdb_file(pdb_id, cache_dir)
+        chains[(pdb_id, chain)] = read_ca_atoms(path, chain) if path else None
+    offsets = {}
+    coordinates = [np.zeros((0, 3))]
+    size = 0
+    for key, atoms in chains.items():
+        if atoms is not None:
+            offsets[key] = size
+            coordinates.append(atoms["coordinates"])
+            size += len(atoms["coordinates"])
+    coordinates = np.concatenate(coordinates)
+
+    columns = ["reference_id", "ref_chain", "mobile_id", "mob_chain"]
+    if residue_store is not None:
+        columns.append("method")
+    elif correspondence == "anchored":
+        maps = _anchor_maps(chains)
+    elif correspondence != "pairwise":
+        raise ValueError(f"unknown correspondence {correspondence}, use 'anchored' or 'pairwise'")
+    # the rows with the same key have the same correspondence
+    codes = all_methods_df.groupby(columns, sort=False, dropna=False).ngroup().to_numpy()
+    keys = list(all_methods_df[columns].iloc[np.unique(codes, return_index=True)[1]].itertuples(index=False, name=None))
+
+    if residue_store is not None:
+        reference_indices, mobile_indices, lengths = _store_indices(residue_store, keys, chains, offsets)
+    else:
+        pairs = {}
+        reference_indices, mobile_indices, lengths = [np.zeros(0, dtype=int)], [np.zeros(0, dtype=int)], []
+        for reference_id, reference_chain, mobile_id, mobile_chain in keys:
+            reference_key, mobile_key = (reference_id, reference_chain), (mobile_id, mobile_chain)
+            if reference_key not in offsets or mobile_key not in offsets:
+                lengths.append(0)
+                continue
+            if correspondence == "anchored":
+                reference_positions, mobile_positions = anchored_correspondence(maps[reference_key], maps[mobile_key])
+            else:
+                # the alignment of the same sequences is computed once
+                sequences = (_sequence(chains[reference_key]), _sequence(chains[mobile_key]))
+                if sequences not in pairs:
+                    pairs[sequences] = _match_sequences(*sequences)
+                reference_positions, mobile_positions = pairs[sequences]
+            reference_indices.append(reference_positions + offsets[reference_key])
+            mobile_indices.append(mobile_positions + offsets[mobile_key])
+            lengths.append(len(reference_positions))
+        reference_indices = np.concatenate(reference_indices)
+        mobile_indices = np.concatenate(mobile_indices)
+
+    verified = all_methods_df.copy()
+    lengths = np.array(lengths, dtype=int)
+    rmsd = kabsch_rmsd(coordinates[reference_indices], coordinates[mobile_indices], lengths)
+    verified["verified_rmsd"] = rmsd[codes]
+    verified["verified_length"] = lengths[codes]
+    verified["rmsd_deviation"] = verified["rmsd"] - verified["verified_rmsd"]
+    verified["flagged"] = verified["rmsd_deviation"].abs() > tolerance
+    return verified
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recomputes the RMSD of the alignments and flags the deviating rows.")
+    parser.add_argument("results", help="result file in csv format")
+    parser.add_argument("cache_dir", help="folder containing the cached PDB files")
+    parser.add_argument("output", help="result file with the verification columns")
+    parser.add_argument("--residue-store", help="folder of the residue store, default is the sequence alignment")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--correspondence", choices=["anchored", "pairwise"], default="anchored")
+    args = parser.parse_args()
+    store = None
+    if args.residue_store:
+        from residue_store import load_residue_store
+
+        store = load_residue_store(args.residue_store)
+    verified = verify_rmsd(
+        read_results(args.results),
+        args.cache_dir,
+        residue_store=store,
+        tolerance=args.tolerance,
+        correspondence=args.correspondence,
+    )
+    verified.to_csv(args.output, index=False)
+    print(f"{int(verified['flagged'].sum())} of {len(verified)} alignments flagged")
+    print(verified[verified["flagged"]].groupby("method").size().to_string())
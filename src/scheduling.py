@@ -0,0 +1,235 @@
+"""
+Provides a cost-aware scheduler for the alignment jobs of a benchmark.
+
+Every job is one (pair, method) alignment. Its cost is estimated from the sizes of the structures in the chain index,
+either with the runtime models fitted on previous results (``cost_model.fit_cost_models``) in seconds or,
+without models, by the product of the sizes weighted by the relative cost of the method (``METHOD_WEIGHTS``)
+in relative units.
+The jobs are dispatched longest-first to the workers, so a few large pairs or slow methods (e.g. MMLigner)
+do not end up as a long tail at the end of the run.
+"""
+
+import concurrent.futures
+import heapq
+import time
+import warnings
+
+import numpy as np
+
+from cost_model import MODEL_COLUMNS, predict_cost
+
+# relative cost of the methods per product of the sizes without runtime models, the ratios of the median times
+# per product of the sizes in the OpenCADD results of the kinase groups (data/OpenCADD_results),
+# other methods have the weight 1
+METHOD_WEIGHTS = {"theseus": 1.0, "mda": 1.5, "mmligner": 50.0}
+
+
+def create_jobs(methods, sample_strucs1, sample_strucs2=None):
+    """
+    Creates the alignment jobs in the order of the sequential benchmark.
+
+    Parameters
+    ----------
+    methods: list
+        The methods.
+
+    sample_strucs1: list
+        The structures of the first sample set returned by ``structure_utils.read_samples``.
+
+    sample_strucs2: list, Optional
+        The structures of the second sample set. If not provided, the jobs are the alignments
+        between the structures of the first sample set.
+
+    Returns
+    -------
+    list
+        Contains a tuple (method, structure, mobile) for every job.
+    """
+
+    jobs = []
+    for method in methods:
+        for i, structure in enumerate(sample_strucs1):
+            mobiles = sample_strucs2 if sample_strucs2 is not None else sample_strucs1[i + 1 :]
+            jobs += [(method, structure, mobile) for mobile in mobiles]
+    return jobs
+
+
+def estimate_job_costs(jobs, chain_index=None, models=None):
+    """
+    Estimates the cost of every job.
+
+    Parameters
+    ----------
+    jobs: list
+        The jobs returned by ``create_jobs``.
+
+    chain_index: dict, Optional
+        The chain index returned by ``structure_utils.read_chain_index``. Without chain index, the sizes are unknown
+        and the cost of a job is the weight of its method in ``METHOD_WEIGHTS`` (with a warning).
+
+    models: Pandas.DataFrame, Optional
+        The runtime models returned by ``cost_model.fit_cost_models``.
+        Methods without a model use the mean coefficients of all models. Requires the chain index.
+
+    Returns
+    -------
+    numpy.ndarray
+        The cost of every job, in seconds if models are provided, otherwise in relative units.
+    """
+
+    weights = np.array([METHOD_WEIGHTS.get(job[0], 1.0) for job in jobs])
+    if chain_index is None:
+        warnings.warn(
+            "Without chain index, the jobs are only ordered by the weights of their methods, "
+            "the jobs of a method run in the order of the samples."
+        )
+        return weights
+    reference_sizes = np.array([chain_index[(job[1][0], job[1][4])]["ca_count"] for job in jobs], dtype=float)
+    mobile_sizes = np.array([chain_index[(job[2][0], job[2][4])]["ca_count"] for job in jobs], dtype=float)
+    if models is None or models.empty:
+        return weights * reference_sizes * mobile_sizes
+
+    models = models.copy()
+    methods = np.array([job[0] for job in jobs])
+    costs = np.zeros(len(jobs))
+    for method in np.unique(methods):
+        if method not in models.index:
+            models.loc[method] = models[MODEL_COLUMNS].mean()
+        selected = methods == method
+        costs[selected] = predict_cost(models, method, reference_sizes[selected], mobile_sizes[selected], mean=True)
+    return costs
+
+
+def predict_makespan(costs, workers, order=None):
+    """
+    Predicts the makespan of the jobs, when every job is dispatched to the next idle worker in the given order.
+
+    Parameters
+    ----------
+    costs: numpy.ndarray
+        The costs returned by ``estimate_job_costs``.
+
+    workers: int
+        Number of workers.
+
+    order: list, Optional
+        The order in which the jobs are dispatched. Default is the order of the jobs.
+
+    Returns
+    -------
+    float
+        The predicted makespan.
+    """
+
+    order = range(len(costs)) if order is None else order
+    loads = [0.0] * workers
+    for job in order:
+        heapq.heappush(loads, heapq.heappop(loads) + costs[job])
+    return max(loads)
+
+
+def longest_first(costs):
+    """
+    Returns the order of the jobs for the longest-first dispatch.
+
+    Parameters
+    ----------
+    costs: numpy.ndarray
+        The costs returned by ``estimate_job_costs``.
+
+    Returns
+    -------
+    list
+        The indices of the jobs sorted by decreasing cost, jobs with the same cost keep their order.
+    """
+
+    return list(np.argsort(-np.asarray(costs), kind="stable"))
+
+
+def run_jobs(
+    func, jobs, costs, workers, executor="process", callback=None, initializer=None, initargs=(), costs_in_seconds=False
+):
+    """
+    Runs the jobs longest-first on the workers.
+
+    Parameters
+    ----------
+    func: function
+        Called with the job as argument. For the process executor, the function and the jobs need to be picklable.
+
+    jobs: list
+        The jobs.
+
+    costs: numpy.ndarray
+        The costs returned by ``estimate_job_costs``.
+
+    workers: int
+        Number of workers.
+
+    executor: str, Optional
+        "process" or "thread". Default is "process".
+
+    callback: function, Optional
+        Called with the job and its return value, when a job is finished, e.g. to record the telemetry.
+
+    initializer: function, Optional
+        Called with ``initargs`` in every worker, when it is started, e.g. ``resource_governor.activate``.
+
+    initargs: tuple, Optional
+        The arguments of the initializer.
+
+    costs_in_seconds: bool, Optional
+        True, if the costs are in seconds, i.e. estimated with runtime models. Default is False.
+
+    Returns
+    -------
+    tuple
+        - results: list of the return values of func in the order of the jobs.
+        - report: dict with the predicted makespan for the longest-first and the sequential order,
+          the actual makespan (wall time in seconds) and the sum of the costs. The predictions are only
+          compared with the actual makespan in seconds ("predicted_makespan", "predicted_makespan_in_order",
+          "total_cost"), if the costs are in seconds, otherwise they are in the relative units of the costs
+          ("predicted_cost_units", "predicted_cost_units_in_order", "total_cost_units").
+    """
+
+    order = longest_first(costs)
+    pool = (
+        concurrent.futures.ProcessPoolExecutor
+        if executor == "process"
+        else concurrent.futures.ThreadPoolExecutor
+    )
+    results = [None] * len(jobs)
+    start = time.perf_counter()
+    with pool(max_workers=workers, initializer=initializer, initargs=initargs) as ex:
+        # the jobs are submitted longest-first, the pool starts them in this order
+        futures = {ex.submit(func, jobs[index]): index for index in order}
+        for future in concurrent.futures.as_completed(futures):
+            results[futures[future]] = future.result()
+            if callback:
+                callback(jobs[futures[future]], results[futures[future]])
+    name = "predicted_makespan" if costs_in_seconds else "predicted_cost_units"
+    report = {
+        name: predict_makespan(costs, workers, order),
+        f"{name}_in_order": predict_makespan(costs, workers),
+        "actual_makespan": time.perf_counter() - start,
+        "total_cost" if costs_in_seconds else "total_cost_units": float(np.sum(costs)),
+    }
+    return results, report
+
+
+def format_report(report):
+    """
+    Formats the report returned by ``run_jobs`` as one line.
+
+    Parameters
+    ----------
+    report: dict
+        The report returned by ``run_jobs``.
+
+    Returns
+    -------
+    str
+        The formatted report.
+    """
+
+    return " ".join(f"{key}={value:.4f}" for key, value in report.items())
@@ -0,0 +1,158 @@
+"""
+Provides the statistics of the adaptive benchmark, which stops once the ranking of the methods is settled.
+
+The pairs are processed in a random but reproducible order. After every batch of pairs (a look),
+the mean of the metric and the win rate (fraction of pairs with the best value) of every method are computed
+with confidence bounds. The error probability is split over the looks (alpha / (k * (k + 1)) at look k),
+so the bounds hold for all looks together and the run can stop at any look.
+"""
+
+import csv
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+SAMPLED_PAIRS_COLUMNS = ["position", "reference_id", "mobile_id", "seed"]
+
+
+def pair_order(sample_strucs1, sample_strucs2=None, seed=2021):
+    """
+    Returns all pairs of structures in a random but reproducible order.
+
+    Parameters
+    ----------
+    sample_strucs1: list
+        The structures of the first sample set returned by ``structure_utils.read_samples``.
+
+    sample_strucs2: list, Optional
+        The structures of the second sample set. If not provided, the pairs of the first sample set are used.
+
+    seed: int, Optional
+        Seed of the random order. Default is 2021.
+
+    Returns
+    -------
+    list
+        Contains a tuple (structure, mobile) for every pair.
+    """
+
+    if sample_strucs2 is None:
+        pairs = [
+            (structure, mobile)
+            for i, structure in enumerate(sample_strucs1)
+            for mobile in sample_strucs1[i + 1 :]
+        ]
+    else:
+        pairs = [(structure, mobile) for structure in sample_strucs1 for mobile in sample_strucs2]
+    order = np.random.default_rng(seed).permutation(len(pairs))
+    return [pairs[i] for i in order]
+
+
+def sequential_bounds(all_methods_df, metric="SI", look=1, alpha=0.05):
+    """
+    Computes the mean of the metric and the win rate of every method with confidence bounds.
+
+    Parameters
+    ----------
+    all_methods_df : Pandas.DataFrame
+        The results of the pairs processed so far.
+
+    metric: str, Optional
+        The metric, lower values are better like in ``count_best_results``. Default is "SI".
+
+    look: int, Optional
+        Number of the look, starting with 1. Default is 1.
+
+    alpha: float, Optional
+        Error probability of all looks together. Default is 0.05.
+
+    Returns
+    -------
+    Pandas.DataFrame
+        Contains for every method the number of alignments with a value ("n"), the mean with its bounds
+        ("mean", "mean_lower", "mean_upper") and the win rate with its bounds ("win_rate", "win_lower", "win_upper").
+    """
+
+    z = NormalDist().inv_cdf(1 - alpha / (look * (look + 1)) / 2)
+    values = all_methods_df.pivot_table(index=["reference_id", "mobile_id"], columns="method", values=metric)
+    values = values.reindex(columns=sorted(all_methods_df["method"].unique()))
+    n = values.count()
+    mean = values.mean()
+    half = z * values.std().fillna(np.inf) / np.sqrt(n.clip(lower=1))
+
+    # pairs without any value have no winner, ties are counted for the first method
+    compared = values.dropna(how="all")
+    wins = compared.idxmin(axis=1).value_counts().reindex(values.columns, fill_value=0)
+    pairs = len(compared)
+    win_rate = wins / pairs if pairs else wins * np.nan
+    # Wilson score interval, which is also valid for win rates close to 0 or 1
+    center = (win_rate + z ** 2 / (2 * pairs)) / (1 + z ** 2 / pairs) if pairs else win_rate
+    spread = (
+        z / (1 + z ** 2 / pairs) * np.sqrt(win_rate * (1 - win_rate) / pairs + z ** 2 / (4 * pairs ** 2))
+        if pairs
+        else win_rate
+    )
+    return pd.DataFrame(
+        {
+            "n": n,
+            "mean": mean,
+            "mean_lower": mean - half,
+            "mean_upper": mean + half,
+            "win_rate": win_rate,
+            "win_lower": center - spread,
+            "win_upper": center + spread,
+        }
+    )
+
+
+def is_settled(bounds, precision=0.05):
+    """
+    Checks whether the statistics reached the requested precision.
+
+    Parameters
+    ----------
+    bounds: Pandas.DataFrame
+        The bounds returned by ``sequential_bounds``.
+
+    precision: float, Optional
+        Maximal half-width of the bounds of the win rates and maximal half-width of the bounds of the means
+        relative to the means. Default is 0.05.
+
+    Returns
+    -------
+    bool
+        True, if all bounds are narrow enough.
+    """
+
+    win_half = (bounds["win_upper"] - bounds["win_lower"]) / 2
+    mean_half = (bounds["mean_upper"] - bounds["mean_lower"]) / 2
+    return bool((win_half <= precision).all() and (mean_half <= precision * bounds["mean"].abs()).all())
+
+
+def write_sampled_pairs(pairs, pairs_path, seed):
+    """
+    Writes the processed pairs in the order of the adaptive run, so the run can be reproduced.
+
+    Parameters
+    ----------
+    pairs: list
+        The processed pairs returned by ``pair_order``.
+
+    pairs_path: str
+        Path of the csv file.
+
+    seed: int
+        Seed of the order.
+
+    Returns
+    -------
+    None
+    """
+
+    with open(str(pairs_path), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(SAMPLED_PAIRS_COLUMNS)
+        writer.writerows(
+            [position, structure[0], mobile[0], seed] for position, (structure, mobile) in enumerate(pairs)
+        )
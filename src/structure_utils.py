@@ -0,0 +1,387 @@
+"""
+Provides functions to download and cache the PDB files of the sample structures and to read their CA atoms.
+The chain index created here is the shared definition of the size of a chain for all methods,
+the pocket index the shared definition of the KLIFS pocket residues for the pocket mode.
+Only the standard library and NumPy are used, so the functions can also be imported in PyMol and ChimeraX.
+"""
+
+import csv
+import difflib
+import os
+import urllib.request
+
+import numpy as np
+
+PDB_DOWNLOAD_URL = "https://files.rcsb.org/download/{}.pdb"
+
+CHAIN_INDEX_COLUMNS = ["pdb_id", "chain", "ca_count", "altloc_count", "sequence"]
+
+POCKET_INDEX_COLUMNS = ["pdb_id", "chain", "pocket_size", "residues"]
+
+# number of residues of the KLIFS pocket
+POCKET_LENGTH = 85
+
+# one letter codes of the standard amino acids and common modified residues
+THREE_TO_ONE = {
+    "ALA": "A",
+    "ARG": "R",
+    "ASN": "N",
+    "ASP": "D",
+    "CYS": "C",
+    "GLN": "Q",
+    "GLU": "E",
+    "GLY": "G",
+    "HIS": "H",
+    "ILE": "I",
+    "LEU": "L",
+    "LYS": "K",
+    "MET": "M",
+    "PHE": "F",
+    "PRO": "P",
+    "SER": "S",
+    "THR": "T",
+    "TRP": "W",
+    "TYR": "Y",
+    "VAL": "V",
+    "MSE": "M",
+    "SEP": "S",
+    "TPO": "T",
+    "PTR": "Y",
+    "CSO": "C",
+    "CME": "C",
+    "KCX": "K",
+}
+
+
+def read_samples(sample_path):
+    """
+    Reads a sample file.
+
+    Parameters
+    ----------
+    sample_path: str
+        Path of the sample file, every line contains the PDB-ID, the kinase name, the group, the species and the chain.
+
+    Returns
+    -------
+    list
+        Contains a list with the five entries for every structure.
+    """
+
+    with open(str(sample_path)) as f:
+        # split line, so no newline characters are left
+        # then split lines into lists to get the same structure as in the benchmark for OpenCADD
+        return [line.split(",") for line in f.read().splitlines() if line]
+
+
+def fetch_pdb_file(pdb_id, cache_dir):
+    """
+    Returns the path of the PDB file of a structure and downloads the file, if it is not cached yet.
+
+    Parameters
+    ----------
+    pdb_id: str
+        PDB-ID of the structure.
+
+    cache_dir: str
+        Folder containing the cached PDB files named "<pdb_id>.pdb".
+
+    Returns
+    -------
+    str
+        Path of the cached PDB file.
+    """
+
+    path = os.path.join(str(cache_dir), f"{pdb_id.lower()}.pdb")
+    if not os.path.isfile(path):
+        os.makedirs(str(cache_dir), exist_ok=True)
+        # download to a temporary file first, so an interrupted download does not leave a broken file
+        urllib.request.urlretrieve(PDB_DOWNLOAD_URL.format(pdb_id.upper()), f"{path}.part")
+        os.replace(f"{path}.part", path)
+    return path
+
+
+def local_pdb_file(pdb_id, cache_dir):
+    """
+    Returns the path of the cached PDB file of a structure without downloading it.
+
+    Parameters
+    ----------
+    pdb_id: str
+        PDB-ID of the structure.
+
+    cache_dir: str
+        Folder containing the cached PDB files named "<pdb_id>.pdb".
+
+    Returns
+    -------
+    str or None
+        Path of the cached PDB file or None, if the structure is not cached.
+    """
+
+    path = os.path.join(str(cache_dir), f"{pdb_id.lower()}.pdb")
+    return path if os.path.isfile(path) else None
+
+
+def read_ca_atoms(pdb_path, chain):
+    """
+    Reads the CA atoms of one chain from the first model of a PDB file.
+
+    Only residues containing a backbone N atom and a carbon CA atom are used, so calcium ions named "CA" are ignored.
+    If the chain contains no N atoms at all (CA-only models), all carbon CA atoms are used.
+    Every residue is used once. If a residue has alternate locations, the first location in the file is used.
+
+    Parameters
+    ----------
+    pdb_path: str
+        Path of the PDB file.
+
+    chain: str
+        Chain identifier.
+
+    Returns
+    -------
+    dict
+        - residues: list of the residue identifiers (residue number and insertion code) as str.
+        - resnames: list of the residue names.
+        - coordinates: numpy.ndarray of shape (n_residues, 3) containing the CA coordinates.
+        - altloc_count: number of residues with alternate locations of the CA atom.
+    """
+
+    ca_atoms = {}
+    has_n = set()
+    altloc_residues = set()
+    order = []
+    with open(str(pdb_path)) as f:
+        for line in f:
+            if line.startswith("ENDMDL"):
+                break
+            if not line.startswith(("ATOM", "HETATM")) or line[21] != chain:
+                continue
+            name = line[12:16].strip()
+            residue = line[22:27].strip()
+            if name == "N":
+                has_n.add(residue)
+            elif name == "CA" and line[76:78].strip() in ("C", ""):
+                if line[16] != " ":
+                    altloc_residues.add(residue)
+                if residue not in ca_atoms:
+                    order.append(residue)
+                    ca_atoms[residue] = (
+                        line[17:20].strip(),
+                        (float(line[30:38]), float(line[38:46]), float(line[46:54])),
+                    )
+    # models containing only CA atoms, e.g. synthetic chains, have no N atoms
+    residues = [residue for residue in order if residue in has_n or not has_n]
+    return {
+        "residues": residues,
+        "resnames": [ca_atoms[residue][0] for residue in residues],
+        "coordinates": np.array([ca_atoms[residue][1] for residue in residues], dtype=float).reshape(-1, 3),
+        "altloc_count": len(altloc_residues.intersection(residues)),
+    }
+
+
+def build_chain_index(sample_paths, output_path, cache_dir):
+    """
+    Creates the chain index containing the CA count, the number of residues with alternate locations and
+    the sequence for every structure and chain in the sample files.
+    This is done once before the alignments, all methods use the index for the sizes of the structures.
+
+    Parameters
+    ----------
+    sample_paths: list
+        Paths of the sample files.
+
+    output_path: str
+        Path of the chain index in csv format.
+
+    cache_dir: str
+        Folder containing the cached PDB files. Missing files are downloaded.
+
+    Returns
+    -------
+    None
+    """
+
+    entries = {}
+    for sample_path in sample_paths:
+        for structure in read_samples(sample_path):
+            key = (structure[0], structure[4])
+            if key in entries:
+                continue
+            ca_atoms = read_ca_atoms(fetch_pdb_file(structure[0], cache_dir), structure[4])
+            entries[key] = [
+                structure[0],
+                structure[4],
+                len(ca_atoms["residues"]),
+                ca_atoms["altloc_count"],
+                "".join(THREE_TO_ONE.get(resname, "X") for resname in ca_atoms["resnames"]),
+            ]
+
+    with open(str(output_path), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CHAIN_INDEX_COLUMNS)
+        writer.writerows(entries.values())
+
+
+def read_chain_index(index_path):
+    """
+    Reads the chain index created by ``build_chain_index``.
+
+    Parameters
+    ----------
+    index_path: str
+        Path of the chain index in csv format.
+
+    Returns
+    -------
+    dict
+        Maps (pdb_id, chain) to a dict with the keys "ca_count", "altloc_count" and "sequence".
+    """
+
+    with open(str(index_path), newline="") as f:
+        return {
+            (row["pdb_id"], row["chain"]): {
+                "ca_count": int(row["ca_count"]),
+                "altloc_count": int(row["altloc_count"]),
+                "sequence": row["sequence"],
+            }
+            for row in csv.DictReader(f)
+        }
+
+
+def map_pocket(pocket, residues, sequence):
+    """
+    Maps the KLIFS pocket of a structure onto the residues of a chain.
+
+    The pocket residues are matched to the chain sequence in order of the sequence,
+    residues missing in the pocket ("_") or not found in the chain are not mapped.
+
+    Parameters
+    ----------
+    pocket: str
+        The 85 residues of the pocket as in the column "structure.pocket" of the KLIFS dataset, "_" marks a missing residue.
+
+    residues: list
+        The residue identifiers of the chain returned by ``read_ca_atoms``.
+
+    sequence: str
+        The sequence of the chain, one letter for every residue.
+
+    Returns
+    -------
+    list
+        Contains the residue identifier or None for every pocket position.
+    """
+
+    pocket_positions = [position for position, letter in enumerate(pocket) if letter != "_"]
+    pocket_sequence = pocket.replace("_", "")
+    matcher = difflib.SequenceMatcher(None, pocket_sequence, sequence, autojunk=False)
+    mapping = [None] * len(pocket)
+    for pocket_start, chain_start, size in matcher.get_matching_blocks():
+        for offset in range(size):
+            mapping[pocket_positions[pocket_start + offset]] = residues[chain_start + offset]
+    return mapping
+
+
+def read_klifs_pockets(klifs_path):
+    """
+    Reads the pockets of all structures from the KLIFS dataset export.
+
+    Parameters
+    ----------
+    klifs_path: str
+        Path of the KLIFS dataset export in csv format (data/samples/20211102_klifs_dataset.csv).
+
+    Returns
+    -------
+    dict
+        Maps the PDB-IDs to a list of the pockets of all chains and alternate models of the structure in KLIFS.
+    """
+
+    pockets = {}
+    with open(str(klifs_path), newline="") as f:
+        for row in csv.DictReader(f):
+            pockets.setdefault(row["structure.pdb_id"], []).append(row["structure.pocket"])
+    return pockets
+
+
+def build_pocket_index(sample_paths, klifs_path, output_path, cache_dir):
+    """
+    Creates the pocket index containing the residues of the KLIFS pocket for every structure and chain in the sample files.
+    This is done once before the alignments, so all methods align the same residues in the pocket mode.
+
+    Parameters
+    ----------
+    sample_paths: list
+        Paths of the sample files.
+
+    klifs_path: str
+        Path of the KLIFS dataset export in csv format.
+
+    output_path: str
+        Path of the pocket index in csv format.
+
+    cache_dir: str
+        Folder containing the cached PDB files. Missing files are downloaded.
+
+    Returns
+    -------
+    None
+
+    .. note::
+
+        KLIFS contains one pocket for every chain of a structure, but the export does not contain the chain.
+        The pocket matching the most residues of the selected chain is used.
+    """
+
+    klifs_pockets = read_klifs_pockets(klifs_path)
+    entries = {}
+    for sample_path in sample_paths:
+        for structure in read_samples(sample_path):
+            key = (structure[0], structure[4])
+            if key in entries:
+                continue
+            ca_atoms = read_ca_atoms(fetch_pdb_file(structure[0], cache_dir), structure[4])
+            sequence = "".join(THREE_TO_ONE.get(resname, "X") for resname in ca_atoms["resnames"])
+            mappings = [
+                map_pocket(pocket, ca_atoms["residues"], sequence) for pocket in klifs_pockets.get(structure[0], [])
+            ]
+            mapping = max(mappings, key=lambda m: sum(r is not None for r in m), default=[None] * POCKET_LENGTH)
+            entries[key] = [
+                structure[0],
+                structure[4],
+                sum(residue is not None for residue in mapping),
+                " ".join(residue or "_" for residue in mapping),
+            ]
+
+    with open(str(output_path), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(POCKET_INDEX_COLUMNS)
+        writer.writerows(entries.values())
+
+
+def read_pocket_index(index_path):
+    """
+    Reads the pocket index created by ``build_pocket_index``.
+
+    Parameters
+    ----------
+    index_path: str
+        Path of the pocket index in csv format.
+
+    Returns
+    -------
+    dict
+        Maps (pdb_id, chain) to a dict with the keys "pocket_size" and "residues"
+        (list of the residue identifiers of the mapped pocket positions in the order of the pocket).
+    """
+
+    with open(str(index_path), newline="") as f:
+        return {
+            (row["pdb_id"], row["chain"]): {
+                "pocket_size": int(row["pocket_size"]),
+                "residues": [residue for residue in row["residues"].split() if residue != "_"],
+            }
+            for row in csv.DictReader(f)
+        }
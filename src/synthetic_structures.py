@@ -0,0 +1,423 @@
+"""
+Provides a generator for synthetic protein chains, so the scaling of the methods can be measured without network access.
+
+The chains are built from alternating helix, strand and loop segments of a CA trace with a backbone (N, CA, C, O) around it.
+Variants of a chain are created by controlled perturbations: coordinate noise, point mutations, insertions, deletions,
+a hinge motion of the C-terminal part and a rigid transformation.
+The PDB files are written to the cache folder of the PDB files, the sample files have the same format as the KLIFS samples.
+
+The generator is called in the terminal by:
+    python3 synthetic_structures.py <PDB_CACHE> <SAMPLE_FOLDER> [--lengths 50 100 200 400 800] [--variants 5]
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+from structure_utils import THREE_TO_ONE
+
+# the 20 standard amino acids, the modified residues in THREE_TO_ONE are not used
+AMINO_ACIDS = list(THREE_TO_ONE)[:20]
+
+BACKBONE_ATOMS = ["N", "CA", "C", "O"]
+
+# distance of consecutive CA atoms
+CA_DISTANCE = 3.8
+
+# minimal distance of non-consecutive CA atoms in the generated chains
+MIN_CA_DISTANCE = 4.0
+
+# virtual bond angle and torsion of the CA trace in degrees for the secondary structure elements
+SEGMENT_GEOMETRY = {
+    "helix": (91.0, 50.0),
+    "strand": (120.0, -170.0),
+}
+
+# group and species written to the sample files
+SYNTHETIC_GROUP = "SYN"
+SYNTHETIC_SPECIES = "Synthetic"
+
+
+def _place_atom(a, b, c, distance, angle, torsion):
+    # places an atom at the given distance to c, with the angle b-c-atom and the torsion a-b-c-atom
+    bc = (c - b) / np.linalg.norm(c - b)
+    normal = np.cross(b - a, bc)
+    normal /= np.linalg.norm(normal)
+    frame = np.array([bc, np.cross(normal, bc), normal]).T
+    angle, torsion = np.radians(angle), np.radians(torsion)
+    offset = distance * np.array(
+        [-np.cos(angle), np.sin(angle) * np.cos(torsion), np.sin(angle) * np.sin(torsion)]
+    )
+    return c + frame @ offset
+
+
+def _ca_trace(length, rng):
+    # secondary structure elements of 4-12 residues with loops of 2-6 residues in between
+    geometry = []
+    while len(geometry) < length:
+        element = "helix" if rng.random() < 0.5 else "strand"
+        geometry += [SEGMENT_GEOMETRY[element]] * int(rng.integers(4, 13))
+        geometry += [(rng.uniform(85, 130), rng.uniform(-180, 180)) for _ in range(int(rng.integers(2, 7)))]
+
+    trace = np.zeros((max(length, 3), 3))
+    trace[1] = [CA_DISTANCE, 0, 0]
+    angle = np.radians(geometry[1][0])
+    trace[2] = trace[1] + CA_DISTANCE * np.array([-np.cos(angle), np.sin(angle), 0])
+    for i in range(3, length):
+        angle, torsion = geometry[i]
+        trace[i] = _place_atom(trace[i - 3], trace[i - 2], trace[i - 1], CA_DISTANCE, angle, torsion)
+        # residues clashing with the chain are placed again with a random loop geometry
+        for _ in range(20):
+            if np.min(np.linalg.norm(trace[: i - 1] - trace[i], axis=1)) >= MIN_CA_DISTANCE:
+                break
+            angle, torsion = rng.uniform(85, 150), rng.uniform(-180, 180)
+            trace[i] = _place_atom(trace[i - 3], trace[i - 2], trace[i - 1], CA_DISTANCE, angle, torsion)
+    return trace[:length]
+
+
+def _backbone(trace):
+    # the C atom of a residue and the N atom of the next residue are placed in the plane of the peptide bond
+    # between both CA atoms, so the bond lengths are close to real peptides
+    n_residues = len(trace)
+    directions = np.diff(trace, axis=0)
+    directions /= np.linalg.norm(directions, axis=1)[:, None]
+    # perpendicular direction of the peptide plane, taken from the direction of the next peptide bond
+    following = np.vstack([directions[1:], directions[-1:]])
+    sides = following - np.sum(following * directions, axis=1)[:, None] * directions
+    # use an arbitrary perpendicular direction for straight segments
+    fallback = np.cross(directions, [0.0, 0.0, 1.0])
+    fallback[np.linalg.norm(fallback, axis=1) < 1e-6] = [1.0, 0.0, 0.0]
+    sides = np.where(np.linalg.norm(sides, axis=1)[:, None] < 1e-6, fallback, sides)
+    sides /= np.linalg.norm(sides, axis=1)[:, None]
+    # the terminal N and C atoms continue the first and the last peptide bond
+    directions = np.vstack([directions[:1], directions, directions[-1:]])
+    sides = np.vstack([sides[:1], sides, sides[-1:]])
+
+    coordinates = np.zeros((n_residues, len(BACKBONE_ATOMS), 3))
+    coordinates[:, 0] = trace - 1.25 * directions[:-1] + 0.75 * sides[:-1]
+    coordinates[:, 1] = trace
+    coordinates[:, 2] = trace + 1.2 * directions[1:] + 0.9 * sides[1:]
+    coordinates[:, 3] = coordinates[:, 2] + 1.23 * sides[1:]
+    return coordinates
+
+
+def generate_structure(length, rng):
+    """
+    Generates a synthetic chain.
+
+    Parameters
+    ----------
+    length: int
+        Number of residues of the chain.
+
+    rng: numpy.random.Generator
+        The random number generator.
+
+    Returns
+    -------
+    dict
+        - resnames: list of the residue names.
+        - residues: list of the residue numbers.
+        - coordinates: numpy.ndarray of shape (length, 4, 3) containing the coordinates of the N, CA, C and O atoms.
+    """
+
+    return {
+        "resnames": list(rng.choice(AMINO_ACIDS, length)),
+        "residues": list(range(1, length + 1)),
+        "coordinates": _backbone(_ca_trace(length, rng)),
+    }
+
+
+def _rotation(rng, angle=None):
+    # random rotation matrix, or a rotation by the given angle around a random axis
+    axis = rng.normal(size=3)
+    axis /= np.linalg.norm(axis)
+    angle = np.radians(angle) if angle is not None else rng.uniform(0, 2 * np.pi)
+    cross = np.array([[0, -axis[2], axis[1]], [axis[2], 0, -axis[0]], [-axis[1], axis[0], 0]])
+    return np.eye(3) + np.sin(angle) * cross + (1 - np.cos(angle)) * cross @ cross
+
+
+def _loop(first, last, length, rng):
+    # CA trace of a loop of the given length between two CA atoms, the loop bulges out in a random direction
+    # the atoms are placed on a circular arc, so all consecutive CA atoms have the usual distance, and the radius of the
+    # arc is chosen, so the chords of the loop and the chord between the two CA atoms close the circle
+    axis = last - first
+    distance = np.linalg.norm(axis)
+    direction = np.cross(axis, rng.normal(size=3))
+    direction /= np.linalg.norm(direction)
+    chords = length + 1
+    if distance >= chords * CA_DISTANCE:
+        return first + np.linspace(0, 1, chords + 1)[:, None] * axis
+
+    def angle(chord, radius):
+        return 2 * np.arcsin(min(chord / (2 * radius), 1))
+
+    # the arc runs around the center, if the loop is long enough to enclose it, and bends past it otherwise
+    low = max(CA_DISTANCE, distance) / 2
+    around = chords * angle(CA_DISTANCE, low) + angle(distance, low) >= 2 * np.pi
+    high = low + chords * CA_DISTANCE
+    for _ in range(100):
+        radius = (low + high) / 2
+        # the radius is too small, if the chords of the loop span more than the rest of the circle
+        if around:
+            small = chords * angle(CA_DISTANCE, radius) + angle(distance, radius) > 2 * np.pi
+        else:
+            small = chords * angle(CA_DISTANCE, radius) < angle(distance, radius)
+        if small:
+            low = radius
+        else:
+            high = radius
+    radius = (low + high) / 2
+
+    height = np.sqrt(max(radius**2 - distance**2 / 4, 0))
+    center = first + axis / 2 + (height if around else -height) * direction
+    start = first - center
+    side = direction - (direction @ start) / radius**2 * start
+    side *= radius / np.linalg.norm(side)
+    steps = np.arange(chords + 1)[:, None] * angle(CA_DISTANCE, radius)
+    traces = [center + np.cos(steps) * start + np.sin(steps) * sign * side for sign in (1, -1)]
+    return min(traces, key=lambda trace: np.linalg.norm(trace[-1] - last))
+
+
+def perturb_structure(
+    structure,
+    rng,
+    noise=0.0,
+    mutations=0.0,
+    insertions=0,
+    deletions=0,
+    segment_length=5,
+    hinge_angle=0.0,
+    rigid=True,
+):
+    """
+    Creates a variant of a synthetic chain by controlled perturbations.
+
+    Parameters
+    ----------
+    structure: dict
+        The chain returned by ``generate_structure``.
+
+    rng: numpy.random.Generator
+        The random number generator.
+
+    noise: float, Optional
+        Standard deviation of the noise added to the coordinates in angstrom. Default is 0.
+
+    mutations: float, Optional
+        Fraction of the residues replaced by a random amino acid. Default is 0.
+
+    insertions: int, Optional
+        Number of inserted segments. Default is 0.
+
+    deletions: int, Optional
+        Number of deleted segments. Default is 0.
+
+    segment_length: int, Optional
+        Number of residues of the inserted and deleted segments. Default is 5.
+
+    hinge_angle: float, Optional
+        Rotation of the C-terminal part of the chain around a hinge residue in the middle third of the chain in degrees.
+        Default is 0.
+
+    rigid: bool, Optional
+        If True, the chain is rotated and translated randomly. Default is True.
+
+    Returns
+    -------
+    dict
+        The variant in the format of ``generate_structure``. The residues are numbered consecutively.
+    """
+
+    resnames = list(structure["resnames"])
+    coordinates = structure["coordinates"].copy()
+
+    if hinge_angle:
+        hinge = int(rng.integers(len(resnames) // 3, 2 * len(resnames) // 3 + 1))
+        center = coordinates[hinge, 1]
+        coordinates[hinge:] = (coordinates[hinge:] - center) @ _rotation(rng, hinge_angle).T + center
+
+    for _ in range(deletions):
+        if len(resnames) <= segment_length + 3:
+            break
+        start = int(rng.integers(1, len(resnames) - segment_length))
+        del resnames[start : start + segment_length]
+        coordinates = np.delete(coordinates, np.s_[start : start + segment_length], axis=0)
+
+    for _ in range(insertions):
+        start = int(rng.integers(1, len(resnames)))
+        loop = _backbone(_loop(coordinates[start - 1, 1], coordinates[start, 1], segment_length, rng))[1:-1]
+        resnames[start:start] = list(rng.choice(AMINO_ACIDS, segment_length))
+        coordinates = np.concatenate([coordinates[:start], loop, coordinates[start:]])
+
+    mutated = rng.random(len(resnames)) < mutations
+    resnames = [rng.choice(AMINO_ACIDS) if mutate else resname for resname, mutate in zip(resnames, mutated)]
+
+    if noise:
+        coordinates = coordinates + rng.normal(scale=noise, size=coordinates.shape)
+    if rigid:
+        center = coordinates[:, 1].mean(axis=0)
+        translation = rng.uniform(-20, 20, size=3)
+        coordinates = (coordinates - center) @ _rotation(rng).T + center + translation
+
+    return {
+        "resnames": [str(resname) for resname in resnames],
+        "residues": list(range(1, len(resnames) + 1)),
+        "coordinates": coordinates,
+    }
+
+
+def write_pdb(structure, pdb_path, chain="A", ca_only=False):
+    """
+    Writes a synthetic chain as PDB file.
+
+    Parameters
+    ----------
+    structure: dict
+        The chain returned by ``generate_structure`` or ``perturb_structure``.
+
+    pdb_path: str
+        Path of the PDB file.
+
+    chain: str, Optional
+        Chain identifier. Default is "A".
+
+    ca_only: bool, Optional
+        If True, only the CA atoms are written. Default is False.
+
+    Returns
+    -------
+    None
+    """
+
+    atoms = ["CA"] if ca_only else BACKBONE_ATOMS
+    lines = []
+    serial = 1
+    for resname, residue, coordinates in zip(structure["resnames"], structure["residues"], structure["coordinates"]):
+        for name in atoms:
+            x, y, z = coordinates[BACKBONE_ATOMS.index(name)]
+            lines.append(
+                f"ATOM  {serial:5d}  {name:<3s} {resname:>3s} {chain}{residue:4d}    "
+                f"{x:8.3f}{y:8.3f}{z:8.3f}  1.00  0.00      {chain:<4s}{name[0]:>2s}\n"
+            )
+            serial += 1
+    lines.append(f"TER   {serial:5d}      {structure['resnames'][-1]:>3s} {chain}{structure['residues'][-1]:4d}\n")
+    lines.append("END\n")
+    with open(str(pdb_path), "w") as f:
+        f.writelines(lines)
+
+
+def generate_samples(pdb_dir, sample_path, length, variants=5, seed=2021, ca_only=False, **perturbation):
+    """
+    Generates the variants of one synthetic chain and writes them to a sample file.
+
+    Parameters
+    ----------
+    pdb_dir: str
+        Folder where the PDB files are written, e.g. the cache folder of the PDB files.
+
+    sample_path: str
+        Path of the sample file.
+
+    length: int
+        Number of residues of the generated chain.
+
+    variants: int, Optional
+        Number of variants created by ``perturb_structure``. Default is 5.
+
+    seed: int, Optional
+        Seed of the random number generator, combined with the length. Default is 2021.
+
+    ca_only: bool, Optional
+        If True, only the CA atoms are written. Default is False.
+
+    perturbation:
+        The perturbations passed to ``perturb_structure``, e.g. noise=0.5 or hinge_angle=30.
+
+    Returns
+    -------
+    None
+
+    .. note::
+
+        The sample file contains the variants with the group "L<length>", so the within-group alignments
+        of a sample file give one point of the time-versus-size curve.
+        The IDs of the structures ("syn<length>v<variant>") can not be mixed up with PDB-IDs.
+    """
+
+    rng = np.random.default_rng([seed, length])
+    os.makedirs(str(pdb_dir), exist_ok=True)
+    template = generate_structure(length, rng)
+    lines = []
+    for variant in range(variants):
+        structure_id = f"syn{length}v{variant}"
+        write_pdb(
+            perturb_structure(template, rng, **perturbation),
+            os.path.join(str(pdb_dir), f"{structure_id}.pdb"),
+            ca_only=ca_only,
+        )
+        lines.append(f"{structure_id},{SYNTHETIC_GROUP}{length},L{length},{SYNTHETIC_SPECIES},A\n")
+    with open(str(sample_path), "w") as f:
+        f.writelines(lines)
+
+
+def generate_dataset(pdb_dir, sample_dir, lengths=(50, 100, 200, 400, 800), **kwargs):
+    """
+    Generates the synthetic structures of a scaling benchmark, one sample file for every length.
+
+    Parameters
+    ----------
+    pdb_dir: str
+        Folder where the PDB files are written, e.g. the cache folder of the PDB files.
+
+    sample_dir: str
+        Folder where the sample files "L<length>_samples.txt" are written.
+
+    lengths: list, Optional
+        The lengths of the generated chains. Default is (50, 100, 200, 400, 800).
+
+    kwargs:
+        The parameters passed to ``generate_samples``, e.g. variants=5 or noise=0.5.
+
+    Returns
+    -------
+    dict
+        Maps the lengths to the paths of the sample files.
+    """
+
+    os.makedirs(str(sample_dir), exist_ok=True)
+    sample_paths = {}
+    for length in lengths:
+        sample_paths[length] = os.path.join(str(sample_dir), f"L{length}_samples.txt")
+        generate_samples(pdb_dir, sample_paths[length], length, **kwargs)
+    return sample_paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates synthetic structures for scaling benchmarks.")
+    parser.add_argument("pdb_dir", help="folder for the PDB files")
+    parser.add_argument("sample_dir", help="folder for the sample files")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[50, 100, 200, 400, 800])
+    parser.add_argument("--variants", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=2021)
+    parser.add_argument("--ca-only", action="store_true")
+    parser.add_argument("--noise", type=float, default=0.3)
+    parser.add_argument("--mutations", type=float, default=0.1)
+    parser.add_argument("--insertions", type=int, default=1)
+    parser.add_argument("--deletions", type=int, default=1)
+    parser.add_argument("--hinge-angle", type=float, default=20.0)
+    args = parser.parse_args()
+    generate_dataset(
+        args.pdb_dir,
+        args.sample_dir,
+        lengths=args.lengths,
+        variants=args.variants,
+        seed=args.seed,
+        ca_only=args.ca_only,
+        noise=args.noise,
+        mutations=args.mutations,
+        insertions=args.insertions,
+        deletions=args.deletions,
+        hinge_angle=args.hinge_angle,
+    )
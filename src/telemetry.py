@@ -0,0 +1,234 @@
+"""
+Provides the telemetry of long alignment runs: rolling throughput and latency percentiles per method,
+failure rates and the estimated remaining time.
+
+The metrics are written periodically to a file in JSON or Prometheus text format, so a monitoring system can scrape them,
+and a compact progress line is written to stderr instead of one line per alignment.
+Only the standard library is used, so the telemetry can also be used in PyMol and ChimeraX.
+"""
+
+import collections
+import json
+import math
+import os
+import sys
+import time
+
+# latency percentiles reported for every method
+PERCENTILES = [50, 90, 99]
+
+
+def _percentile(values, percentile):
+    # nearest-rank percentile of the sorted values
+    return values[max(0, math.ceil(percentile / 100 * len(values)) - 1)]
+
+
+def _format_duration(seconds):
+    if seconds is None:
+        return "?"
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class Telemetry:
+    """
+    Collects the telemetry of an alignment run.
+
+    Parameters
+    ----------
+    total: int
+        Number of alignments of the run, used for the progress and the estimated remaining time.
+
+    metrics_path: str, Optional
+        Path of the metrics file. If not provided, no file is written.
+
+    metrics_format: str, Optional
+        "json" or "prometheus". Default is "json".
+
+    window: int, Optional
+        Number of the last alignments of every method used for the rolling throughput and the percentiles. Default is 100.
+
+    interval: float, Optional
+        Minimal number of seconds between two updates of the metrics file and the progress line. Default is 10.
+
+    stream: file, Optional
+        Stream of the progress line. Default is stderr, so the logs of PyMol and ChimeraX written to stdout are not changed.
+        With None, no progress line is written.
+    """
+
+    def __init__(self, total, metrics_path=None, metrics_format="json", window=100, interval=10.0, stream=sys.stderr):
+        if metrics_format not in ("json", "prometheus"):
+            raise ValueError(f"Unknown metrics format {metrics_format}, use json or prometheus.")
+        self.total = total
+        self.metrics_path = metrics_path
+        self.metrics_format = metrics_format
+        self.interval = interval
+        self.stream = stream
+        self.start = time.monotonic()
+        self.last_update = self.start
+        self.window = window
+        self.recent = {}
+        self.counts = collections.Counter()
+        self.failures = collections.Counter()
+        # end times of the last alignments of all methods for the overall throughput
+        self.finished = collections.deque(maxlen=window)
+
+    def record(self, method, duration, failed=False):
+        """
+        Records one alignment and updates the metrics file and the progress line, if the interval has passed.
+
+        Parameters
+        ----------
+        method: str
+            The method of the alignment.
+
+        duration: float
+            Wall time of the alignment in seconds.
+
+        failed: bool, Optional
+            True, if the alignment failed. Default is False.
+
+        Returns
+        -------
+        None
+        """
+
+        now = time.monotonic()
+        self.recent.setdefault(method, collections.deque(maxlen=self.window)).append((now, duration))
+        self.counts[method] += 1
+        self.failures[method] += bool(failed)
+        self.finished.append(now)
+        if now - self.last_update >= self.interval:
+            self.update()
+
+    def snapshot(self):
+        """
+        Computes the current metrics.
+
+        Returns
+        -------
+        dict
+            - done, total, failures, elapsed, throughput (alignments per second of the last alignments) and eta (seconds).
+            - methods: dict with the count, failures, failure_rate, throughput and the latency percentiles
+              ("p50", "p90", "p99" in seconds) of every method.
+        """
+
+        now = time.monotonic()
+        done = sum(self.counts.values())
+        methods = {}
+        for method, recent in self.recent.items():
+            durations = sorted(duration for _, duration in recent)
+            # the throughput of a method is the number of its last alignments divided by their total duration
+            busy = sum(durations)
+            methods[method] = {
+                "count": self.counts[method],
+                "failures": self.failures[method],
+                "failure_rate": self.failures[method] / self.counts[method],
+                "throughput": len(durations) / busy if busy > 0 else None,
+            }
+            methods[method].update({f"p{p}": _percentile(durations, p) for p in PERCENTILES})
+
+        # the overall throughput covers the time since the first of the last alignments
+        span = now - (self.finished[0] if len(self.finished) == self.finished.maxlen else self.start)
+        throughput = len(self.finished) / span if span > 0 and self.finished else None
+        return {
+            "done": done,
+            "total": self.total,
+            "failures": sum(self.failures.values()),
+            "elapsed": now - self.start,
+            "throughput": throughput,
+            "eta": (self.total - done) / throughput if throughput else None,
+            "methods": methods,
+        }
+
+    def format_progress(self, snapshot=None):
+        """
+        Formats the compact progress line.
+
+        Parameters
+        ----------
+        snapshot: dict, Optional
+            The metrics returned by ``snapshot``. Default are the current metrics.
+
+        Returns
+        -------
+        str
+            The progress line, e.g. "1200/6125 19.6% 3.41 aln/s eta 0:24:03 failed 2 | mda 1.20/s p50 0.61s ...".
+        """
+
+        snapshot = snapshot or self.snapshot()
+        progress = 100 * snapshot["done"] / snapshot["total"] if snapshot["total"] else 100.0
+        throughput = f"{snapshot['throughput']:.2f}" if snapshot["throughput"] else "?"
+        line = (
+            f"{snapshot['done']}/{snapshot['total']} {progress:.1f}% {throughput} aln/s "
+            f"eta {_format_duration(snapshot['eta'])} failed {snapshot['failures']}"
+        )
+        for method, metrics in snapshot["methods"].items():
+            rate = f"{metrics['throughput']:.2f}" if metrics["throughput"] else "?"
+            line += f" | {method} {rate}/s p50 {metrics['p50']:.2f}s"
+        return line
+
+    def format_prometheus(self, snapshot=None):
+        """
+        Formats the metrics in the Prometheus text format.
+
+        Parameters
+        ----------
+        snapshot: dict, Optional
+            The metrics returned by ``snapshot``. Default are the current metrics.
+
+        Returns
+        -------
+        str
+            The metrics in the Prometheus text format.
+        """
+
+        snapshot = snapshot or self.snapshot()
+        lines = [
+            "# TYPE alignment_run_done gauge",
+            f"alignment_run_done {snapshot['done']}",
+            "# TYPE alignment_run_total gauge",
+            f"alignment_run_total {snapshot['total']}",
+            "# TYPE alignment_run_throughput gauge",
+            f"alignment_run_throughput {snapshot['throughput'] or 0}",
+        ]
+        if snapshot["eta"] is not None:
+            lines += ["# TYPE alignment_run_eta_seconds gauge", f"alignment_run_eta_seconds {snapshot['eta']}"]
+        methods = snapshot["methods"]
+        for name, key, kind in [
+            ("alignment_count", "count", "counter"),
+            ("alignment_failures", "failures", "counter"),
+            ("alignment_failure_rate", "failure_rate", "gauge"),
+            ("alignment_throughput", "throughput", "gauge"),
+        ]:
+            lines.append(f"# TYPE {name} {kind}")
+            lines += [f'{name}{{method="{method}"}} {metrics[key] or 0}' for method, metrics in methods.items()]
+        lines.append("# TYPE alignment_latency_seconds summary")
+        for method, metrics in methods.items():
+            lines += [
+                f'alignment_latency_seconds{{method="{method}",quantile="{p / 100}"}} {metrics[f"p{p}"]}'
+                for p in PERCENTILES
+            ]
+        return "\n".join(lines) + "\n"
+
+    def update(self):
+        """
+        Writes the metrics file and the progress line.
+
+        Returns
+        -------
+        None
+        """
+
+        self.last_update = time.monotonic()
+        snapshot = self.snapshot()
+        if self.metrics_path:
+            # write to a temporary file first, so the scraper never reads a partly written file
+            with open(f"{self.metrics_path}.tmp", "w") as f:
+                if self.metrics_format == "json":
+                    json.dump(snapshot, f, indent=2)
+                else:
+                    f.write(self.format_prometheus(snapshot))
+            os.replace(f"{self.metrics_path}.tmp", self.metrics_path)
+        if self.stream:
+            print(self.format_progress(snapshot), file=self.stream, flush=True)
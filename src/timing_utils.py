@@ -0,0 +1,137 @@
+"""
+Provides the common timing harness used by the OpenCADD, PyMol and ChimeraX alignment drivers.
+Every driver wraps exactly one call with the harness, so the measured interval starts directly before
+and ends directly after the alignment call of the tool (see ``TIMING_SCOPES``).
+"""
+
+import statistics
+import time
+
+# start and end point of the measured interval for each tool
+TIMING_SCOPES = {
+    "opencadd": "api.align(...) call, structures are loaded beforehand",
+    "pymol": "cmd.align(...) call, structures are loaded beforehand",
+    "matchmaker": "match_maker cmd_match(...) call, atom specs are parsed beforehand",
+}
+
+
+def time_call(func, *args, warmup=0, repeats=1, **kwargs):
+    """
+    Calls a function several times and measures the duration of every call with ``time.perf_counter_ns``.
+
+    Parameters
+    ----------
+    func: callable
+        The function to measure, e.g. the alignment call of a tool.
+
+    *args:
+        Positional arguments passed to ``func``.
+
+    warmup: int, Optional
+        Number of calls performed before the measurement to warm up caches. Default is 0.
+
+    repeats: int, Optional
+        Number of measured calls. Default is 1.
+
+    **kwargs:
+        Keyword arguments passed to ``func``.
+
+    Returns
+    -------
+    tuple
+        - result: the return value of the last call of ``func``.
+        - timing: dict containing the summary of the measured calls (see ``summarize_timings``).
+
+    .. note::
+
+        The function has to be safe to call several times in a row, because warm-up and repeated calls
+        are performed on the same input.
+    """
+
+    if repeats < 1:
+        raise ValueError("At least one measured call is required.")
+    for _ in range(warmup):
+        func(*args, **kwargs)
+    durations = []
+    for _ in range(repeats):
+        start_time = time.perf_counter_ns()
+        result = func(*args, **kwargs)
+        end_time = time.perf_counter_ns()
+        durations.append(end_time - start_time)
+    timing = summarize_timings(durations)
+    timing["warmup"] = warmup
+    return result, timing
+
+
+def summarize_timings(durations):
+    """
+    Summarizes the durations of repeated calls.
+
+    Parameters
+    ----------
+    durations: list
+        Durations of the calls in nanoseconds.
+
+    Returns
+    -------
+    dict
+        - time: the minimal duration in seconds, this is the value used for the ``time`` column.
+        - time_median: the median duration in seconds.
+        - time_spread: the difference between the maximal and the minimal duration in seconds.
+        - repeats: the number of measured calls.
+    """
+
+    return {
+        "time": round(min(durations) / 1e9, 6),
+        "time_median": round(statistics.median(durations) / 1e9, 6),
+        "time_spread": round((max(durations) - min(durations)) / 1e9, 6),
+        "repeats": len(durations),
+    }
+
+
+def format_timing(timing):
+    """
+    Formats the timing summary as a single line for the logs of PyMol and ChimeraX.
+    The line is parsed again by ``parse_timing``.
+
+    Parameters
+    ----------
+    timing: dict
+        The timing summary returned by ``time_call``.
+
+    Returns
+    -------
+    str
+        The formatted line, e.g. "timing: min=0.0215 median=0.0221 spread=0.0012 repeats=5 warmup=1".
+    """
+
+    return (
+        f"timing: min={timing['time']} median={timing['time_median']} spread={timing['time_spread']} "
+        f"repeats={timing['repeats']} warmup={timing['warmup']}"
+    )
+
+
+def parse_timing(line):
+    """
+    Parses a line created by ``format_timing``.
+
+    Parameters
+    ----------
+    line: str
+        The line of the log file, starting with "timing: ".
+
+    Returns
+    -------
+    dict
+        The timing summary with the same keys as returned by ``time_call``.
+    """
+
+    # only the key=value entries are used, so trailing markup of the ChimeraX log is ignored
+    values = dict(entry.split("=", 1) for entry in line.split("timing: ")[1].split() if "=" in entry)
+    return {
+        "time": float(values["min"]),
+        "time_median": float(values["median"]),
+        "time_spread": float(values["spread"]),
+        "repeats": int(values["repeats"]),
+        "warmup": int(values["warmup"]),
+    }
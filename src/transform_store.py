@@ -0,0 +1,460 @@
+"""
+Provides a compact store of the superpositions of the alignments, so superposed coordinates can be created without repeating the alignments.
+
+For every (pair, method) the store contains the 4x4 transformation matrix, which moves the mobile structure
+from its original coordinates (as in the PDB file) onto the reference structure in its original coordinates.
+The tools move either the mobile or the reference structure, so the matrix is determined from the coordinates
+of both structures before and after the alignment. The matrices of all alignments are appended to one flat file:
+
+    <store>/transforms.f32  (float32, 16 values for every alignment)
+    <store>/index.csv  (reference_id, mobile_id, method, position)
+
+The store is read with ``load_transform_store``, the matrices are applied in bulk with ``apply_transforms``.
+The known matrices are also composed to warm-start new alignments (``TransformGraph``): if A-B and B-C are aligned,
+the matrix of A-B times the matrix of B-C moves C onto A and is a good starting superposition of the alignment A-C.
+Only the standard library and NumPy are used, so the matrices can also be captured in PyMol and ChimeraX.
+"""
+
+import csv
+import os
+from collections import defaultdict
+
+import numpy as np
+
+from residue_store import match_residues
+from structure_utils import local_pdb_file, read_ca_atoms
+
+INDEX_FILE = "index.csv"
+
+TRANSFORM_FILE = "transforms.f32"
+
+INDEX_COLUMNS = ["reference_id", "mobile_id", "method", "position"]
+
+# a composed starting superposition is only used, if this fraction of the CA atoms of the smaller structure is matched
+# within the distance of the mutual nearest neighbours and the RMSD of the matched atoms is below the limit in Angstrom
+WARM_START_COVERAGE = 0.7
+WARM_START_RMSD = 3.0
+
+# number of intermediate structures tried for a composed starting superposition
+WARM_START_CANDIDATES = 3
+
+
+def fit_transform(before, after):
+    """
+    Computes the rigid transformation which moves the coordinates before onto the coordinates after (Kabsch algorithm).
+
+    Parameters
+    ----------
+    before: numpy.ndarray
+        Coordinates of shape (N, 3).
+
+    after: numpy.ndarray
+        The same atoms after the transformation, shape (N, 3).
+
+    Returns
+    -------
+    numpy.ndarray
+        The 4x4 transformation matrix.
+    """
+
+    before = np.asarray(before, dtype=float)
+    after = np.asarray(after, dtype=float)
+    before_center = before.mean(axis=0)
+    after_center = after.mean(axis=0)
+    u, _, vt = np.linalg.svd((before - before_center).T @ (after - after_center))
+    # correction of a reflection
+    d = np.sign(np.linalg.det(u @ vt))
+    rotation = (u @ np.diag([1.0, 1.0, d]) @ vt).T
+    transform = np.eye(4)
+    transform[:3, :3] = rotation
+    transform[:3, 3] = after_center - rotation @ before_center
+    return transform
+
+
+def alignment_transform(reference_before, reference_after, mobile_before, mobile_after):
+    """
+    Computes the transformation of an alignment, which moves the original mobile structure onto the original reference structure.
+
+    Parameters
+    ----------
+    reference_before: numpy.ndarray
+        Coordinates of atoms of the reference structure before the alignment, shape (N, 3).
+
+    reference_after: numpy.ndarray
+        The same atoms after the alignment.
+
+    mobile_before: numpy.ndarray
+        Coordinates of atoms of the mobile structure before the alignment, shape (M, 3).
+
+    mobile_after: numpy.ndarray
+        The same atoms after the alignment.
+
+    Returns
+    -------
+    numpy.ndarray
+        The 4x4 transformation matrix.
+    """
+
+    # the structures, which were not moved by the tool, give the identity
+    return np.linalg.inv(fit_transform(reference_before, reference_after)) @ fit_transform(mobile_before, mobile_after)
+
+
+class TransformStore:
+    """
+    Appends the transformation matrices of alignments to a store.
+
+    Parameters
+    ----------
+    store_dir: str
+        Folder of the store. An existing store is continued.
+
+    .. note::
+
+        Only one process may write to a store at the same time. Parallel runs collect the matrices in the workers
+        (``CapturedTransforms``) and write them in the main process.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = str(store_dir)
+        os.makedirs(self.store_dir, exist_ok=True)
+        path = os.path.join(self.store_dir, TRANSFORM_FILE)
+        self.position = os.path.getsize(path) // (16 * 4) if os.path.isfile(path) else 0
+        index_path = os.path.join(self.store_dir, INDEX_FILE)
+        is_new = not os.path.isfile(index_path)
+        self._index = open(index_path, "a", newline="")
+        self._writer = csv.writer(self._index)
+        if is_new:
+            self._writer.writerow(INDEX_COLUMNS)
+        self._file = open(path, "ab")
+
+    def append(self, reference_id, mobile_id, method, transform):
+        """
+        Appends the transformation matrix of one alignment.
+
+        Parameters
+        ----------
+        reference_id: str
+            PDB-ID of the reference structure.
+
+        mobile_id: str
+            PDB-ID of the mobile structure.
+
+        method: str
+            The method.
+
+        transform: numpy.ndarray
+            The 4x4 transformation matrix returned by ``alignment_transform``.
+
+        Returns
+        -------
+        None
+        """
+
+        self._file.write(np.asarray(transform, dtype=np.float32).reshape(16).tobytes())
+        self._writer.writerow([reference_id, mobile_id, method, self.position])
+        self.position += 1
+
+    def close(self):
+        """
+        Closes the files of the store.
+
+        Returns
+        -------
+        None
+        """
+
+        self._file.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class CapturedTransforms:
+    """
+    Collects the transformation matrices like ``TransformStore`` in memory, e.g. in worker processes.
+    The collected matrices are written to a store with ``write_to``.
+    """
+
+    def __init__(self):
+        self.entries = []
+
+    def append(self, *entry):
+        self.entries.append(entry)
+
+    def write_to(self, store):
+        for entry in self.entries:
+            store.append(*entry)
+
+
+def load_transform_store(store_dir):
+    """
+    Opens a store without reading the matrices into memory.
+
+    Parameters
+    ----------
+    store_dir: str
+        Folder of the store.
+
+    Returns
+    -------
+    dict
+        Contains "positions" (dict mapping (reference_id, mobile_id, method) to the position of the matrix)
+        and the read-only memory-mapped array "transforms" of shape (alignments, 4, 4).
+    """
+
+    store = {"positions": {}}
+    with open(os.path.join(str(store_dir), INDEX_FILE), newline="") as f:
+        for row in csv.DictReader(f):
+            # a repeated alignment replaces the previous entry
+            store["positions"][(row["reference_id"], row["mobile_id"], row["method"])] = int(row["position"])
+    path = os.path.join(str(store_dir), TRANSFORM_FILE)
+    # np.memmap can not map empty files
+    store["transforms"] = (
+        np.memmap(path, dtype=np.float32, mode="r").reshape(-1, 4, 4)
+        if os.path.getsize(path)
+        else np.zeros((0, 4, 4), dtype=np.float32)
+    )
+    return store
+
+
+def read_transforms(store, keys):
+    """
+    Reads the transformation matrices of several alignments.
+
+    Parameters
+    ----------
+    store: dict
+        The store returned by ``load_transform_store``.
+
+    keys: list
+        Tuples (reference_id, mobile_id, method) of the alignments.
+
+    Returns
+    -------
+    numpy.ndarray
+        The matrices of shape (len(keys), 4, 4) as float64, NaN for alignments which are not in the store.
+    """
+
+    positions = np.array([store["positions"].get(tuple(key), -1) for key in keys], dtype=int)
+    transforms = np.full((len(keys), 4, 4), np.nan)
+    found = positions >= 0
+    transforms[found] = store["transforms"][positions[found]]
+    return transforms
+
+
+def apply_transforms(transforms, coordinates):
+    """
+    Applies one transformation matrix to each set of coordinates, vectorized over all sets.
+
+    Parameters
+    ----------
+    transforms: numpy.ndarray
+        The matrices of shape (K, 4, 4).
+
+    coordinates: list
+        K arrays of coordinates with shape (n_k, 3), e.g. the CA atoms of the mobile structures.
+
+    Returns
+    -------
+    list
+        The K transformed arrays of coordinates.
+    """
+
+    transforms = np.asarray(transforms, dtype=float)
+    lengths = [len(coords) for coords in coordinates]
+    if not sum(lengths):
+        return [np.zeros((0, 3)) for _ in lengths]
+    # all coordinates in one array, every atom refers to the matrix of its set
+    points = np.concatenate([np.asarray(coords, dtype=float).reshape(-1, 3) for coords in coordinates])
+    sets = np.repeat(np.arange(len(lengths)), lengths)
+    moved = np.einsum("nij,nj->ni", transforms[sets, :3, :3], points) + transforms[sets, :3, 3]
+    return np.split(moved, np.cumsum(lengths)[:-1])
+
+
+def superpose_cached(store, all_methods_df, cache_dir):
+    """
+    Creates the superposed CA coordinates of the mobile structures of many alignments from the cached PDB files.
+
+    Parameters
+    ----------
+    store: dict
+        The store returned by ``load_transform_store``.
+
+    all_methods_df : Pandas.DataFrame
+        The alignments, e.g. a selection of the results.
+
+    cache_dir: str
+        Folder containing the cached PDB files.
+
+    Returns
+    -------
+    list
+        The CA coordinates of the mobile structure of every alignment in the frame of the reference structure,
+        NaN for alignments which are not in the store.
+
+    .. note::
+
+        Every chain is read once from the cached PDB file, the matrices are applied to all alignments at once.
+    """
+
+    chains = {}
+    coordinates = []
+    for pdb_id, chain in zip(all_methods_df["mobile_id"], all_methods_df["mob_chain"]):
+        if (pdb_id, chain) not in chains:
+            chains[(pdb_id, chain)] = read_ca_atoms(local_pdb_file(pdb_id, cache_dir), chain)["coordinates"]
+        coordinates.append(chains[(pdb_id, chain)])
+    keys = zip(all_methods_df["reference_id"], all_methods_df["mobile_id"], all_methods_df["method"])
+    return apply_transforms(read_transforms(store, list(keys)), coordinates)
+
+
+class TransformGraph:
+    """
+    Known transformation matrices between structures, composed to estimate the superposition of pairs which are not aligned yet.
+
+    Parameters
+    ----------
+    store: dict, Optional
+        A store returned by ``load_transform_store``, whose matrices are added, e.g. of an earlier run.
+
+    .. note::
+
+        The matrices of all methods are used, the matrix of a pair is replaced by the last added matrix.
+    """
+
+    def __init__(self, store=None):
+        # (reference_id, mobile_id) -> matrix moving the mobile structure onto the reference structure
+        self.transforms = {}
+        self.neighbours = defaultdict(set)
+        if store is not None:
+            for (reference_id, mobile_id, _), position in store["positions"].items():
+                self.add(reference_id, mobile_id, store["transforms"][position])
+
+    def add(self, reference_id, mobile_id, transform):
+        """
+        Adds the transformation matrix of an alignment and its inverse.
+
+        Parameters
+        ----------
+        reference_id: str
+            PDB-ID of the reference structure.
+
+        mobile_id: str
+            PDB-ID of the mobile structure.
+
+        transform: numpy.ndarray
+            The 4x4 matrix, which moves the mobile structure onto the reference structure.
+
+        Returns
+        -------
+        None
+        """
+
+        transform = np.array(transform, dtype=float)
+        self.transforms[(reference_id, mobile_id)] = transform
+        self.transforms[(mobile_id, reference_id)] = np.linalg.inv(transform)
+        self.neighbours[reference_id].add(mobile_id)
+        self.neighbours[mobile_id].add(reference_id)
+
+    def compose(self, reference_id, mobile_id, candidates=WARM_START_CANDIDATES):
+        """
+        Composes the matrices of the pair over structures aligned with both structures.
+
+        Parameters
+        ----------
+        reference_id: str
+            PDB-ID of the reference structure.
+
+        mobile_id: str
+            PDB-ID of the mobile structure.
+
+        candidates: int, Optional
+            Maximal number of intermediate structures. Default is ``WARM_START_CANDIDATES``.
+
+        Returns
+        -------
+        list
+            The composed 4x4 matrices, which move the mobile structure onto the reference structure.
+        """
+
+        intermediates = sorted((self.neighbours[reference_id] & self.neighbours[mobile_id]) - {reference_id, mobile_id})
+        return [
+            self.transforms[(reference_id, intermediate)] @ self.transforms[(intermediate, mobile_id)]
+            for intermediate in intermediates[:candidates]
+        ]
+
+    def warm_start(
+        self,
+        reference_id,
+        mobile_id,
+        reference_coords,
+        mobile_coords,
+        min_coverage=WARM_START_COVERAGE,
+        max_rmsd=WARM_START_RMSD,
+    ):
+        """
+        Selects the best composed starting superposition of a pair, if it is good enough.
+
+        Parameters
+        ----------
+        reference_id: str
+            PDB-ID of the reference structure.
+
+        mobile_id: str
+            PDB-ID of the mobile structure.
+
+        reference_coords: numpy.ndarray
+            Coordinates of the CA atoms of the reference structure, shape (N, 3).
+
+        mobile_coords: numpy.ndarray
+            Coordinates of the CA atoms of the mobile structure, shape (M, 3).
+
+        min_coverage: float, Optional
+            Minimal fraction of the CA atoms of the smaller structure, which is matched after the composed superposition.
+            Default is ``WARM_START_COVERAGE``.
+
+        max_rmsd: float, Optional
+            Maximal RMSD of the matched CA atoms in Angstrom. Default is ``WARM_START_RMSD``.
+
+        Returns
+        -------
+        numpy.ndarray or None
+            The composed matrix with the most matched CA atoms, None if no composed matrix is available or good enough,
+            then the alignment is started from the original coordinates (cold start).
+        """
+
+        size = min(len(reference_coords), len(mobile_coords))
+        best, best_matched = None, 0
+        for transform in self.compose(reference_id, mobile_id):
+            moved = apply_transforms(transform[None], [mobile_coords])[0]
+            _, _, distances = match_residues(reference_coords, moved)
+            if (
+                len(distances) > best_matched
+                and len(distances) >= min_coverage * size
+                and np.sqrt(np.mean(distances**2)) <= max_rmsd
+            ):
+                best, best_matched = transform, len(distances)
+        return best
+
+
+def load_transform_graph(store_dir=None):
+    """
+    Creates the graph of the known transformation matrices with the matrices of a store, if it exists.
+
+    Parameters
+    ----------
+    store_dir: str, Optional
+        Folder of the store. Default is an empty graph.
+
+    Returns
+    -------
+    TransformGraph
+        The graph.
+    """
+
+    if store_dir and os.path.isfile(os.path.join(str(store_dir), INDEX_FILE)):
+        return TransformGraph(load_transform_store(store_dir))
+    return TransformGraph()
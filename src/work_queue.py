@@ -0,0 +1,501 @@
+"""
+Provides a file-based work queue of the alignment jobs, so a large run can be spread over several machines.
+
+The queue is a SQLite database containing one row for every (pair, method) job with its status
+("pending", "running", "done" or "failed"), the worker and the result. Workers claim jobs with a lease,
+which expires after the given number of seconds. Jobs of a worker which died are claimed again by the other workers
+after their lease expired, so any number of workers can join or leave during the run.
+Only the standard library is used, so the queue can also be used in PyMol and ChimeraX.
+
+.. note::
+
+    SQLite locks the database file for every claim. On shared filesystems, the locks are only reliable,
+    if the filesystem supports POSIX locks (e.g. NFSv4 or Lustre with the flock option).
+"""
+
+import argparse
+import csv
+import json
+import os
+import socket
+import sqlite3
+import time
+
+STATUSES = ["pending", "running", "done", "failed"]
+
+# default number of seconds a claimed job is reserved for the worker
+LEASE = 600
+
+# default number of claims of a job, before it is marked as failed
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    method TEXT NOT NULL,
+    reference_id TEXT NOT NULL,
+    reference_chain TEXT NOT NULL,
+    mobile_id TEXT NOT NULL,
+    mobile_chain TEXT NOT NULL,
+    reference TEXT NOT NULL,
+    mobile TEXT NOT NULL,
+    cost REAL NOT NULL DEFAULT 1,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    updated REAL,
+    UNIQUE (method, reference_id, reference_chain, mobile_id, mobile_chain)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, method);
+"""
+
+
+def _connect(queue_path):
+    # autocommit mode, the transactions of the claims are started explicitly
+    connection = sqlite3.connect(str(queue_path), timeout=60, isolation_level=None)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def _dumps(row):
+    # numpy scalars of the result rows are converted to Python numbers
+    return None if row is None else json.dumps(list(row), default=lambda value: value.item())
+
+
+def default_worker():
+    """
+    Returns the default name of a worker, "<host>:<process ID>".
+
+    Returns
+    -------
+    str
+        The worker name.
+    """
+
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def create_queue(queue_path, jobs, costs=None):
+    """
+    Adds jobs to the queue, the database is created, if it does not exist.
+    Jobs already in the queue are not added again, so the same jobs can be added by several workers.
+
+    Parameters
+    ----------
+    queue_path: str
+        Path of the SQLite database.
+
+    jobs: list
+        The jobs returned by ``scheduling.create_jobs``, tuples (method, structure, mobile).
+
+    costs: list, Optional
+        The costs of the jobs returned by ``scheduling.estimate_job_costs``.
+        The jobs are claimed longest-first. Default is the same cost for all jobs (claimed in the given order).
+
+    Returns
+    -------
+    int
+        Number of added jobs.
+    """
+
+    costs = [1.0] * len(jobs) if costs is None else costs
+    connection = _connect(queue_path)
+    with connection:
+        connection.execute("BEGIN IMMEDIATE")
+        before = connection.total_changes
+        connection.executemany(
+            "INSERT OR IGNORE INTO jobs (method, reference_id, reference_chain, mobile_id, mobile_chain, "
+            "reference, mobile, cost, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    method,
+                    structure[0],
+                    structure[4],
+                    mobile[0],
+                    mobile[4],
+                    json.dumps(list(structure)),
+                    json.dumps(list(mobile)),
+                    float(cost),
+                    time.time(),
+                )
+                for (method, structure, mobile), cost in zip(jobs, costs)
+            ],
+        )
+        added = connection.total_changes - before
+    connection.close()
+    return added
+
+
+def claim_jobs(queue_path, worker=None, methods=None, count=1, lease=LEASE, max_attempts=MAX_ATTEMPTS):
+    """
+    Claims pending jobs and jobs with an expired lease.
+
+    Parameters
+    ----------
+    queue_path: str
+        Path of the SQLite database.
+
+    worker: str, Optional
+        Name of the worker. Default is ``default_worker()``.
+
+    methods: list, Optional
+        Only jobs of these methods are claimed, e.g. ["pymol"] for the PyMol scripts. Default are all methods.
+
+    count: int, Optional
+        Maximal number of claimed jobs. Default is 1.
+
+    lease: float, Optional
+        Number of seconds the jobs are reserved for the worker. Default is ``LEASE``.
+
+    max_attempts: int, Optional
+        Jobs with an expired lease, which were already claimed this often, are marked as failed instead of claimed.
+        Default is ``MAX_ATTEMPTS``.
+
+    Returns
+    -------
+    list
+        Contains a dict with the entries "id", "method", "structure", "mobile" and "attempts" for every claimed job.
+        An empty list means, that no job is left for the worker.
+    """
+
+    worker = worker or default_worker()
+    method_filter = f" AND method IN ({','.join('?' * len(methods))})" if methods else ""
+    now = time.time()
+    connection = _connect(queue_path)
+    with connection:
+        # the write lock is taken before the selection, so two workers never claim the same job
+        connection.execute("BEGIN IMMEDIATE")
+        connection.execute(
+            "UPDATE jobs SET status = 'failed', error = 'lease expired', updated = ? "
+            "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+            (now, now, max_attempts),
+        )
+        rows = connection.execute(
+            "SELECT id, method, reference, mobile, attempts FROM jobs "
+            "WHERE (status = 'pending' OR (status = 'running' AND lease_until < ?))"
+            f"{method_filter} ORDER BY cost DESC, id LIMIT ?",
+            [now] + list(methods or []) + [count],
+        ).fetchall()
+        connection.executemany(
+            "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1, updated = ? "
+            "WHERE id = ?",
+            [(worker, now + lease, now, row[0]) for row in rows],
+        )
+    connection.close()
+    return [
+        {
+            "id": job_id,
+            "method": method,
+            "structure": json.loads(structure),
+            "mobile": json.loads(mobile),
+            "attempts": attempts + 1,
+        }
+        for job_id, method, structure, mobile, attempts in rows
+    ]
+
+
+def renew_leases(queue_path, job_ids, worker=None, lease=LEASE):
+    """
+    Extends the leases of claimed jobs, e.g. of the remaining jobs of a batch.
+
+    Parameters
+    ----------
+    queue_path: str
+        Path of the SQLite database.
+
+    job_ids: list
+        IDs of the claimed jobs.
+
+    worker: str, Optional
+        Name of the worker. Default is ``default_worker()``.
+
+    lease: float, Optional
+        Number of seconds from now the jobs are reserved for the worker. Default is ``LEASE``.
+
+    Returns
+    -------
+    int
+        Number of renewed leases. Jobs claimed by another worker in the meantime are not renewed.
+    """
+
+    worker = worker or default_worker()
+    now = time.time()
+    connection = _connect(queue_path)
+    with connection:
+        cursor = connection.executemany(
+            "UPDATE jobs SET lease_until = ?, updated = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            [(now + lease, now, job_id, worker) for job_id in job_ids],
+        )
+        renewed = cursor.rowcount
+    connection.close()
+    return renewed
+
+
+def complete_job(queue_path, job_id, worker=None, result=None):
+    """
+    Records the result of a job.
+
+    Parameters
+    ----------
+    queue_path: str
+        Path of the SQLite database.
+
+    job_id: int
+        ID of the job.
+
+    worker: str, Optional
+        Name of the worker. Default is ``default_worker()``.
+
+    result: list, Optional
+        The result row of the job in the order of ``results_utils.RESULT_COLUMNS``.
+        The PyMol and ChimeraX scripts write their results to the log and record no result.
+
+    Returns
+    -------
+    bool
+        True, if the result was recorded. A result is not recorded, if the job is already done,
+        e.g. when the lease expired and another worker finished the job first.
+
+    .. note::
+
+        The first valid result of a job is accepted, also from a worker whose lease expired in the meantime,
+        because the result does not depend on the worker. The result of the worker running the job again
+        is not recorded then.
+    """
+
+    worker = worker or default_worker()
+    connection = _connect(queue_path)
+    with connection:
+        # the first result is accepted independent of the lease, see the note
+        cursor = connection.execute(
+            "UPDATE jobs SET status = 'done', worker = ?, result = ?, error = NULL, updated = ? "
+            "WHERE id = ? AND status != 'done'",
+            (worker, _dumps(result), time.time(), job_id),
+        )
+        recorded = cursor.rowcount == 1
+    connection.close()
+    return recorded
+
+
+def fail_job(queue_path, job_id, error, worker=None, result=None, max_attempts=MAX_ATTEMPTS, deterministic=False):
+    """
+    Records the failure of a job. The job is returned to the queue, until it was claimed ``max_attempts`` times.
+    Only the worker holding the lease of the running job can record its failure, so a worker whose lease expired
+    does not return the job to the queue, while another worker runs it.
+
+    Parameters
+    ----------
+    queue_path: str
+        Path of the SQLite database.
+
+    job_id: int
+        ID of the job.
+
+    error: str
+        Description of the error.
+
+    worker: str, Optional
+        Name of the worker. Default is ``default_worker()``.
+
+    result: list, Optional
+        The result row of the failed job (without quality measures), which is exported, if the job finally failed.
+
+    max_attempts: int, Optional
+        Number of attempts, after which the job is marked as failed. Default is ``MAX_ATTEMPTS``.
+
+    deterministic: bool, Optional
+        If True, the failure occurs in every attempt (see ``failure_cache.DETERMINISTIC``)
+        and the job is marked as failed right away. Default is False.
+
+    Returns
+    -------
+    str
+        The new status of the job, "pending" or "failed". If the worker does not hold the lease of the job anymore,
+        the failure is not recorded and the current status is returned, e.g. "running" by another worker.
+    """
+
+    worker = worker or default_worker()
+    connection = _connect(queue_path)
+    with connection:
+        connection.execute(
+            "UPDATE jobs SET status = CASE WHEN ? OR attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "lease_until = NULL, result = ?, error = ?, updated = ? "
+            "WHERE id = ? AND worker = ? AND status = 'running'",
+            (
+                int(deterministic),
+                max_attempts,
+                _dumps(result),
+                str(error),
+                time.time(),
+                job_id,
+                worker,
+            ),
+        )
+        (status,) = connection.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    connection.close()
+    return status
+
+
+def release_jobs(queue_path, worker=None):
+    """
+    Returns the running jobs of a worker to the queue, e.g. when the worker is stopped.
+
+    Parameters
+    ----------
+    queue_path: str
+        Path of the SQLite database.
+
+    worker: str, Optional
+        Name of the worker. Default is ``default_worker()``.
+
+    Returns
+    -------
+    int
+        Number of released jobs.
+    """
+
+    worker = worker or default_worker()
+    connection = _connect(queue_path)
+    with connection:
+        cursor = connection.execute(
+            "UPDATE jobs SET status = 'pending', lease_until = NULL, attempts = MAX(attempts - 1, 0), updated = ? "
+            "WHERE worker = ? AND status = 'running'",
+            (time.time(), worker),
+        )
+        released = cursor.rowcount
+    connection.close()
+    return released
+
+
+def requeue_failed(queue_path, methods=None):
+    """
+    Returns the failed jobs to the queue with reset attempts, e.g. after a network problem was fixed.
+
+    Parameters
+    ----------
+    queue_path: str
+        Path of the SQLite database.
+
+    methods: list, Optional
+        Only the jobs of these methods are returned to the queue. Default are all methods.
+
+    Returns
+    -------
+    int
+        Number of returned jobs.
+    """
+
+    method_filter = f" AND method IN ({','.join('?' * len(methods))})" if methods else ""
+    connection = _connect(queue_path)
+    with connection:
+        cursor = connection.execute(
+            "UPDATE jobs SET status = 'pending', attempts = 0, lease_until = NULL, updated = ? "
+            f"WHERE status = 'failed'{method_filter}",
+            [time.time()] + list(methods or []),
+        )
+        returned = cursor.rowcount
+    connection.close()
+    return returned
+
+
+def queue_status(queue_path):
+    """
+    Counts the jobs of every method by status.
+
+    Parameters
+    ----------
+    queue_path: str
+        Path of the SQLite database.
+
+    Returns
+    -------
+    dict
+        Maps every method to a dict with the number of jobs of every status in ``STATUSES``
+        and the number of running jobs with an expired lease ("expired").
+    """
+
+    connection = _connect(queue_path)
+    rows = connection.execute(
+        "SELECT method, status, COUNT(*), SUM(status = 'running' AND lease_until < ?) FROM jobs GROUP BY method, status",
+        (time.time(),),
+    ).fetchall()
+    connection.close()
+    status = {}
+    for method, job_status, count, expired in rows:
+        counts = status.setdefault(method, dict.fromkeys(STATUSES + ["expired"], 0))
+        counts[job_status] = count
+        counts["expired"] += expired or 0
+    return status
+
+
+def export_results(queue_path, output_path, methods=None):
+    """
+    Writes the recorded results of the finished and the failed jobs as headerless csv file like ``run_alignments``.
+
+    Parameters
+    ----------
+    queue_path: str
+        Path of the SQLite database.
+
+    output_path: str
+        Path of the csv file.
+
+    methods: list, Optional
+        Only the results of these methods are written. Default are all methods.
+
+    Returns
+    -------
+    int
+        Number of written results.
+    """
+
+    method_filter = f" AND method IN ({','.join('?' * len(methods))})" if methods else ""
+    connection = _connect(queue_path)
+    rows = connection.execute(
+        f"SELECT result FROM jobs WHERE status IN ('done', 'failed') AND result IS NOT NULL{method_filter} ORDER BY id",
+        list(methods or []),
+    ).fetchall()
+    connection.close()
+    with open(str(output_path), "w", newline="") as f:
+        writer = csv.writer(f)
+        # missing values are written as empty fields like by pandas
+        writer.writerows(
+            [["" if value is None or value != value else value for value in json.loads(row)] for (row,) in rows]
+        )
+    return len(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Creates and inspects the work queue of the alignment jobs.")
+    parser.add_argument("queue", help="path of the SQLite database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    create = subparsers.add_parser("create", help="add the jobs of one or two sample sets")
+    create.add_argument("methods", nargs="+", help="methods, e.g. the OpenCADD methods, pymol or matchmaker")
+    create.add_argument("--samples", nargs="+", required=True, help="one sample set (in-group) or two (between groups)")
+    create.add_argument("--chain-index", help="chain index, to claim the largest jobs first")
+    subparsers.add_parser("status", help="count the jobs of every method by status")
+    requeue = subparsers.add_parser("requeue", help="return the failed jobs to the queue")
+    requeue.add_argument("--methods", nargs="+")
+    export = subparsers.add_parser("export", help="write the recorded results as csv file")
+    export.add_argument("output")
+    export.add_argument("--methods", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        from scheduling import create_jobs, estimate_job_costs
+        from structure_utils import read_chain_index, read_samples
+
+        samples = [read_samples(path) for path in args.samples]
+        jobs = create_jobs(args.methods, samples[0], samples[1] if len(samples) > 1 else None)
+        chain_index = read_chain_index(args.chain_index) if args.chain_index else None
+        print(f"added {create_queue(args.queue, jobs, estimate_job_costs(jobs, chain_index))} jobs")
+    elif args.command == "status":
+        for method, counts in queue_status(args.queue).items():
+            print(method, " ".join(f"{key}={value}" for key, value in counts.items()))
+    elif args.command == "requeue":
+        print(f"returned {requeue_failed(args.queue, args.methods)} jobs")
+    else:
+        print(f"wrote {export_results(args.queue, args.output, args.methods)} results")